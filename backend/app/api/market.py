@@ -1,11 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import text
+from typing import List, Optional, Union
 from datetime import datetime, timedelta
 from app.core.database import get_db
 from app.models.market import MarketData, OrderBook, SymbolInfo, MarketTicker
-from app.schemas.market import KLineData, OrderBookData, MarketTickerData, SimpleKLineData, SimpleMarketSummary, MarketSummary, SimpleSymbolData, SimpleOrderBookEntry
+from app.schemas.market import KLineData, KLineDelta, KLineBatch, IndicatorData, FactorCrossSection, CorrelationData, OrderBookData, OrderBookAnalytics, OrderBookReplay, MarketTickerData, SimpleKLineData, SimpleMarketSummary, MarketSummary, SimpleSymbolData, SimpleOrderBookEntry
 from app.services.market_service import MarketService
+from app.services.indicators import parse_indicator_specs, spec_key, warmup_bars
+from app.services.indicator_cache import indicator_cache
+from app.services.correlation_engine import correlation_cache
+from app.services.event_bus import market_event_bus
+from app.services.indicator_state import STATE_CLASSES, indicator_state_store
+from app.services.single_flight import in_session, market_reads
 import json
 import os
 
@@ -18,6 +26,39 @@ data_logger = get_data_logger_instance()
 
 router = APIRouter()
 
+async def track_realtime_indicators(tasks, symbols, specs):
+    """
+    为实时任务中的交易对跟踪增量指标：新加入的指标用数据库中的已收盘K线预热，
+    之后随事件总线上的收盘K线逐根递推
+
+    Args:
+        tasks: 实时任务状态列表
+        symbols: 请求的交易对
+        specs: 规范化的指标参数列表
+
+    Returns:
+        交易对 -> 已跟踪的指标
+    """
+    wanted = {s.upper() for s in symbols}
+    tracked = {}
+    for task in tasks:
+        for symbol in task["symbols"]:
+            if symbol.upper() not in wanted:
+                continue
+            period = task["period"]
+            missing = indicator_state_store.missing_specs(symbol, period, specs)
+            if missing:
+                all_specs = indicator_state_store.tracked_specs(symbol, period) + missing
+                bars = await run_in_threadpool(
+                    in_session(MarketService.get_closed_bars),
+                    symbol=symbol,
+                    period=period,
+                    limit=warmup_bars(all_specs) + 1
+                )
+                indicator_state_store.rebuild(symbol, period, all_specs, bars)
+            tracked[symbol] = [spec_key(spec) for spec in indicator_state_store.tracked_specs(symbol, period)]
+    return tracked
+
 def check_data_sufficiency(summary_data, time_range="24h"):
     """检查数据是否充足"""
     total_symbols = summary_data.get('total_symbols', 0)
@@ -68,15 +109,8 @@ async def get_market_summary(
     try:
         app_logger.info(f"获取市场摘要数据 - 开始处理请求: market_type={market_type}, time_range={time_range}")
         
-        def get_or_fetch_market_data():
+        def get_or_fetch_market_data(summary_data):
             """获取市场数据，如果数据不足则触发实时获取"""
-            # 第一次尝试获取摘要数据
-            summary_data = MarketService.get_market_summary(
-                db=db,
-                market_type=market_type,
-                time_range=time_range
-            )
-            
             # 检查数据是否充足
             if check_data_sufficiency(summary_data, time_range):
                 return summary_data
@@ -277,10 +311,19 @@ async def get_market_summary(
                 app_logger.warning("没有找到活跃的交易对，无法获取实时数据")
                 return summary_data
         
+        # 第一次尝试获取摘要数据（并发的相同请求共享一次查询）
+        summary_data = await market_reads.do(
+            ("summary", market_type, time_range),
+            in_session(MarketService.get_market_summary),
+            market_type=market_type,
+            time_range=time_range
+        )
+        
         # 调用数据获取逻辑
-        summary_data = get_or_fetch_market_data()
+        summary_data = get_or_fetch_market_data(summary_data)
         
         app_logger.info(f"获取市场摘要数据 - 处理完成: total_symbols={summary_data.get('total_symbols', 0)}, total_volume={summary_data.get('total_volume', 0)}")
+        return summary_data
         
     except Exception as e:
         app_logger.error(f"获取市场摘要失败: {str(e)}", exc_info=True)
@@ -313,14 +356,64 @@ async def get_market_summary(
         
         return MarketSummary(**error_summary)
 
-@router.get("/kline/{symbol}", response_model=List[KLineData])
+@router.get("/kline/batch", response_model=KLineBatch)
+async def get_kline_batch(
+    symbols: List[str] = Query(..., description="交易对符号列表，多个用逗号分隔"),
+    period: str = Query("1m", description="K线周期: 1m,5m,15m,1h,4h,1d,1w"),
+    start_time: Optional[datetime] = Query(None, description="开始时间"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    limit: int = Query(200, description="每个交易对的数据条数限制", ge=1, le=2000),
+    db: Session = Depends(get_db)
+):
+    """
+    批量获取多个交易对的K线数据（用于多图表看板）
+    
+    Args:
+        symbols: 交易对符号列表
+        period: K线周期
+        start_time: 开始时间
+        end_time: 结束时间
+        limit: 每个交易对的数据条数限制
+    
+    Returns:
+        按交易对分组的列式K线数据
+    """
+    try:
+        # 兼容 symbols=A,B,C 与 symbols=A&symbols=B 两种传参方式
+        symbols = [s.strip() for item in symbols for s in item.split(",") if s.strip()]
+        if not symbols:
+            raise HTTPException(status_code=400, detail="交易对列表不能为空")
+        if len(symbols) > 100:
+            raise HTTPException(status_code=400, detail="单次最多查询100个交易对")
+        
+        app_logger.info(f"批量获取K线数据 - 开始处理请求: symbols={len(symbols)}个, period={period}, limit={limit}")
+        
+        batch = MarketService.get_kline_batch(
+            db=db,
+            symbols=symbols,
+            period=period,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit
+        )
+        
+        app_logger.info(f"批量获取K线数据 - 处理成功: 返回交易对数量={len(batch.data)}")
+        return batch
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"批量获取K线数据失败 - symbols={symbols}")
+        raise HTTPException(status_code=500, detail=f"批量获取K线数据失败: {str(e)}")
+
+@router.get("/kline/{symbol}", response_model=Union[List[KLineData], KLineDelta])
 async def get_kline_data(
     symbol: str,
     period: str = Query("1m", description="K线周期: 1m,5m,15m,1h,4h,1d,1w"),
     start_time: Optional[datetime] = Query(None, description="开始时间"),
     end_time: Optional[datetime] = Query(None, description="结束时间"),
     limit: int = Query(1000, description="数据条数限制", ge=1, le=10000),
-    db: Session = Depends(get_db)
+    since: Optional[datetime] = Query(None, description="增量水位: 客户端持有的最后一根K线时间，指定后只返回增量数据")
 ):
     """
     获取K线数据
@@ -331,12 +424,29 @@ async def get_kline_data(
         start_time: 开始时间
         end_time: 结束时间
         limit: 数据条数限制
+        since: 增量水位（可选），指定时返回列式紧凑格式的增量K线
     
     Returns:
-        K线数据列表
+        K线数据列表，或指定since时的增量K线
     """
     try:
-        app_logger.info(f"获取K线数据 - 开始处理请求: symbol={symbol}, period={period}, limit={limit}")
+        app_logger.info(f"获取K线数据 - 开始处理请求: symbol={symbol}, period={period}, limit={limit}, since={since}")
+        
+        if since is not None:
+            # 增量刷新：只返回水位之后的新K线及最后一根K线的修订
+            delta = await market_reads.do(
+                ("kline_delta", symbol, period, since, limit),
+                in_session(MarketService.get_kline_delta),
+                symbol=symbol,
+                period=period,
+                since=since,
+                limit=limit
+            )
+            app_logger.info(f"获取K线数据 - 增量处理成功: symbol={symbol}, 返回数据条数={len(delta.t)}")
+            return delta
+        
+        # 合并键使用客户端原始参数，默认时间范围的并发请求视为相同请求
+        request_key = ("kline", symbol, period, start_time, end_time, limit)
         
         # 设置默认时间范围
         if not end_time:
@@ -345,8 +455,9 @@ async def get_kline_data(
             start_time = end_time - timedelta(days=7)
         
         # 获取K线数据
-        kline_data = MarketService.get_kline_data(
-            db=db,
+        kline_data = await market_reads.do(
+            request_key,
+            in_session(MarketService.get_kline_data),
             symbol=symbol,
             period=period,
             start_time=start_time,
@@ -366,6 +477,255 @@ async def get_kline_data(
         log_exception(e, f"获取K线数据失败 - symbol={symbol}")
         raise HTTPException(status_code=500, detail=f"获取K线数据失败: {str(e)}")
 
+@router.get("/indicators/{symbol}", response_model=IndicatorData)
+async def get_indicators(
+    symbol: str,
+    indicators: str = Query("ma:5,ma:10,ma:20,macd,rsi,kdj,boll",
+                            description="指标列表，逗号分隔，每项为 名称[:参数...]: ma/ema/macd/rsi/kdj/boll/atr/obv"),
+    period: str = Query("1m", description="K线周期: 1m,5m,15m,1h,4h,1d,1w"),
+    start_time: Optional[datetime] = Query(None, description="开始时间"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    limit: int = Query(1000, description="数据条数限制", ge=1, le=10000)
+):
+    """
+    获取技术指标（与相同参数的K线接口逐根对齐）
+    
+    Args:
+        symbol: 交易对符号
+        indicators: 指标列表
+        period: K线周期
+        start_time: 开始时间
+        end_time: 结束时间
+        limit: 数据条数限制
+    
+    Returns:
+        技术指标序列
+    """
+    try:
+        app_logger.info(f"获取技术指标 - 开始处理请求: symbol={symbol}, period={period}, indicators={indicators}")
+        
+        try:
+            specs = parse_indicator_specs(indicators)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not specs:
+            raise HTTPException(status_code=400, detail="指标列表不能为空")
+        
+        request_key = ("indicators", symbol, period, tuple(specs), start_time, end_time, limit)
+        
+        # 与K线接口相同的默认时间范围
+        if not end_time:
+            end_time = datetime.utcnow()
+        if not start_time:
+            start_time = end_time - timedelta(days=7)
+        
+        result = await market_reads.do(
+            request_key,
+            in_session(MarketService.get_indicators),
+            symbol=symbol,
+            specs=specs,
+            period=period,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit
+        )
+        
+        app_logger.info(f"获取技术指标 - 处理成功: symbol={symbol}, K线数={len(result.t)}, 预热K线数={result.warmup}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"获取技术指标失败 - symbol={symbol}")
+        raise HTTPException(status_code=500, detail=f"获取技术指标失败: {str(e)}")
+
+@router.get("/indicators/{symbol}/live")
+async def get_live_indicators(
+    symbol: str,
+    period: str = Query("1m", description="K线周期")
+):
+    """
+    获取实时任务增量跟踪的指标在最近一根已收盘K线上的值（通过 /realtime/start 的 indicators 参数开始跟踪）
+    
+    Args:
+        symbol: 交易对符号
+        period: K线周期
+    
+    Returns:
+        指标规范字符串 -> 输出值
+    """
+    try:
+        values = indicator_state_store.latest(symbol, period)
+        if values is None:
+            raise HTTPException(status_code=404, detail=f"未跟踪 {symbol} {period} 的增量指标")
+        
+        # 预热不足时指标值为NaN，转为null
+        return {
+            "symbol": symbol,
+            "period": period,
+            "indicators": {
+                key: {name: (value if value == value else None) for name, value in outputs.items()}
+                for key, outputs in values.items()
+            }
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"获取增量指标失败 - symbol={symbol}")
+        raise HTTPException(status_code=500, detail=f"获取增量指标失败: {str(e)}")
+
+@router.post("/factors/compute")
+async def compute_factors(
+    factors: str = Query("momentum:20,reversal:5,volatility:20,turnover:20",
+                         description="因子列表，逗号分隔，每项为 名称[:参数...]: momentum/reversal/volatility/turnover"),
+    symbols: Optional[List[str]] = Query(None, description="股票池（可选），默认为全部A股"),
+    start_date: Optional[datetime] = Query(None, description="第一个输出交易日，默认为30天前"),
+    end_date: Optional[datetime] = Query(None, description="最后一个输出交易日，默认为今天"),
+    neutralize: bool = Query(True, description="是否行业中性化"),
+    standardize: Optional[str] = Query("zscore", description="标准化方法: zscore/rank"),
+    db: Session = Depends(get_db)
+):
+    """
+    计算日频截面因子并保存
+    
+    Args:
+        factors: 因子列表
+        symbols: 股票池
+        start_date: 开始日期
+        end_date: 结束日期
+        neutralize: 是否行业中性化
+        standardize: 标准化方法
+    
+    Returns:
+        计算摘要
+    """
+    try:
+        app_logger.info(f"计算截面因子 - 开始处理请求: factors={factors}, symbols={len(symbols) if symbols else 'all'}")
+        
+        try:
+            result = await run_in_threadpool(
+                MarketService.compute_factors,
+                db=db,
+                factors=factors,
+                symbols=symbols,
+                start_date=start_date,
+                end_date=end_date,
+                neutralize=neutralize,
+                standardize=standardize
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        app_logger.info(f"计算截面因子 - 处理成功: 交易对数={result['symbols']}, 交易日数={result['dates']}, 写入行数={result['rows']}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"计算截面因子失败 - factors={factors}")
+        raise HTTPException(status_code=500, detail=f"计算截面因子失败: {str(e)}")
+
+@router.get("/factors/{factor}", response_model=FactorCrossSection)
+async def get_factor_values(
+    factor: str,
+    trade_date: Optional[datetime] = Query(None, description="交易日，默认为最新"),
+    symbols: Optional[List[str]] = Query(None, description="只返回这些交易对（可选）"),
+    limit: int = Query(100, description="返回条数", ge=1, le=10000),
+    ascending: bool = Query(False, description="是否按因子值升序")
+):
+    """
+    查询因子截面（已保存的日频因子值）
+    
+    Args:
+        factor: 因子，如 momentum:20
+        trade_date: 交易日
+        symbols: 交易对过滤
+        limit: 返回条数
+        ascending: 排序方向
+    
+    Returns:
+        因子截面
+    """
+    try:
+        app_logger.info(f"查询因子截面 - 开始处理请求: factor={factor}, trade_date={trade_date}")
+        
+        request_key = ("factors", factor, trade_date, tuple(symbols or ()), limit, ascending)
+        try:
+            result = await market_reads.do(
+                request_key,
+                in_session(MarketService.get_factor_values),
+                factor=factor,
+                trade_date=trade_date,
+                symbols=symbols,
+                limit=limit,
+                ascending=ascending
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        app_logger.info(f"查询因子截面 - 处理成功: factor={result.factor}, trade_date={result.trade_date}, 条数={result.count}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"查询因子截面失败 - factor={factor}")
+        raise HTTPException(status_code=500, detail=f"查询因子截面失败: {str(e)}")
+
+@router.get("/correlation", response_model=CorrelationData)
+async def get_correlation(
+    symbols: List[str] = Query(..., description="股票池，可重复传参或用逗号分隔"),
+    benchmark: Optional[str] = Query("000300.SH", description="基准代码，为空时不计算贝塔"),
+    window: int = Query(60, description="窗口长度（收益率个数）", ge=2, le=1000),
+    period: str = Query("1d", description="K线周期: 1m,5m,15m,1h,4h,1d"),
+    end_date: Optional[datetime] = Query(None, description="结束时间，默认为最新"),
+    history: int = Query(0, description="额外返回最近多少个时间点的滚动贝塔", ge=0, le=1000)
+):
+    """
+    获取滚动协方差、相关系数和贝塔
+    
+    Args:
+        symbols: 股票池
+        benchmark: 基准代码
+        window: 窗口长度
+        period: K线周期
+        end_date: 结束时间
+        history: 滚动贝塔序列长度
+    
+    Returns:
+        相关性数据
+    """
+    try:
+        symbols = [s.strip() for item in symbols for s in item.split(",") if s.strip()]
+        app_logger.info(f"获取滚动相关性 - 开始处理请求: symbols={len(symbols)}, benchmark={benchmark}, window={window}")
+        
+        if not symbols:
+            raise HTTPException(status_code=400, detail="股票池不能为空")
+        if len(symbols) > 1000:
+            raise HTTPException(status_code=400, detail="股票池最多1000个交易对")
+        
+        request_key = ("correlation", tuple(symbols), benchmark, window, period, end_date, history)
+        result = await market_reads.do(
+            request_key,
+            in_session(MarketService.get_correlation),
+            symbols=symbols,
+            benchmark=benchmark or None,
+            window=window,
+            period=period,
+            end_date=end_date,
+            history=history
+        )
+        
+        app_logger.info(f"获取滚动相关性 - 处理成功: symbols={len(result.symbols)}, end_date={result.end_date}")
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"获取滚动相关性失败 - symbols={symbols}")
+        raise HTTPException(status_code=500, detail=f"获取滚动相关性失败: {str(e)}")
+
 def generate_sample_kline_data() -> List[KLineData]:
     """
     生成示例K线数据（当数据库中没有数据时使用）
@@ -554,11 +914,141 @@ async def get_simple_order_book(
 
 # ... existing code ...
 
+def _parse_number_list(values: Optional[str], cast, name: str) -> list:
+    """解析逗号分隔的数值参数"""
+    if not values:
+        return []
+    try:
+        return [cast(v) for v in values.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"参数格式错误: {name}={values}")
+
+@router.get("/orderbook/analytics", response_model=List[OrderBookAnalytics])
+async def get_order_book_analytics_batch(
+    symbols: Optional[List[str]] = Query(None, description="交易对符号列表，多个用逗号分隔；为空时分析所有内存盘口"),
+    depth: int = Query(20, description="参与计算的档数", ge=1, le=200),
+    levels: Optional[str] = Query("1,5,10", description="失衡计算的档数，多个用逗号分隔"),
+    sizes: Optional[str] = Query(None, description="预估滑点的委托数量，多个用逗号分隔"),
+    db: Session = Depends(get_db)
+):
+    """
+    批量获取盘口微观结构分析（中间价、微观价格、买卖盘失衡、累计深度、预估滑点）
+    
+    Args:
+        symbols: 交易对符号列表
+        depth: 参与计算的档数
+        levels: 失衡计算的档数
+        sizes: 预估滑点的委托数量
+    
+    Returns:
+        盘口分析结果列表
+    """
+    try:
+        if symbols:
+            symbols = [s.strip() for item in symbols for s in item.split(",") if s.strip()]
+            if len(symbols) > 100:
+                raise HTTPException(status_code=400, detail="单次最多查询100个交易对")
+        
+        return MarketService.get_order_book_analytics(
+            db=db,
+            symbols=symbols,
+            depth=depth,
+            imbalance_depths=_parse_number_list(levels, int, "levels") or [1],
+            sizes=_parse_number_list(sizes, float, "sizes")
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"批量获取盘口分析失败 - symbols={symbols}")
+        raise HTTPException(status_code=500, detail=f"批量获取盘口分析失败: {str(e)}")
+
+@router.get("/orderbook/{symbol}/analytics", response_model=OrderBookAnalytics)
+async def get_order_book_analytics(
+    symbol: str,
+    depth: int = Query(20, description="参与计算的档数", ge=1, le=200),
+    levels: Optional[str] = Query("1,5,10", description="失衡计算的档数，多个用逗号分隔"),
+    sizes: Optional[str] = Query(None, description="预估滑点的委托数量，多个用逗号分隔"),
+    db: Session = Depends(get_db)
+):
+    """
+    获取盘口微观结构分析
+    
+    Args:
+        symbol: 交易对符号
+        depth: 参与计算的档数
+        levels: 失衡计算的档数
+        sizes: 预估滑点的委托数量
+    
+    Returns:
+        盘口分析结果
+    """
+    try:
+        results = MarketService.get_order_book_analytics(
+            db=db,
+            symbols=[symbol],
+            depth=depth,
+            imbalance_depths=_parse_number_list(levels, int, "levels") or [1],
+            sizes=_parse_number_list(sizes, float, "sizes")
+        )
+        
+        if not results:
+            app_logger.warning(f"盘口数据不存在: symbol={symbol}")
+            raise HTTPException(status_code=404, detail="盘口数据不存在")
+        
+        return results[0]
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"获取盘口分析失败 - symbol={symbol}")
+        raise HTTPException(status_code=500, detail=f"获取盘口分析失败: {str(e)}")
+
+@router.get("/orderbook/{symbol}/replay", response_model=OrderBookReplay)
+async def replay_order_book(
+    symbol: str,
+    at: datetime = Query(..., description="目标时间"),
+    depth: int = Query(10, description="盘口深度", ge=1, le=500)
+):
+    """
+    回放指定时刻的历史盘口（最近检查点 + 增量日志）
+    
+    Args:
+        symbol: 交易对符号
+        at: 目标时间
+        depth: 盘口深度
+    
+    Returns:
+        历史盘口数据
+    """
+    try:
+        app_logger.info(f"回放历史盘口 - 开始处理请求: symbol={symbol}, at={at}, depth={depth}")
+        
+        order_book = await market_reads.do(
+            ("orderbook_replay", symbol, at, depth),
+            in_session(MarketService.replay_order_book),
+            symbol=symbol,
+            at=at,
+            depth=depth
+        )
+        
+        if not order_book:
+            app_logger.warning(f"历史盘口不存在: symbol={symbol}, at={at}")
+            raise HTTPException(status_code=404, detail="目标时间之前没有盘口检查点")
+        
+        app_logger.info(f"回放历史盘口 - 处理成功: symbol={symbol}, 应用增量={order_book.deltas_applied}")
+        return order_book
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"回放历史盘口失败 - symbol={symbol}")
+        raise HTTPException(status_code=500, detail=f"回放历史盘口失败: {str(e)}")
+
 @router.get("/orderbook/{symbol}", response_model=OrderBookData)
 async def get_order_book(
     symbol: str,
-    depth: int = Query(10, description="盘口深度", ge=1, le=50),
-    db: Session = Depends(get_db)
+    depth: int = Query(10, description="盘口深度", ge=1, le=50)
 ):
     """
     获取盘口数据
@@ -573,8 +1063,14 @@ async def get_order_book(
     try:
         app_logger.info(f"获取盘口数据 - 开始处理请求: symbol={symbol}, depth={depth}")
         
-        order_book = MarketService.get_order_book(
-            db=db,
+        # 优先读取内存盘口（在事件循环中读取，不与增量应用并发），未同步时回退到最新快照
+        order_book = MarketService.get_live_order_book(symbol, depth)
+        if order_book is not None:
+            return order_book
+        
+        order_book = await market_reads.do(
+            ("orderbook", symbol, depth),
+            in_session(MarketService.get_order_book),
             symbol=symbol,
             depth=depth
         )
@@ -814,7 +1310,12 @@ async def update_batch_market_data(
 @router.post("/realtime/start")
 async def start_realtime_update(
     symbols: List[str] = Query(..., description="交易对符号列表，多个用逗号分隔"),
-    update_interval: int = Query(60, description="更新间隔（秒）", ge=10, le=3600),
+    update_interval: int = Query(60, description="交易时段的更新间隔（秒），休市时自动放慢", ge=10, le=3600),
+    data_source: Optional[str] = Query(None, description="数据源: binance/baostock/tushare，默认按代码格式推断"),
+    period: Optional[str] = Query(None, description="K线周期，默认加密货币1m、A股1d"),
+    mode: str = Query("poll", description="任务类型: poll（轮询，binance同周期交易对合并为一个任务）/stream（WebSocket推送，仅binance）"),
+    bar_source: str = Query("kline", description="stream任务的K线来源: kline（交易所推送的K线）/trade（逐笔成交合成K线）"),
+    indicators: Optional[str] = Query(None, description="随收盘K线增量递推的指标，如 ema:12,macd,rsi（支持 ema/macd/rsi/kdj/atr/obv）"),
     db: Session = Depends(get_db)
 ):
     """
@@ -823,21 +1324,40 @@ async def start_realtime_update(
     Args:
         symbols: 交易对符号列表
         update_interval: 更新间隔（秒）
+        data_source: 数据源
+        period: K线周期
+        mode: 任务类型
+        bar_source: K线来源
+        indicators: 增量跟踪的指标列表
     
     Returns:
         实时更新任务状态
     """
     try:
-        app_logger.info(f"启动实时数据更新任务 - 开始处理请求: symbols={symbols}, update_interval={update_interval}s")
+        app_logger.info(f"启动实时数据更新任务 - 开始处理请求: symbols={symbols}, update_interval={update_interval}s, mode={mode}, bar_source={bar_source}")
+        
+        try:
+            specs = parse_indicator_specs(indicators) if indicators else []
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        unsupported = [spec_key(spec) for spec in specs if spec[0] not in STATE_CLASSES]
+        if unsupported:
+            raise HTTPException(status_code=400, detail=f"指标不支持增量计算: {', '.join(unsupported)}")
         
         # 调用MarketService启动实时更新
         result = MarketService.start_realtime_update(
             db=db,
             symbols=symbols,
-            update_interval=update_interval
+            update_interval=update_interval,
+            data_source=data_source,
+            period=period,
+            mode=mode,
+            bar_source=bar_source
         )
         
         if result.get("success"):
+            if specs:
+                result["indicators"] = await track_realtime_indicators(result["tasks"], symbols, specs)
             app_logger.info(f"启动实时数据更新任务 - 处理成功: task_id={result.get('task_id')}")
             return result
         else:
@@ -850,6 +1370,55 @@ async def start_realtime_update(
         log_exception(e, f"启动实时数据更新任务失败 - symbols={symbols}")
         raise HTTPException(status_code=500, detail=f"启动实时更新任务失败: {str(e)}")
 
+@router.post("/realtime/stop")
+async def stop_realtime_update(
+    task_id: Optional[str] = Query(None, description="任务ID（可选）"),
+    symbols: Optional[List[str]] = Query(None, description="交易对符号列表（可选），都不指定时停止全部任务")
+):
+    """
+    停止实时数据更新任务
+    
+    Args:
+        task_id: 任务ID
+        symbols: 交易对符号列表
+    
+    Returns:
+        已停止的任务
+    """
+    try:
+        app_logger.info(f"停止实时数据更新任务 - 开始处理请求: task_id={task_id}, symbols={symbols}")
+        
+        result = MarketService.stop_realtime_update(task_id=task_id, symbols=symbols)
+        
+        if result.get("success"):
+            app_logger.info(f"停止实时数据更新任务 - 处理成功: {result.get('message')}")
+            return result
+        else:
+            raise HTTPException(status_code=404, detail=result.get("message"))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_exception(e, f"停止实时数据更新任务失败 - task_id={task_id}")
+        raise HTTPException(status_code=500, detail=f"停止实时更新任务失败: {str(e)}")
+
+@router.get("/realtime/tasks")
+async def list_realtime_tasks():
+    """
+    列出运行中的实时数据更新任务
+    
+    Returns:
+        任务状态列表（含数据延迟和吞吐）
+    """
+    try:
+        from app.services.realtime_supervisor import realtime_supervisor
+        
+        return realtime_supervisor.list()
+        
+    except Exception as e:
+        log_exception(e, "获取实时更新任务列表失败")
+        raise HTTPException(status_code=500, detail=f"获取实时更新任务列表失败: {str(e)}")
+
 @router.get("/update/status")
 async def get_update_status(
     task_id: Optional[str] = Query(None, description="任务ID（可选）"),
@@ -891,7 +1460,7 @@ async def market_health_check(db: Session = Depends(get_db)):
         app_logger.info("市场数据服务健康检查 - 开始处理请求")
         
         # 检查数据库连接
-        db.execute("SELECT 1")
+        db.execute(text("SELECT 1"))
         
         # 检查数据可用性
         latest_data = db.query(MarketData).order_by(MarketData.timestamp.desc()).first()
@@ -900,7 +1469,12 @@ async def market_health_check(db: Session = Depends(get_db)):
             "status": "healthy",
             "timestamp": datetime.utcnow().isoformat(),
             "data_available": latest_data is not None,
-            "last_update": latest_data.timestamp.isoformat() if latest_data else None
+            "last_update": latest_data.timestamp.isoformat() if latest_data else None,
+            "single_flight": market_reads.stats(),
+            "indicator_cache": indicator_cache.stats(),
+            "correlation_cache": correlation_cache.stats(),
+            "event_bus": market_event_bus.stats(),
+            "indicator_state": indicator_state_store.stats()
         }
         
         app_logger.info(f"市场数据服务健康检查 - 处理成功: data_available={result['data_available']}")
@@ -25,6 +25,21 @@ engine = create_engine(
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 后台批量写入（写后缓冲）使用的引擎：StaticPool 下所有会话共享同一个连接，
+# 请求会话关闭时连接池的回滚会撤销后台写入进行中的事务，因此文件型SQLite为后台写入单独建立连接；
+# 内存数据库只能共享同一个连接
+if DATABASE_URL.startswith("sqlite") and ":memory:" not in DATABASE_URL and DATABASE_URL.rstrip("/") != "sqlite:":
+    writer_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        poolclass=StaticPool,
+        echo=False
+    )
+else:
+    writer_engine = engine
+
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+
 # 创建基类
 Base = declarative_base()
 
@@ -2,14 +2,22 @@
 """
 日志配置模块
 提供统一的日志配置，支持输出到控制台和文件
+日志记录在调用线程中只做过滤和入队，格式化与文件/控制台I/O在后台线程中完成
 """
 
 import os
 import sys
+import json
+import atexit
+import queue
+import random
+import threading
+import time
 import logging
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent.parent
@@ -21,7 +29,7 @@ LOG_DIR = PROJECT_ROOT / "logs"
 if not LOG_DIR.exists():
     LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-# 日志文件路径
+# 启动当天的日志文件路径（运行中跨天后实际写入的文件按日期自动切换，见 DailyRotatingFileHandler）
 LOG_FILE = LOG_DIR / f"app_{datetime.now().strftime('%Y%m%d')}.log"
 ERROR_LOG_FILE = LOG_DIR / f"error_{datetime.now().strftime('%Y%m%d')}.log"
 DATA_LOG_FILE = LOG_DIR / f"data_{datetime.now().strftime('%Y%m%d')}.log"
@@ -32,9 +40,245 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d]
 CONSOLE_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+# 是否输出结构化JSON日志（文件处理器）
+LOG_JSON = os.getenv("LOG_JSON", "0").lower() in ("1", "true", "yes")
+
+# 日志队列容量，队列满时丢弃新日志而不是阻塞业务线程
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# 重复日志限流：同一位置的同一消息模板在时间窗口内最多输出的条数
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "60"))
+LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "20"))
+
+# LogRecord的标准属性，其余属性视为通过 extra 传入的结构化字段
+_RESERVED_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化JSON日志格式化器，每条日志输出为一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "logger": record.name,
+            "level": record.levelname,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DailyRotatingFileHandler(RotatingFileHandler):
+    """
+    按日期命名并在运行时跨天切换的日志文件处理器
+    文件名为 {prefix}_{YYYYMMDD}.log，同一天内超过大小限制时按 RotatingFileHandler 的方式轮转
+    """
+
+    def __init__(self, log_dir: Path, prefix: str, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, encoding: str = "utf-8"):
+        self.log_dir = Path(log_dir)
+        self.prefix = prefix
+        self._current_date = datetime.now().strftime("%Y%m%d")
+        if not self.log_dir.exists():
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        super().__init__(
+            self._path_for(self._current_date),
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding=encoding,
+            delay=True
+        )
+
+    def _path_for(self, date: str) -> str:
+        return str(self.log_dir / f"{self.prefix}_{date}.log")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        date = datetime.fromtimestamp(record.created).strftime("%Y%m%d")
+        if date != self._current_date:
+            # 跨天后关闭旧文件，下一次写入时打开新日期的文件
+            self._current_date = date
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = os.path.abspath(self._path_for(date))
+        super().emit(record)
+
+
+class SamplingFilter(logging.Filter):
+    """按比例采样低于WARNING级别的日志，WARNING及以上级别始终保留"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    重复日志限流
+    以 (日志器, 级别, 代码位置, 消息模板) 为键，每个时间窗口内最多放行 burst 条，
+    新窗口的第一条日志会附带上一窗口被抑制的条数
+    """
+
+    def __init__(self, interval: float = LOG_RATE_LIMIT_INTERVAL, burst: int = LOG_RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # 键 -> [窗口开始时间, 窗口内已放行条数, 窗口内被抑制条数]
+        self._windows: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno, str(record.msg)[:200])
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = int(window[2]) if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    self._evict(now)
+                if suppressed and isinstance(record.msg, str):
+                    record.msg = f"{record.msg} (上一周期内有{suppressed}条相同日志被抑制)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _evict(self, now: float) -> None:
+        """清理已过期且没有被抑制日志的窗口"""
+        for key in [key for key, window in self._windows.items()
+                    if now - window[0] >= self.interval and not window[2]]:
+            del self._windows[key]
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """入队日志的处理器，队列满时丢弃并计数"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用线程中合并消息参数并渲染异常堆栈（异常对象不能跨线程安全引用），
+        # 保留原始级别、位置和 extra 字段，最终格式由后台线程中的处理器决定
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _LoggerRouter(logging.Handler):
+    """后台线程中按日志器名称把日志分发给各自的处理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.routes: Dict[str, List[logging.Handler]] = {}
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.handle(record)
+
+
+class AsyncLogPipeline:
+    """异步日志管道：所有日志器共享一个队列和一个后台写入线程"""
+
+    def __init__(self, maxsize: int = LOG_QUEUE_SIZE):
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.router = _LoggerRouter()
+        self.listener = QueueListener(self.queue, self.router)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def attach(self, logger: logging.Logger, handlers: List[logging.Handler],
+               filters: Optional[List[logging.Filter]] = None) -> None:
+        """
+        将日志器接入管道
+
+        Args:
+            logger: 日志器
+            handlers: 在后台线程中执行的实际处理器
+            filters: 在调用线程中执行的过滤器（采样、限流等）
+        """
+        self.router.routes[logger.name] = handlers
+        queue_handler = _NonBlockingQueueHandler(self.queue)
+        for log_filter in filters or []:
+            queue_handler.addFilter(log_filter)
+        logger.addHandler(queue_handler)
+        # 日志已由本管道输出，不再向根日志器传播，避免重复输出
+        logger.propagate = False
+        self.start()
+
+    def start(self) -> None:
+        with self._lock:
+            if not self._started:
+                self.listener.start()
+                self._started = True
+
+    def stop(self) -> None:
+        """停止后台线程，队列中剩余的日志会先写完"""
+        with self._lock:
+            if self._started:
+                self.listener.stop()
+                self._started = False
+                for handlers in self.router.routes.values():
+                    for handler in handlers:
+                        handler.flush()
+
+    @property
+    def dropped(self) -> int:
+        return _NonBlockingQueueHandler.dropped
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+
+# 全局异步日志管道，进程退出时写完剩余日志
+log_pipeline = AsyncLogPipeline()
+atexit.register(log_pipeline.stop)
+
+
+def _build_filters(sample_rate: float, rate_limit: bool) -> List[logging.Filter]:
+    filters: List[logging.Filter] = []
+    if rate_limit:
+        filters.append(RateLimitFilter())
+    filters.append(SamplingFilter(sample_rate))
+    return filters
+
 
 def setup_logger(name: str = None, log_file: str = None, level: int = logging.INFO, 
-                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5) -> logging.Logger:
+                  max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                  daily_prefix: str = None, json_format: bool = LOG_JSON,
+                  sample_rate: float = 1.0, rate_limit: bool = True) -> logging.Logger:
     """
     设置并返回一个配置好的日志记录器
     
@@ -44,6 +288,10 @@ def setup_logger(name: str = None, log_file: str = None, level: int = logging.IN
         level: 日志级别，默认为INFO
         max_bytes: 单个日志文件最大大小（字节），默认为10MB
         backup_count: 保留的备份文件数量，默认为5个
+        daily_prefix: 按日期命名的日志文件前缀，指定后在 LOG_DIR 下写入 {prefix}_{YYYYMMDD}.log 并在跨天时自动切换
+        json_format: 文件日志是否输出为结构化JSON
+        sample_rate: 低于WARNING级别日志的采样比例
+        rate_limit: 是否对重复日志限流
         
     Returns:
         logging.Logger: 配置好的日志记录器
@@ -57,17 +305,27 @@ def setup_logger(name: str = None, log_file: str = None, level: int = logging.IN
         return logger
     
     # 创建格式化器
-    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    formatter = JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT, DATE_FORMAT)
     console_formatter = logging.Formatter(CONSOLE_FORMAT, DATE_FORMAT)
     
+    handlers: List[logging.Handler] = []
+    
     # 控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # 文件处理器（如果指定了日志文件）
-    if log_file:
+    file_handler = None
+    if daily_prefix:
+        file_handler = DailyRotatingFileHandler(
+            LOG_DIR,
+            daily_prefix,
+            max_bytes=max_bytes,
+            backup_count=backup_count
+        )
+    elif log_file:
         log_path = Path(log_file)
         # 确保日志文件目录存在
         if not log_path.parent.exists():
@@ -80,9 +338,13 @@ def setup_logger(name: str = None, log_file: str = None, level: int = logging.IN
             backupCount=backup_count,
             encoding='utf-8'
         )
+    
+    if file_handler is not None:
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    log_pipeline.attach(logger, handlers, _build_filters(sample_rate, rate_limit))
     
     return logger
 
@@ -91,7 +353,7 @@ def get_default_logger() -> logging.Logger:
     """获取默认的应用日志记录器"""
     return setup_logger(
         name="quant_trading_app",
-        log_file=str(LOG_FILE),
+        daily_prefix="app",
         level=logging.INFO
     )
 
@@ -100,7 +362,7 @@ def get_error_logger() -> logging.Logger:
     """获取错误日志记录器"""
     return setup_logger(
         name="quant_trading_error",
-        log_file=str(ERROR_LOG_FILE),
+        daily_prefix="error",
         level=logging.ERROR
     )
 
@@ -109,7 +371,7 @@ def get_data_logger() -> logging.Logger:
     """获取数据采集日志记录器"""
     return setup_logger(
         name="quant_trading_data",
-        log_file=str(DATA_LOG_FILE),
+        daily_prefix="data",
         level=logging.INFO
     )
 
@@ -118,7 +380,7 @@ def get_api_logger() -> logging.Logger:
     """获取API日志记录器"""
     return setup_logger(
         name="quant_trading_api",
-        log_file=str(API_LOG_FILE),
+        daily_prefix="api",
         level=logging.INFO
     )
 
@@ -148,14 +410,13 @@ def setup_timed_rotating_logger(name: str, log_file: str, when: str = "midnight"
         return logger
     
     # 创建格式化器
-    formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT, DATE_FORMAT)
     console_formatter = logging.Formatter(CONSOLE_FORMAT, DATE_FORMAT)
     
     # 控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(level)
     console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
     
     # 时间轮转文件处理器
     log_path = Path(log_file)
@@ -172,7 +433,8 @@ def setup_timed_rotating_logger(name: str, log_file: str, when: str = "midnight"
     file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
     file_handler.suffix = "%Y%m%d"  # 按日期后缀命名
-    logger.addHandler(file_handler)
+    
+    log_pipeline.attach(logger, [console_handler, file_handler], _build_filters(1.0, True))
     
     return logger
 
@@ -218,6 +480,34 @@ class LogManager:
         
         return self.loggers.get(logger_type, self.loggers["app"])
     
+    def set_sample_rate(self, logger_type: str, rate: float):
+        """设置指定类型日志记录器低于WARNING级别日志的采样比例"""
+        logger = self.get_logger(logger_type)
+        for handler in logger.handlers:
+            for log_filter in handler.filters:
+                if isinstance(log_filter, SamplingFilter):
+                    log_filter.rate = rate
+    
+    def set_rate_limit(self, logger_type: str, interval: float, burst: int):
+        """设置指定类型日志记录器的重复日志限流参数，burst为0时关闭限流"""
+        logger = self.get_logger(logger_type)
+        for handler in logger.handlers:
+            for log_filter in handler.filters:
+                if isinstance(log_filter, RateLimitFilter):
+                    log_filter.interval = interval
+                    log_filter.burst = burst
+    
+    def get_pipeline_stats(self) -> Dict[str, int]:
+        """获取异步日志管道状态"""
+        return {
+            "queue_size": log_pipeline.qsize(),
+            "dropped": log_pipeline.dropped
+        }
+    
+    def shutdown(self):
+        """写完队列中剩余的日志并停止后台线程"""
+        log_pipeline.stop()
+    
     def log_data_collection(self, symbol: str, data_source: str, status: str, 
                            message: str = "", error: Exception = None):
         """记录数据采集日志"""
@@ -312,6 +602,8 @@ if __name__ == "__main__":
     # 测试API日志
     log_manager.log_api_request("GET", "/api/market/symbols", 200, 0.125, "127.0.0.1")
     
+    log_manager.shutdown()
+    
     print(f"\n日志文件位置：")
     print(f"  - 应用日志: {LOG_FILE}")
     print(f"  - 错误日志: {ERROR_LOG_FILE}")
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+运行指标模块
+提供进程内的计数器、仪表和直方图，请求计时中间件，以及Prometheus文本格式导出
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prometheus文本格式的Content-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默认直方图分桶
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 指标族: (名称, 类型, 说明, [(标签, 数值)])
+MetricFamily = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    """转义Prometheus标签值"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """格式化标签集合"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    """格式化样本数值"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """带标签指标的基类"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels_dict(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self._labels_dict(key))} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labelvalues) -> None:
+        self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1.0) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self._labels_dict(key))} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """固定分桶直方图"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合: [各分桶计数..., +Inf计数, 总和]
+        self._values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[labelvalues] = state
+            state[idx] += 1
+            state[-1] += value
+
+    def snapshot(self, *labelvalues) -> Optional[Dict[str, float]]:
+        """获取某个标签组合的计数和总和"""
+        state = self._values.get(labelvalues)
+        if state is None:
+            return None
+        count = sum(state[:-1])
+        return {"count": count, "sum": state[-1], "avg": state[-1] / count if count else 0.0}
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, state in list(self._values.items()):
+            labels = self._labels_dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """获取或创建计数器"""
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """获取或创建仪表"""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """获取或创建直方图"""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """注册采集时回调，用于导出由其他组件自行维护的统计数据"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """导出Prometheus文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+
+        for collector in list(self._collectors):
+            for name, type_name, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+
+
+class _QueryCounter:
+    """单个请求内的数据库查询计数"""
+
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+# 当前请求的查询计数（线程池中执行的同步代码会继承该上下文）
+_current_queries: ContextVar[Optional[_QueryCounter]] = ContextVar("current_queries", default=None)
+
+db_queries_total = metrics_registry.counter(
+    "db_queries_total", "数据库语句执行总数"
+)
+
+
+def instrument_engine(engine) -> None:
+    """
+    为SQLAlchemy引擎注册查询计数
+
+    Args:
+        engine: SQLAlchemy引擎
+    """
+    from sqlalchemy import event
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_queries_total.inc()
+        counter = _current_queries.get()
+        if counter is not None:
+            counter.count += 1
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class RequestMetricsMiddleware:
+    """
+    请求计时中间件（纯ASGI实现）
+    按路由模板记录请求延迟、响应大小和数据库查询次数直方图，以及进行中的请求数
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = metrics_registry, log_requests: bool = True):
+        """
+        Args:
+            app: 下游ASGI应用
+            registry: 指标注册表
+            log_requests: 是否通过日志管理器记录API请求日志
+        """
+        self.app = app
+        self.log_requests = log_requests
+        self._route_paths: Dict[int, Dict[Callable, str]] = {}
+
+        self.requests_total = registry.counter(
+            "http_requests_total", "HTTP请求总数", ("method", "route", "status")
+        )
+        self.request_duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP请求处理耗时（秒）", ("method", "route")
+        )
+        self.response_size = registry.histogram(
+            "http_response_size_bytes", "HTTP响应体大小（字节）", ("method", "route"), buckets=SIZE_BUCKETS
+        )
+        self.request_db_queries = registry.histogram(
+            "http_request_db_queries", "单个HTTP请求执行的数据库语句数", ("method", "route"), buckets=COUNT_BUCKETS
+        )
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "正在处理的HTTP请求数"
+        )
+
+    def _route_path(self, scope) -> str:
+        """将匹配到的端点映射为路由模板，避免以实际路径作为标签造成高基数"""
+        route = scope.get("route")
+        if route is not None and hasattr(route, "path"):
+            return route.path
+
+        endpoint = scope.get("endpoint")
+        app = scope.get("app")
+        if endpoint is None or app is None:
+            return "unmatched"
+
+        paths = self._route_paths.get(id(app))
+        if paths is None:
+            paths = {
+                route.endpoint: route.path
+                for route in getattr(app, "routes", [])
+                if getattr(route, "endpoint", None) is not None
+            }
+            self._route_paths[id(app)] = paths
+        return paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        body_size = 0
+        queries = _QueryCounter()
+        token = _current_queries.set(queries)
+        self.in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code, body_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            self.in_flight.dec()
+            _current_queries.reset(token)
+
+            method = scope.get("method", "")
+            route = self._route_path(scope)
+            self.requests_total.inc(method, route, str(status_code))
+            self.request_duration.observe(duration, method, route)
+            self.response_size.observe(body_size, method, route)
+            self.request_db_queries.observe(queries.count, method, route)
+
+            if self.log_requests:
+                from app.core.logging_config import log_manager
+                client = scope.get("client")
+                log_manager.log_api_request(
+                    method, scope.get("path", route), status_code, duration, client[0] if client else None
+                )
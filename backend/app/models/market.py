@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, BigInteger, Text
+from sqlalchemy import Column, Integer, String, DateTime, Float, BigInteger, Text, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -30,13 +30,42 @@ class OrderBook(Base):
     id = Column(Integer, primary_key=True, index=True)
     symbol = Column(String(50), index=True, nullable=False, comment="交易对符号")
     timestamp = Column(DateTime, nullable=False, index=True, comment="数据时间戳")
-    bids = Column(Text, nullable=False, comment="买单数据（JSON格式）")
-    asks = Column(Text, nullable=False, comment="卖单数据（JSON格式）")
+    bids = Column(Text, comment="买单数据（JSON格式，旧版快照）")
+    asks = Column(Text, comment="卖单数据（JSON格式，旧版快照）")
+    book_data = Column(LargeBinary, comment="盘口快照（二进制价格/数量数组，见 orderbook_codec）")
     created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
     
     def __repr__(self):
         return f"<OrderBook(symbol={self.symbol}, timestamp={self.timestamp})>"
 
+class OrderBookCheckpoint(Base):
+    """盘口历史检查点表（定期保存完整盘口，用于回放定位）"""
+    __tablename__ = "order_book_checkpoint"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String(50), index=True, nullable=False, comment="交易对符号")
+    timestamp = Column(DateTime, nullable=False, index=True, comment="检查点时间")
+    update_id = Column(BigInteger, nullable=False, comment="检查点对应的最后更新序号")
+    book_data = Column(LargeBinary, nullable=False, comment="完整盘口（二进制价格/数量数组，见 orderbook_codec）")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    
+    def __repr__(self):
+        return f"<OrderBookCheckpoint(symbol={self.symbol}, timestamp={self.timestamp}, update_id={self.update_id})>"
+
+class OrderBookDelta(Base):
+    """盘口增量日志表（数量为0表示删除该价位）"""
+    __tablename__ = "order_book_delta"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String(50), index=True, nullable=False, comment="交易对符号")
+    timestamp = Column(DateTime, nullable=False, index=True, comment="事件时间")
+    first_update_id = Column(BigInteger, nullable=False, comment="首个更新序号")
+    final_update_id = Column(BigInteger, nullable=False, index=True, comment="最后更新序号")
+    delta_data = Column(LargeBinary, nullable=False, comment="变更档位（二进制价格/数量数组，见 orderbook_codec）")
+    
+    def __repr__(self):
+        return f"<OrderBookDelta(symbol={self.symbol}, timestamp={self.timestamp}, final_update_id={self.final_update_id})>"
+
 class SymbolInfo(Base):
     """交易对信息表"""
     __tablename__ = "symbol_info"
@@ -58,6 +87,37 @@ class SymbolInfo(Base):
     def __repr__(self):
         return f"<SymbolInfo(symbol={self.symbol}, name={self.name})>"
 
+class SymbolIndustry(Base):
+    """交易对行业分类表（用于因子行业中性化）"""
+    __tablename__ = "symbol_industry"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String(50), unique=True, nullable=False, comment="交易对符号")
+    industry = Column(String(50), nullable=False, index=True, comment="所属行业")
+    classification = Column(String(20), comment="行业分类标准（如 sw1/citic1）")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+    
+    def __repr__(self):
+        return f"<SymbolIndustry(symbol={self.symbol}, industry={self.industry})>"
+
+class FactorValue(Base):
+    """日频因子值表（截面处理后的因子值）"""
+    __tablename__ = "factor_value"
+    __table_args__ = (
+        Index("idx_factor_date_symbol", "factor", "trade_date", "symbol", unique=True),
+        Index("idx_factor_symbol_date", "factor", "symbol", "trade_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String(50), nullable=False, comment="交易对符号")
+    trade_date = Column(DateTime, nullable=False, comment="交易日")
+    factor = Column(String(50), nullable=False, comment="因子规范名（如 momentum:20:0）")
+    value = Column(Float, nullable=False, comment="因子值")
+    created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
+    
+    def __repr__(self):
+        return f"<FactorValue(factor={self.factor}, symbol={self.symbol}, trade_date={self.trade_date}, value={self.value})>"
+
 class MarketTicker(Base):
     """实时行情数据表"""
     __tablename__ = "market_ticker"
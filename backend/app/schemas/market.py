@@ -18,6 +18,76 @@ class KLineData(BaseModel):
         orm_mode = True
 
 
+class KLineColumns(BaseModel):
+    """K线列式数据模型"""
+    t: List[int] = Field(default_factory=list, description="K线时间戳（毫秒）")
+    o: List[float] = Field(default_factory=list, description="开盘价")
+    h: List[float] = Field(default_factory=list, description="最高价")
+    l: List[float] = Field(default_factory=list, description="最低价")
+    c: List[float] = Field(default_factory=list, description="收盘价")
+    v: List[float] = Field(default_factory=list, description="成交量")
+
+
+class KLineDelta(KLineColumns):
+    """K线增量数据模型（列式紧凑格式）"""
+    symbol: str = Field(..., description="交易对符号")
+    period: str = Field(..., description="K线周期")
+    since: datetime = Field(..., description="客户端提供的水位时间")
+    watermark: Optional[datetime] = Field(None, description="本次返回的最后一根K线时间，作为下次请求的since")
+    version: int = Field(0, description="热存储序列版本号，数据库回源时为0")
+
+
+class KLineBatch(BaseModel):
+    """多交易对K线批量数据模型"""
+    period: str = Field(..., description="K线周期")
+    start_time: datetime
+    end_time: datetime
+    limit: int = Field(..., description="每个交易对的数据条数限制")
+    data: Dict[str, KLineColumns] = Field(default_factory=dict, description="按交易对分组的列式K线")
+
+
+class IndicatorData(BaseModel):
+    """技术指标数据模型（与K线接口返回的K线逐根对齐）"""
+    symbol: str = Field(..., description="交易对符号")
+    period: str = Field(..., description="K线周期")
+    t: List[int] = Field(default_factory=list, description="K线时间戳（毫秒）")
+    warmup: int = Field(0, description="本次读取的前置预热K线数（不在返回序列中，指标全部命中缓存时为0）")
+    indicators: Dict[str, Dict[str, List[Optional[float]]]] = Field(
+        default_factory=dict, description="指标规范名（如 macd:12:26:9）-> 输出名 -> 序列，数据不足的位置为null"
+    )
+
+
+class FactorValueItem(BaseModel):
+    """单个交易对的因子值"""
+    symbol: str = Field(..., description="交易对符号")
+    value: float = Field(..., description="因子值")
+    rank: int = Field(..., description="按排序方向的名次（从1开始）")
+
+
+class FactorCrossSection(BaseModel):
+    """某个交易日的因子截面"""
+    factor: str = Field(..., description="因子规范名")
+    trade_date: Optional[datetime] = Field(None, description="交易日，没有因子数据时为null")
+    count: int = Field(0, description="返回的交易对数")
+    values: List[FactorValueItem] = Field(default_factory=list, description="按因子值排序的交易对")
+
+
+class CorrelationData(BaseModel):
+    """滚动协方差/相关系数/贝塔"""
+    symbols: List[str] = Field(..., description="股票池，矩阵行列顺序与之一致")
+    benchmark: Optional[str] = Field(None, description="基准代码，基准没有数据时为null")
+    window: int = Field(..., description="窗口长度（收益率个数）")
+    period: str = Field(..., description="K线周期")
+    end_date: Optional[datetime] = Field(None, description="窗口最后一个时间点")
+    observations: List[int] = Field(default_factory=list, description="各交易对窗口内的有效收益率个数")
+    covariance: List[List[Optional[float]]] = Field(default_factory=list, description="协方差矩阵（成对样本）")
+    correlation: List[List[Optional[float]]] = Field(default_factory=list, description="相关系数矩阵")
+    beta: Dict[str, Optional[float]] = Field(default_factory=dict, description="相对基准的贝塔")
+    benchmark_correlation: Dict[str, Optional[float]] = Field(default_factory=dict, description="与基准的相关系数")
+    dates: List[int] = Field(default_factory=list, description="贝塔序列的时间戳（毫秒）")
+    beta_history: Dict[str, List[Optional[float]]] = Field(default_factory=dict, description="最近 history 个时间点的滚动贝塔")
+
+
 class OrderBookEntry(BaseModel):
     """盘口条目模型"""
     price: float
@@ -36,6 +106,38 @@ class OrderBookData(BaseModel):
         orm_mode = True
 
 
+class OrderBookReplay(OrderBookData):
+    """历史盘口回放模型"""
+    update_id: int = Field(..., description="重建后盘口的最后更新序号")
+    checkpoint_time: datetime = Field(..., description="回放起点检查点时间")
+    deltas_applied: int = Field(..., description="应用的增量条数")
+    complete: bool = Field(..., description="增量日志是否连续覆盖到目标时间")
+
+
+class OrderBookFill(BaseModel):
+    """市价委托预估成交模型"""
+    side: str = Field(..., description="方向: buy/sell")
+    size: float = Field(..., description="委托数量")
+    vwap: Optional[float] = Field(None, description="预估成交均价")
+    filled: float = Field(..., description="当前深度内可成交数量")
+    slippage_bps: Optional[float] = Field(None, description="相对中间价的滑点（基点）")
+
+
+class OrderBookAnalytics(BaseModel):
+    """盘口微观结构分析模型"""
+    symbol: str = Field(..., description="交易对符号")
+    timestamp: Optional[datetime] = None
+    best_bid: Optional[float] = None
+    best_ask: Optional[float] = None
+    spread: Optional[float] = None
+    mid_price: Optional[float] = Field(None, description="中间价")
+    micro_price: Optional[float] = Field(None, description="微观价格（按一档数量加权）")
+    imbalance: Dict[str, Optional[float]] = Field(..., description="前N档买卖盘失衡，键为档数")
+    bid_depth: List[float] = Field(..., description="买盘累计深度曲线")
+    ask_depth: List[float] = Field(..., description="卖盘累计深度曲线")
+    fills: List[OrderBookFill] = Field(default_factory=list, description="各委托数量的预估成交")
+
+
 class MarketTickerData(BaseModel):
     """行情数据模型"""
     symbol: str = Field(..., description="交易对符号")
@@ -0,0 +1,464 @@
+"""
+向量化回测
+输入与K线逐根对齐的目标仓位（占权益的比例，正为多、负为空、0为空仓），第 t 根K线收盘后产生的信号
+在第 t+1 根K线成交（开盘价或收盘价），不使用未来数据。
+只在目标仓位变化时成交，两次成交之间持仓数量不变；每次成交后的持仓市值等于目标仓位 × 成交后权益，
+成交前后的权益比值只取决于相邻两次成交的价格和仓位，因此全部成交、资金曲线和统计指标都用数组运算得到，
+不在Python层逐根K线循环
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.market import MarketData
+from app.models.strategy import BacktestResult, TradeRecord
+from app.services.rolling import drawdown
+
+# K线列: t 为 datetime64[ms]，其余为 float64
+Bars = Dict[str, np.ndarray]
+
+# 目标仓位: 与K线等长的数组，或根据K线列计算目标仓位的函数
+Signals = Union[np.ndarray, Callable[[Bars], np.ndarray]]
+
+# 回测结果表中资金曲线最多保存的点数
+MAX_CURVE_POINTS = 5000
+
+FILL_PRICES = ("open", "close")
+
+
+@dataclass
+class BacktestOutput:
+    """回测结果：逐K线序列、成交明细、往返交易和统计指标"""
+    timestamps: np.ndarray
+    # 每根K线收盘时的权益、回撤（<= 0）和持仓的目标仓位
+    equity: np.ndarray
+    drawdown: np.ndarray
+    positions: np.ndarray
+    # 成交明细（每次仓位变化一条），各列等长；事件驱动回测另有 order_type 列
+    fills: Dict[str, np.ndarray] = field(default_factory=dict)
+    # 往返交易（开仓到平仓或反手，期末未平仓的按最后收盘价计），各列等长
+    trades: Dict[str, np.ndarray] = field(default_factory=dict)
+    # 与 BacktestResult 同名的指标
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    statistics: Dict[str, Any] = field(default_factory=dict)
+
+
+def load_bars(db: Session, symbol: str, period: str = "1d",
+              start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Bars:
+    """
+    读取单个交易对的K线列
+
+    Args:
+        db: 数据库会话
+        symbol: 交易对符号
+        period: K线周期
+        start_date: 开始时间
+        end_date: 结束时间
+
+    Returns:
+        t/open/high/low/close/volume 列，按时间升序
+    """
+    query = db.query(MarketData.timestamp, MarketData.open, MarketData.high,
+                     MarketData.low, MarketData.close, MarketData.volume).filter(
+        MarketData.symbol == symbol,
+        MarketData.period == period
+    )
+    if start_date:
+        query = query.filter(MarketData.timestamp >= start_date)
+    if end_date:
+        query = query.filter(MarketData.timestamp <= end_date)
+    rows = query.order_by(MarketData.timestamp.asc()).all()
+
+    names = ("open", "high", "low", "close", "volume")
+    if not rows:
+        bars = {name: np.empty(0) for name in names}
+        bars["t"] = np.empty(0, dtype="datetime64[ms]")
+        return bars
+    times, *columns = zip(*rows)
+    bars = {name: np.array(column, dtype=np.float64) for name, column in zip(names, columns)}
+    bars["t"] = np.array(times, dtype="datetime64[ms]")
+    return bars
+
+
+def _hold_nan(signals: np.ndarray) -> np.ndarray:
+    """NaN 表示沿用上一个信号，开头的NaN视为空仓"""
+    valid = ~np.isnan(signals)
+    if valid.all():
+        return signals
+    idx = np.where(valid, np.arange(len(signals)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, signals[np.maximum(idx, 0)], 0.0)
+
+
+def periods_per_year(timestamps: np.ndarray, default: float = 252.0) -> float:
+    """按K线时间跨度估算每年的K线根数（A股日线约252，加密货币日线约365）"""
+    if len(timestamps) < 2:
+        return default
+    days = (timestamps[-1] - timestamps[0]) / np.timedelta64(1, "D")
+    return (len(timestamps) - 1) / (days / 365.25) if days > 0 else default
+
+
+def simulate(
+    bars: Bars,
+    signals: np.ndarray,
+    initial_capital: float = 1_000_000.0,
+    commission: float = 0.0003,
+    slippage: float = 0.0,
+    fill_price: str = "open",
+    annualization: Optional[float] = None,
+    risk_free: float = 0.0
+) -> BacktestOutput:
+    """
+    按目标仓位回测单个交易对
+
+    Args:
+        bars: K线列，至少包含 t/close，fill_price 为 open 时还需要 open
+        signals: 目标仓位，与K线等长；NaN 表示沿用上一个信号
+        initial_capital: 初始资金
+        commission: 手续费率（按成交金额）
+        slippage: 滑点（成交价相对 fill_price 的比例，买入加、卖出减）
+        fill_price: 成交价，open 为信号下一根K线的开盘价，close 为其收盘价
+        annualization: 每年K线根数，默认按K线时间跨度估算
+        risk_free: 年化无风险利率（夏普比率使用）
+
+    Returns:
+        回测结果
+    """
+    if fill_price not in FILL_PRICES:
+        raise ValueError(f"不支持的成交价: {fill_price}")
+    timestamps = np.asarray(bars["t"], dtype="datetime64[ms]")
+    close = np.asarray(bars["close"], dtype=np.float64)
+    n_bars = len(close)
+    signals = np.asarray(signals, dtype=np.float64)
+    if signals.shape != close.shape:
+        raise ValueError(f"信号长度 {len(signals)} 与K线根数 {n_bars} 不一致")
+    if not n_bars:
+        raise ValueError("没有K线数据")
+    if not np.isfinite(close).all() or (close <= 0).any():
+        raise ValueError("收盘价须为正数")
+
+    # 信号后移一根K线：positions[t] 为第 t 根K线成交后持有的目标仓位
+    positions = np.zeros(n_bars)
+    positions[1:] = _hold_nan(signals)[:-1]
+    previous = np.concatenate(([0.0], positions[:-1]))
+    fill_bars = np.flatnonzero(positions != previous)
+
+    price = close
+    if fill_price == "open":
+        open_ = np.asarray(bars["open"], dtype=np.float64)
+        # 缺少开盘价的K线按收盘价成交
+        price = np.where(np.isfinite(open_) & (open_ > 0), open_, close)
+    p = price[fill_bars]
+    w = positions[fill_bars]
+    w_prev = previous[fill_bars]
+
+    # 第 i 次成交前权益 M 与上次成交后权益 N 之比：上次成交后持仓市值为 w_prev·N，随价格变化 g 倍
+    g = np.ones(len(p))
+    g[1:] = p[1:] / p[:-1]
+    m_ratio = 1.0 + w_prev * (g - 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # 成交前持仓市值占 M 的比例
+        u = np.where(m_ratio != 0, w_prev * g / m_ratio, 0.0)
+    # 成交后持仓市值为 w·N，N = M·(1 - c)，c 为成本占 M 的比例：c = k·|w·(1 - c) - u|，
+    # k 为单位成交额的成本（滑点 + 按含滑点成交价计算的手续费），买卖方向不同
+    side = np.sign(w - u)
+    k = slippage + commission * (1.0 + slippage * side)
+    cost = k * side * (w - u) / (1.0 + k * side * w)
+    n_ratio = 1.0 - cost
+
+    equity_after = initial_capital * np.cumprod(m_ratio * n_ratio)
+    equity_before = equity_after / n_ratio
+    units = w * equity_after / p
+    quantity = np.diff(units, prepend=0.0)
+    exec_price = p * (1.0 + slippage * side)
+    fee = commission * np.abs(quantity) * exec_price
+    cash = equity_after - units * p
+
+    # 每根K线收盘时的持仓和现金取自其之前最近一次成交
+    segment = np.searchsorted(fill_bars, np.arange(n_bars), side="right") - 1
+    equity = np.full(n_bars, float(initial_capital))
+    held = segment >= 0
+    equity[held] = cash[segment[held]] + units[segment[held]] * close[held]
+
+    trades = _round_trips(timestamps, fill_bars, w, w_prev, u, cost, equity_before, equity_after, equity[-1])
+
+    # 平仓成交记录对应往返交易的盈亏
+    profit_loss = np.full(len(fill_bars), np.nan)
+    profit_loss_ratio = np.full(len(fill_bars), np.nan)
+    holding_period = np.full(len(fill_bars), np.nan)
+    closed = trades["exit_fill"] >= 0
+    exit_fills = trades["exit_fill"][closed]
+    profit_loss[exit_fills] = trades["profit_loss"][closed]
+    profit_loss_ratio[exit_fills] = trades["return"][closed]
+    holding_period[exit_fills] = trades["holding_period"][closed]
+
+    fills = {
+        "bar": fill_bars,
+        "timestamp": timestamps[fill_bars],
+        "direction": np.where(quantity > 0, "buy", "sell"),
+        "quantity": np.abs(quantity),
+        "price": exec_price,
+        "commission": fee,
+        "position": w,
+        "profit_loss": profit_loss,
+        "profit_loss_ratio": profit_loss_ratio,
+        "holding_period": holding_period
+    }
+
+    return build_output(timestamps, equity, positions, fills, trades, initial_capital, annualization, risk_free)
+
+
+def build_output(timestamps: np.ndarray, equity: np.ndarray, positions: np.ndarray,
+                 fills: Dict[str, np.ndarray], trades: Dict[str, np.ndarray], initial_capital: float,
+                 annualization: Optional[float] = None, risk_free: float = 0.0) -> BacktestOutput:
+    """
+    由资金曲线、成交和往返交易计算回撤与统计指标（向量化回测与事件驱动回测共用）
+
+    Args:
+        timestamps: K线时间
+        equity: 每根K线收盘时的权益
+        positions: 每根K线收盘时的持仓（非0表示有持仓）
+        fills: 成交明细列，见 BacktestOutput.fills
+        trades: 往返交易列，见 BacktestOutput.trades
+        initial_capital: 初始资金
+        annualization: 每年K线根数，默认按K线时间跨度估算
+        risk_free: 年化无风险利率
+
+    Returns:
+        回测结果
+    """
+    curve_drawdown = drawdown(np.concatenate(([initial_capital], equity)))[1:]
+    annual = annualization or periods_per_year(timestamps)
+    metrics, statistics = _statistics(equity, curve_drawdown, positions, trades, fills,
+                                      initial_capital, annual, risk_free)
+    return BacktestOutput(timestamps=timestamps, equity=equity, drawdown=curve_drawdown, positions=positions,
+                          fills=fills, trades=trades, metrics=metrics, statistics=statistics)
+
+
+def _round_trips(timestamps: np.ndarray, fill_bars: np.ndarray, w: np.ndarray, w_prev: np.ndarray,
+                 u: np.ndarray, cost: np.ndarray, equity_before: np.ndarray, equity_after: np.ndarray,
+                 final_equity: float) -> Dict[str, np.ndarray]:
+    """
+    把成交划分为往返交易：仓位由0或反方向变为非0时开仓，由非0变为0或反方向时平仓（反手同时是平仓和开仓），
+    同方向加减仓属于同一笔交易。现金不产生收益，所以一笔交易的盈亏就是开仓前到平仓后的权益变化；
+    反手成交的成本按平仓和开仓的数量比例分摊
+    """
+    sign, sign_prev = np.sign(w), np.sign(w_prev)
+    opens = np.flatnonzero((sign != 0) & (sign != sign_prev))
+    closes = np.flatnonzero((sign_prev != 0) & (sign != sign_prev))
+
+    # 扣除本次成交中平仓部分的成本后的权益
+    traded = np.abs(w * (1.0 - cost) - u)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        close_share = np.where(traded > 0, np.abs(u) / traded, 0.0)
+    base = equity_before - cost * equity_before * np.where(sign_prev != 0, close_share, 0.0)
+
+    # 开平仓交替出现，第 i 笔开仓与第 i 笔平仓配对；最后一笔可能未平仓
+    n_closed = len(closes)
+    exit_base = np.append(base[closes], final_equity) if len(opens) > n_closed else base[closes]
+    entry_base = base[opens]
+    pnl = exit_base - entry_base
+    notional = np.abs(w[opens]) * equity_after[opens]
+
+    entry_time = timestamps[fill_bars[opens]]
+    exit_time = np.append(timestamps[fill_bars[closes]], timestamps[-1:]) if len(opens) > n_closed \
+        else timestamps[fill_bars[closes]]
+    exit_fill = np.append(closes, -1) if len(opens) > n_closed else closes
+    with np.errstate(invalid="ignore", divide="ignore"):
+        trade_return = np.where(notional > 0, pnl / notional, np.nan)
+    return {
+        "entry_time": entry_time,
+        "exit_time": exit_time,
+        "entry_fill": opens,
+        "exit_fill": exit_fill,
+        "direction": np.where(sign[opens] > 0, "long", "short"),
+        "profit_loss": pnl,
+        "return": trade_return,
+        "holding_period": (exit_time - entry_time) / np.timedelta64(1, "D")
+    }
+
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    if not denominator or not np.isfinite(numerator / denominator):
+        return None
+    return float(numerator / denominator)
+
+
+def _statistics(equity: np.ndarray, curve_drawdown: np.ndarray, positions: np.ndarray,
+                trades: Dict[str, np.ndarray], fills: Dict[str, np.ndarray],
+                initial_capital: float, annual: float, risk_free: float):
+    """计算 BacktestResult 的指标列和详细统计"""
+    returns = np.diff(equity, prepend=initial_capital) / np.concatenate(([initial_capital], equity[:-1]))
+    growth = equity[-1] / initial_capital
+    total_return = growth - 1.0
+    annual_return = growth ** (annual / len(equity)) - 1.0 if growth > 0 else -1.0
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    excess = returns.mean() - risk_free / annual
+    sharpe = _ratio(excess * np.sqrt(annual), std)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+    max_drawdown = float(max(0.0, -curve_drawdown.min()))
+
+    pnl = trades["profit_loss"]
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    metrics = {
+        "initial_capital": float(initial_capital),
+        "final_capital": float(equity[-1]),
+        "total_return": float(total_return),
+        "annual_return": float(annual_return),
+        "sharpe_ratio": sharpe,
+        "max_drawdown": max_drawdown,
+        "win_rate": float(len(wins) / len(pnl)) if len(pnl) else None,
+        "total_trades": int(len(pnl)),
+        "profit_factor": _ratio(wins.sum(), -losses.sum())
+    }
+    # 最大回撤持续期：从前一高点到回撤最深处
+    trough = int(np.argmin(curve_drawdown))
+    peak = int(np.argmax(equity[:trough + 1])) if trough else 0
+    statistics = {
+        "bars": int(len(equity)),
+        "periods_per_year": float(annual),
+        "volatility": float(std * np.sqrt(annual)),
+        "sortino_ratio": _ratio(excess * np.sqrt(annual), downside),
+        "calmar_ratio": _ratio(annual_return, max_drawdown),
+        "max_drawdown_bars": trough - peak if curve_drawdown[trough] < 0 else 0,
+        "exposure": float(np.mean(positions != 0)),
+        "fills": int(len(fills["bar"])),
+        "total_commission": float(fills["commission"].sum()),
+        "turnover": float(np.sum(fills["quantity"] * fills["price"]) / np.mean(equity)),
+        "avg_trade_return": float(np.nanmean(trades["return"])) if len(pnl) else None,
+        "best_trade": float(pnl.max()) if len(pnl) else None,
+        "worst_trade": float(pnl.min()) if len(pnl) else None,
+        "avg_holding_period": float(trades["holding_period"].mean()) if len(pnl) else None
+    }
+    return metrics, statistics
+
+
+def _to_ms(values: np.ndarray) -> List[int]:
+    return values.astype("datetime64[ms]").astype(np.int64).tolist()
+
+
+def _optional(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def save_backtest(
+    db: Session,
+    output: BacktestOutput,
+    symbol: str,
+    strategy_id: int = 0,
+    name: Optional[str] = None,
+    parameters: Optional[dict] = None,
+    batch_size: int = 10000
+) -> BacktestResult:
+    """
+    保存回测结果和成交记录（成交记录批量插入），调用方负责提交
+
+    Args:
+        db: 数据库会话
+        output: simulate 的结果
+        symbol: 交易对符号
+        strategy_id: 策略ID，0 表示未关联策略
+        name: 回测名称
+        parameters: 回测参数
+        batch_size: 每批插入的成交记录数
+
+    Returns:
+        已写入（flush）的回测结果
+    """
+    timestamps = output.timestamps
+    # 资金曲线按固定间隔抽样，保留最后一个点
+    step = max(1, -(-len(timestamps) // MAX_CURVE_POINTS))
+    sample = np.unique(np.append(np.arange(0, len(timestamps), step), len(timestamps) - 1))
+    curve = [{"t": t, "equity": float(e), "drawdown": float(d)}
+             for t, e, d in zip(_to_ms(timestamps[sample]), output.equity[sample], output.drawdown[sample])]
+    trades = output.trades
+    trades_data = [
+        {"entry_time": entry, "exit_time": exit_, "direction": direction, "profit_loss": float(pnl),
+         "return": _optional(ret), "holding_period": float(days), "open": int(fill) < 0}
+        for entry, exit_, direction, pnl, ret, days, fill in zip(
+            _to_ms(trades["entry_time"]), _to_ms(trades["exit_time"]), trades["direction"].tolist(),
+            trades["profit_loss"], trades["return"], trades["holding_period"], trades["exit_fill"])
+    ]
+
+    now = datetime.utcnow()
+    result = BacktestResult(
+        strategy_id=strategy_id,
+        name=name or f"{symbol} 回测",
+        start_date=timestamps[0].astype(datetime),
+        end_date=timestamps[-1].astype(datetime),
+        symbol=symbol,
+        parameters=parameters or {},
+        statistics=output.statistics,
+        equity_curve=curve,
+        trades_data=trades_data,
+        status="completed",
+        created_at=now,
+        completed_at=now,
+        **output.metrics
+    )
+    db.add(result)
+    db.flush()
+
+    fills = output.fills
+    order_types = fills["order_type"].tolist() if "order_type" in fills else ["market"] * len(fills["bar"])
+    rows = [
+        {"strategy_id": strategy_id, "backtest_id": result.id, "symbol": symbol, "direction": direction,
+         "order_type": order_type, "quantity": float(quantity), "price": float(price), "commission": float(fee),
+         "timestamp": ts, "profit_loss": _optional(pnl), "profit_loss_ratio": _optional(ratio),
+         "holding_period": _optional(days), "created_at": now}
+        for direction, order_type, quantity, price, fee, ts, pnl, ratio, days in zip(
+            fills["direction"].tolist(), order_types, fills["quantity"], fills["price"], fills["commission"],
+            fills["timestamp"].astype(datetime).tolist(), fills["profit_loss"],
+            fills["profit_loss_ratio"], fills["holding_period"])
+    ]
+    for start in range(0, len(rows), batch_size):
+        db.connection().execute(insert(TradeRecord.__table__), rows[start:start + batch_size])
+    return result
+
+
+def run_backtest(
+    db: Session,
+    symbol: str,
+    signals: Signals,
+    period: str = "1d",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    strategy_id: int = 0,
+    name: Optional[str] = None,
+    persist: bool = True,
+    **options
+) -> BacktestOutput:
+    """
+    读取K线、回测并保存结果
+
+    Args:
+        db: 数据库会话
+        symbol: 交易对符号
+        signals: 目标仓位数组，或接收K线列、返回目标仓位的函数
+        period: K线周期
+        start_date: 开始时间
+        end_date: 结束时间
+        strategy_id: 策略ID
+        name: 回测名称
+        persist: 是否写入 backtest_results / trade_records
+        **options: simulate 的成交与统计参数
+
+    Returns:
+        回测结果，persist 时 statistics 中含 backtest_id
+    """
+    bars = load_bars(db, symbol, period, start_date, end_date)
+    if not len(bars["t"]):
+        raise ValueError(f"{symbol} 在该时间范围内没有 {period} K线")
+    positions = signals(bars) if callable(signals) else signals
+    output = simulate(bars, positions, **options)
+    if persist:
+        parameters = {"period": period, **options}
+        result = save_backtest(db, output, symbol, strategy_id, name, parameters)
+        db.commit()
+        output.statistics["backtest_id"] = result.id
+    return output
@@ -0,0 +1,253 @@
+"""
+逐笔成交合成K线
+按交易对维护未完成K线，事件时间水位线越过K线结束时间后输出定稿K线；
+水位线之后到达的迟到成交在保留窗口内修订已输出的K线并再次输出（修订版本号递增）；
+长时间没有成交的交易对按处理时间的流逝外推事件时间，不直接使用本机时钟（与交易所时钟可能有偏差）
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认合成周期: 名称 -> 毫秒
+DEFAULT_PERIODS = {"1m": 60_000, "5m": 300_000}
+
+# K线状态槽位: [open, high, low, close, volume, 首笔时间ms, 末笔时间ms, 成交笔数, 修订版本]
+_O, _H, _L, _C, _V, _FIRST, _LAST, _N, _REV = range(9)
+
+# 输出K线: (symbol, period, 开始时间ms, open, high, low, close, volume, 成交笔数, 修订版本)
+# 修订版本为0表示首次定稿，大于0表示迟到成交修订后的再次输出
+BarUpdate = Tuple[str, str, int, float, float, float, float, float, int, int]
+
+
+class _PeriodState:
+    """单个交易对单个周期的K线状态"""
+
+    __slots__ = ("name", "ms", "open_bars", "closed", "next_close")
+
+    def __init__(self, name: str, ms: int):
+        self.name = name
+        self.ms = ms
+        self.open_bars: Dict[int, list] = {}
+        # 已定稿、仍在修订保留窗口内的K线
+        self.closed: Dict[int, list] = {}
+        # 最早一根未完成K线的结束时间，水位线越过时才需要检查定稿
+        self.next_close = 1 << 62
+
+
+class _SymbolState:
+    """单个交易对的水位线和各周期状态"""
+
+    __slots__ = ("max_ts", "tick_ts", "seen_ts", "seen", "periods")
+
+    def __init__(self, periods: Sequence[Tuple[str, int]]):
+        # 水位线依据的事件时间（含空闲外推）
+        self.max_ts = 0
+        # 成交中的最大事件时间
+        self.tick_ts = 0
+        # 上次 advance 时的 tick_ts 及此后它最后一次变化被观察到的处理时间（time.monotonic 秒）
+        self.seen_ts = 0
+        self.seen = 0.0
+        self.periods = [_PeriodState(name, ms) for name, ms in periods]
+
+
+class BarAggregator:
+    """逐笔成交K线合成器"""
+
+    def __init__(self, periods: Optional[Dict[str, int]] = None, watermark_delay: int = 2000,
+                 allowed_lateness: int = 60_000):
+        """
+        Args:
+            periods: 合成周期 {名称: 毫秒}，默认1m和5m
+            watermark_delay: 水位线相对已见最大事件时间的延迟（毫秒），K线结束后再等待这么久才定稿
+            allowed_lateness: 定稿后仍接受迟到成交并输出修订的时长（毫秒），更晚的成交被丢弃
+        """
+        self.periods = sorted((periods or DEFAULT_PERIODS).items(), key=lambda item: item[1])
+        self.watermark_delay = watermark_delay
+        self.allowed_lateness = allowed_lateness
+        self._symbols: Dict[str, _SymbolState] = {}
+        self._output: List[BarUpdate] = []
+        self._lock = threading.Lock()
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.dropped_ticks = 0
+        self.bars_closed = 0
+        self.revisions = 0
+
+    def add_tick(self, symbol: str, ts: int, price: float, qty: float) -> None:
+        """
+        处理一笔成交
+
+        Args:
+            symbol: 交易对符号
+            ts: 成交时间（毫秒时间戳）
+            price: 成交价
+            qty: 成交量
+        """
+        state = self._symbols.get(symbol)
+        if state is None:
+            state = _SymbolState(self.periods)
+            self._symbols[symbol] = state
+        self.ticks += 1
+
+        watermark = state.max_ts - self.watermark_delay
+        for ps in state.periods:
+            start = ts - ts % ps.ms
+            bar = ps.open_bars.get(start)
+            if bar is None:
+                if start + ps.ms <= watermark:
+                    self._late_tick(symbol, ps, start, ts, price, qty, watermark)
+                    continue
+                ps.open_bars[start] = [price, price, price, price, qty, ts, ts, 1, 0]
+                if start + ps.ms < ps.next_close:
+                    ps.next_close = start + ps.ms
+                continue
+
+            if price > bar[_H]:
+                bar[_H] = price
+            elif price < bar[_L]:
+                bar[_L] = price
+            bar[_V] += qty
+            bar[_N] += 1
+            if ts >= bar[_LAST]:
+                bar[_C] = price
+                bar[_LAST] = ts
+            elif ts < bar[_FIRST]:
+                bar[_O] = price
+                bar[_FIRST] = ts
+
+        if ts > state.tick_ts:
+            state.tick_ts = ts
+            # max_ts 不小于 tick_ts
+            if ts > state.max_ts:
+                state.max_ts = ts
+                self._close_ready(symbol, state, ts - self.watermark_delay)
+
+    def add_ticks(self, symbol: str, ts: Iterable[int], prices: Iterable[float], qtys: Iterable[float]) -> None:
+        """批量处理同一交易对的成交"""
+        add_tick = self.add_tick
+        for t, p, q in zip(ts, prices, qtys):
+            add_tick(symbol, t, p, q)
+
+    def _late_tick(self, symbol: str, ps: _PeriodState, start: int, ts: int,
+                   price: float, qty: float, watermark: int) -> None:
+        """处理所属K线已定稿的迟到成交"""
+        bar = ps.closed.get(start)
+        if bar is None or start + ps.ms + self.allowed_lateness <= watermark:
+            self.dropped_ticks += 1
+            return
+
+        self.late_ticks += 1
+        if price > bar[_H]:
+            bar[_H] = price
+        if price < bar[_L]:
+            bar[_L] = price
+        bar[_V] += qty
+        bar[_N] += 1
+        if ts < bar[_FIRST]:
+            bar[_O] = price
+            bar[_FIRST] = ts
+        elif ts >= bar[_LAST]:
+            bar[_C] = price
+            bar[_LAST] = ts
+        bar[_REV] += 1
+        self.revisions += 1
+        self._emit(symbol, ps.name, start, bar)
+
+    def _close_ready(self, symbol: str, state: _SymbolState, watermark: int) -> None:
+        """定稿结束时间不晚于水位线的K线，并清理超出修订窗口的已定稿K线"""
+        for ps in state.periods:
+            if watermark < ps.next_close:
+                continue
+
+            for start in sorted(s for s in ps.open_bars if s + ps.ms <= watermark):
+                bar = ps.open_bars.pop(start)
+                ps.closed[start] = bar
+                self.bars_closed += 1
+                self._emit(symbol, ps.name, start, bar)
+
+            ps.next_close = min(ps.open_bars) + ps.ms if ps.open_bars else 1 << 62
+
+            expire = watermark - self.allowed_lateness
+            for start in [s for s in ps.closed if s + ps.ms <= expire]:
+                del ps.closed[start]
+
+    def _emit(self, symbol: str, period: str, start: int, bar: list) -> None:
+        with self._lock:
+            self._output.append((symbol, period, start, bar[_O], bar[_H], bar[_L], bar[_C],
+                                 bar[_V], bar[_N], bar[_REV]))
+
+    def advance(self, now: Optional[float] = None) -> None:
+        """
+        按处理时间推进空闲交易对的水位线，使长时间没有成交的交易对也能定稿K线
+        只处理至少 watermark_delay 事件时间没有前进的交易对：事件时间取最大成交时间加上此后流逝的处理时间。
+        成交时间的变化在每次调用时检查（不在逐笔路径上读时钟），空闲时长按调用间隔偏保守地计算
+
+        Args:
+            now: 当前处理时间（time.monotonic 秒），默认取当前值
+        """
+        if now is None:
+            now = time.monotonic()
+        for symbol, state in list(self._symbols.items()):
+            if state.tick_ts != state.seen_ts:
+                state.seen_ts = state.tick_ts
+                state.seen = now
+                continue
+            idle_ms = int((now - state.seen) * 1000)
+            if idle_ms < self.watermark_delay:
+                continue
+            event_ts = state.tick_ts + idle_ms
+            if event_ts > state.max_ts:
+                state.max_ts = event_ts
+                self._close_ready(symbol, state, event_ts - self.watermark_delay)
+
+    def drain(self) -> List[BarUpdate]:
+        """取出并清空已输出的K线（定稿与修订）"""
+        with self._lock:
+            output, self._output = self._output, []
+        return output
+
+    def open_bar(self, symbol: str, period: str) -> Optional[BarUpdate]:
+        """获取交易对最新的未完成K线"""
+        state = self._symbols.get(symbol)
+        if state is None:
+            return None
+        for ps in state.periods:
+            if ps.name == period and ps.open_bars:
+                start = max(ps.open_bars)
+                bar = ps.open_bars[start]
+                return (symbol, period, start, bar[_O], bar[_H], bar[_L], bar[_C], bar[_V], bar[_N], bar[_REV])
+        return None
+
+    def stats(self) -> dict:
+        """合成器统计信息"""
+        return {
+            "symbols": len(self._symbols),
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "dropped_ticks": self.dropped_ticks,
+            "bars_closed": self.bars_closed,
+            "revisions": self.revisions,
+            "pending_output": len(self._output)
+        }
+
+
+def to_market_data(update: BarUpdate) -> dict:
+    """将输出K线转换为 MarketData 字段（与实时K线写库格式一致）"""
+    symbol, period, start, o, h, l, c, v, _, _ = update
+    return {
+        "symbol": symbol,
+        "timestamp": datetime.fromtimestamp(start / 1000),
+        "open": o,
+        "high": h,
+        "low": l,
+        "close": c,
+        "volume": v,
+        "period": period
+    }
+
+
+# 全局K线合成器
+bar_aggregator = BarAggregator()
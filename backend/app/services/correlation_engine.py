@@ -0,0 +1,300 @@
+"""
+滚动协方差、相关系数与贝塔
+收益率面板按时间逐列推入滚动窗口：新列加入、窗口外的旧列减出，只更新成对的累计和（O(N²)/步），
+不对每个窗口从头重算（O(N²·W)）；累计误差通过每隔一个窗口长度重新求和消除。
+只需要最终窗口的矩阵时（compute_correlation）直接对该窗口做一次矩阵乘法求和。
+缺失值按成对剔除：每对交易对只使用两者都有收益率的时间点
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models.market import MarketData
+from app.services.indicators import to_json_series
+from app.services.panel_loader import load_panel
+
+# 默认基准指数（沪深300）
+DEFAULT_BENCHMARK = "000300.SH"
+
+
+class RollingCovariance:
+    """N个序列两两之间的滚动协方差"""
+
+    def __init__(self, n: int, window: int, min_periods: Optional[int] = None, resync: Optional[int] = None):
+        """
+        Args:
+            n: 序列数
+            window: 窗口长度
+            min_periods: 成对有效样本数少于该值时结果为NaN，默认为窗口长度
+            resync: 每推入多少列重新求和一次以消除累计误差，默认为窗口长度
+        """
+        if window < 2:
+            raise ValueError("窗口长度至少为2")
+        self.n = n
+        self.window = window
+        self.min_periods = max(min_periods or window, 2)
+        self.resync = resync or window
+        self._columns = deque()
+        self._steps = 0
+        # count[i, j]: 两者都有值的样本数；sx[i, j]: 这些样本上 x_i 的和；sxx[i, j]: x_i² 的和；sxy[i, j]: x_i·x_j 的和
+        self.count = np.zeros((n, n))
+        self.sx = np.zeros((n, n))
+        self.sxx = np.zeros((n, n))
+        self.sxy = np.zeros((n, n))
+
+    def push(self, column: np.ndarray) -> None:
+        """推入一个时间点的N个值（缺失为NaN），窗口已满时移出最早的一列"""
+        mask = ~np.isnan(column)
+        values = np.where(mask, column, 0.0)
+        mask = mask.astype(np.float64)
+        self._columns.append((values, mask))
+        self._update(values, mask, 1.0)
+        if len(self._columns) > self.window:
+            old_values, old_mask = self._columns.popleft()
+            self._update(old_values, old_mask, -1.0)
+        self._steps += 1
+        if self._steps >= self.resync:
+            self._recompute()
+
+    def load(self, block: np.ndarray) -> None:
+        """
+        用 (N, T) 的数据块整体替换窗口（只保留最后 window 列），一次矩阵乘法求和，
+        只需要最终窗口的结果时不必逐列推入
+        """
+        block = block[:, -self.window:] if block.shape[1] else block
+        mask = ~np.isnan(block)
+        self._columns = deque(zip(np.where(mask, block, 0.0).T, mask.astype(np.float64).T))
+        if self._columns:
+            self._recompute()
+
+    def _update(self, values: np.ndarray, mask: np.ndarray, sign: float) -> None:
+        self.count += sign * np.outer(mask, mask)
+        self.sx += sign * np.outer(values, mask)
+        self.sxx += sign * np.outer(values * values, mask)
+        self.sxy += sign * np.outer(values, values)
+
+    def _recompute(self) -> None:
+        """按窗口内的数据重新求和"""
+        values = np.column_stack([v for v, _ in self._columns])
+        mask = np.column_stack([m for _, m in self._columns])
+        self.count = mask @ mask.T
+        self.sx = values @ mask.T
+        self.sxx = (values * values) @ mask.T
+        self.sxy = values @ values.T
+        self._steps = 0
+
+    def _moments(self) -> Tuple[np.ndarray, np.ndarray]:
+        """成对样本协方差和 x_i 在成对样本上的方差"""
+        count = self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = (self.sxy - self.sx * self.sx.T / count) / (count - 1)
+            var = (self.sxx - self.sx * self.sx / count) / (count - 1)
+        invalid = count < self.min_periods
+        cov[invalid] = np.nan
+        var[invalid] = np.nan
+        # 浮点误差可能使方差略小于0
+        np.maximum(var, 0.0, out=var)
+        return cov, var
+
+    def covariance(self) -> np.ndarray:
+        """协方差矩阵"""
+        return self._moments()[0]
+
+    def correlation(self) -> np.ndarray:
+        """相关系数矩阵"""
+        cov, var = self._moments()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov / np.sqrt(var * var.T)
+        return np.clip(corr, -1.0, 1.0)
+
+    def beta(self) -> np.ndarray:
+        """贝塔矩阵：beta[i, j] 为序列 i 对序列 j 回归的斜率"""
+        cov, var = self._moments()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return cov / var.T
+
+
+def rolling_beta(returns: np.ndarray, benchmark: np.ndarray, window: int,
+                 min_periods: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每个时间点各序列相对基准的滚动贝塔和相关系数（成对剔除缺失值）
+    用累计和之差得到窗口和，相当于每步加入新值、减去窗口外的旧值，总计算量 O(N·T)
+
+    Args:
+        returns: 收益率矩阵 (N, T)
+        benchmark: 基准收益率 (T,)
+        window: 窗口长度
+        min_periods: 最少有效样本数，默认为窗口长度
+
+    Returns:
+        (贝塔矩阵, 相关系数矩阵)，形状均为 (N, T)
+    """
+    min_periods = max(min_periods or window, 2)
+    mask = ~np.isnan(returns) & ~np.isnan(benchmark)
+    x = np.where(mask, returns, 0.0)
+    y = np.where(mask, benchmark, 0.0)
+
+    def window_sum(a: np.ndarray) -> np.ndarray:
+        total = np.cumsum(a, axis=1, dtype=np.float64)
+        total[:, window:] = total[:, window:] - total[:, :-window]
+        return total
+
+    n = window_sum(mask.astype(np.float64))
+    sx, sy = window_sum(x), window_sum(y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = window_sum(x * y) - sx * sy / n
+        var_x = np.maximum(window_sum(x * x) - sx * sx / n, 0.0)
+        var_y = np.maximum(window_sum(y * y) - sy * sy / n, 0.0)
+        beta = cov / var_y
+        corr = np.clip(cov / np.sqrt(var_x * var_y), -1.0, 1.0)
+    invalid = n < min_periods
+    beta[invalid] = np.nan
+    corr[invalid] = np.nan
+    return beta, corr
+
+
+class _ResultCache:
+    """计算结果的LRU缓存；结束时间未指定（取最新数据）的结果在 ttl 秒后过期"""
+
+    def __init__(self, max_entries: int = 128, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[0] <= time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any, expires: bool) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl if expires else float("inf"), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+correlation_cache = _ResultCache()
+
+
+def _recent_calendar(db: Session, symbols: Sequence[str], period: str,
+                     end_date: Optional[datetime], bars: int) -> np.ndarray:
+    """股票池中任一交易对有K线的最近 bars 个时间点（升序）"""
+    query = db.query(MarketData.timestamp).distinct().filter(
+        MarketData.symbol.in_(list(symbols)),
+        MarketData.period == period
+    )
+    if end_date:
+        query = query.filter(MarketData.timestamp <= end_date)
+    rows = query.order_by(MarketData.timestamp.desc()).limit(bars).all()
+    return np.array(sorted(row[0] for row in rows), dtype="datetime64[ms]")
+
+
+def compute_correlation(
+    db: Session,
+    symbols: Sequence[str],
+    benchmark: Optional[str] = DEFAULT_BENCHMARK,
+    window: int = 60,
+    period: str = "1d",
+    end_date: Optional[datetime] = None,
+    history: int = 0,
+    min_periods: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    计算股票池截至 end_date 的滚动协方差/相关系数矩阵和相对基准的贝塔，结果按 (股票池, 窗口, 结束时间) 缓存
+
+    Args:
+        db: 数据库会话
+        symbols: 股票池
+        benchmark: 基准代码，为None时不计算贝塔
+        window: 窗口长度（收益率个数）
+        period: K线周期
+        end_date: 结束时间，默认为最新
+        history: 额外返回最近多少个时间点的滚动贝塔序列
+        min_periods: 最少有效样本数，默认为窗口长度
+
+    Returns:
+        计算结果字典（字段与 CorrelationData 一致）
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if len(symbols) < 1:
+        raise ValueError("股票池不能为空")
+    if window < 2:
+        raise ValueError("窗口长度至少为2")
+
+    key = (tuple(symbols), benchmark, window, period, end_date, history, min_periods)
+    cached = correlation_cache.get(key)
+    if cached is not None:
+        return cached
+
+    universe = symbols + ([benchmark] if benchmark and benchmark not in symbols else [])
+    # history 个时间点的窗口共需要 window + history - 1 个收益率，再加1根K线计算第一个收益率
+    calendar = _recent_calendar(db, universe, period, end_date, window + max(history, 1))
+    panel = load_panel(db, universe, ["close"], period=period,
+                       start_time=calendar[0].astype(datetime) if len(calendar) else None,
+                       end_time=end_date, calendar=calendar, ffill=True)
+    close = panel["close"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = np.full(close.shape, np.nan)
+        returns[:, 1:] = close[:, 1:] / close[:, :-1] - 1.0
+    # 停牌日没有收益率
+    returns[~panel.observed] = np.nan
+
+    # 矩阵只需要截至最后一个时间点的窗口，直接对该窗口求和；history 只用于贝塔序列
+    n = len(symbols)
+    engine = RollingCovariance(n, window, min_periods)
+    engine.load(returns[:n])
+
+    result = {
+        "symbols": symbols,
+        "benchmark": None,
+        "window": window,
+        "period": period,
+        "end_date": panel.timestamps[-1].astype(datetime) if len(panel.timestamps) else None,
+        "observations": [int(c) for c in np.diag(engine.count)],
+        "covariance": [to_json_series(row) for row in engine.covariance()],
+        "correlation": [to_json_series(row) for row in engine.correlation()],
+        "beta": {},
+        "benchmark_correlation": {},
+        "dates": [],
+        "beta_history": {}
+    }
+
+    if benchmark:
+        bench_row = universe.index(benchmark)
+        if panel.observed[bench_row].any():
+            beta, corr = rolling_beta(returns[:n], returns[bench_row], window, min_periods)
+            result["benchmark"] = benchmark
+            result["beta"] = dict(zip(symbols, to_json_series(beta[:, -1]) if beta.size else [None] * n))
+            result["benchmark_correlation"] = dict(zip(symbols, to_json_series(corr[:, -1]) if corr.size else [None] * n))
+            if history and beta.size:
+                result["dates"] = panel.timestamps[-history:].astype("datetime64[ms]").astype(np.int64).tolist()
+                result["beta_history"] = {symbol: to_json_series(row[-history:]) for symbol, row in zip(symbols, beta)}
+
+    correlation_cache.put(key, result, expires=end_date is None or end_date >= datetime.utcnow())
+    return result
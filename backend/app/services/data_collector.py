@@ -1,22 +1,41 @@
 import asyncio
 import aiohttp
+import json
+import random
+import time
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import os
-from app.models.market import MarketData, OrderBook, SymbolInfo, MarketTicker
+from app.models.market import MarketData
 from app.core.logging_config import get_data_logger_instance, log_manager, log_exception
+from app.services.kline_store import kline_hot_store
+from app.services.orderbook_codec import encode_book
+from app.services.orderbook_engine import order_book_manager
+from app.services.orderbook_history import order_book_recorder
+from app.services.bar_aggregator import bar_aggregator, to_market_data
+from app.services.write_buffer import market_write_buffer
+from app.services.event_bus import market_event_bus, publish_book_changed, BarClosed, TickerUpdated
 
 # 获取数据采集专用的日志记录器
 data_logger = get_data_logger_instance()
 
+# Binance REST地址（测试时可指向本地回放服务器）
+BINANCE_REST_URL = os.getenv("BINANCE_REST_URL", "https://api.binance.com")
+
 class DataCollector:
     """数据采集服务类"""
     
     def __init__(self, db: Session):
         self.db = db
         self.session = None
+        self.realtime_stats: Optional[Dict[str, Any]] = None
+        self._realtime_stop: Optional[asyncio.Event] = None
+        # 增量轮询游标: (交易对, 周期) -> 最后一根已写入K线的开始时间
+        self.kline_cursors: Dict[Tuple[str, str], datetime] = {}
     
     async def __aenter__(self):
         self.session = aiohttp.ClientSession()
@@ -77,15 +96,18 @@ class DataCollector:
             return None
     
     # Binance加密货币数据
-    async def fetch_binance_data(self, symbol: str, interval: str = "1d", limit: int = 1000) -> Optional[List]:
-        """从Binance获取加密货币数据"""
+    async def fetch_binance_data(self, symbol: str, interval: str = "1d", limit: int = 1000,
+                                 start_time: Optional[datetime] = None) -> Optional[List]:
+        """从Binance获取加密货币数据，指定 start_time 时返回开始时间不早于它的K线，否则返回最新的 limit 根"""
         try:
-            url = f"https://api.binance.com/api/v3/klines"
+            url = f"{BINANCE_REST_URL}/api/v3/klines"
             params = {
                 "symbol": symbol.upper(),
                 "interval": interval,
                 "limit": limit
             }
+            if start_time is not None:
+                params["startTime"] = int(start_time.timestamp() * 1000)
             
             async with self.session.get(url, params=params) as response:
                 if response.status == 200:
@@ -114,6 +136,99 @@ class DataCollector:
                                            "获取数据失败", e)
             return None
     
+    async def poll_binance_klines(self, symbols: List[str], interval: str = "1m",
+                                  limit: int = 1000, concurrency: int = 8) -> Dict[str, Optional[int]]:
+        """
+        增量轮询Binance K线并写入写后缓冲
+        
+        每个交易对保存一个游标（最后一根已写入K线的开始时间），只拉取游标之后的K线；
+        游标所在K线可能仍在形成中，每次都重新拉取并原地更新。多个交易对共用同一个HTTP连接池并发请求。
+        
+        Args:
+            symbols: 交易对列表
+            interval: K线周期
+            limit: 单次请求的最大K线数，没有游标时拉取最新的 limit 根
+            concurrency: 最大并发请求数
+        
+        Returns:
+            {交易对: 写入的K线条数}，请求失败的交易对为None
+        """
+        missing = [symbol for symbol in symbols if (symbol, interval) not in self.kline_cursors]
+        if missing:
+            await run_in_threadpool(self._load_kline_cursors, missing, interval)
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def poll(symbol: str) -> Optional[int]:
+            async with semaphore:
+                return await self._poll_binance_symbol(symbol, interval, limit)
+        
+        results = await asyncio.gather(*(poll(symbol) for symbol in symbols))
+        return dict(zip(symbols, results))
+    
+    def _load_kline_cursors(self, symbols: List[str], interval: str):
+        """用数据库中已有的最新K线初始化游标"""
+        from app.core.database import SessionLocal
+        
+        db = self.db or SessionLocal()
+        try:
+            rows = db.query(MarketData.symbol, func.max(MarketData.timestamp)).filter(
+                MarketData.symbol.in_(symbols),
+                MarketData.period == interval
+            ).group_by(MarketData.symbol).all()
+        finally:
+            if db is not self.db:
+                db.close()
+        for symbol, latest in rows:
+            self.kline_cursors[(symbol, interval)] = latest
+    
+    async def _poll_binance_symbol(self, symbol: str, interval: str, limit: int) -> Optional[int]:
+        """按游标拉取单个交易对的新K线，落后超过一页时继续翻页"""
+        key = (symbol, interval)
+        written = 0
+        while True:
+            cursor = self.kline_cursors.get(key)
+            data = await self.fetch_binance_data(symbol, interval=interval, limit=limit, start_time=cursor)
+            if data is None:
+                return None
+            for item in data:
+                await market_write_buffer.put("market_data", dict(item, symbol=symbol, period=interval))
+            written += len(data)
+            if not data:
+                break
+            self.kline_cursors[key] = data[-1]["timestamp"]
+            # 上次轮询时仍在形成、此后已完成的K线发布定稿事件（首次拉取的历史K线不发布）
+            if cursor is not None:
+                for item in data[:-1]:
+                    if item["timestamp"] >= cursor:
+                        market_event_bus.publish(BarClosed(symbol=symbol, period=interval, **item))
+            # 没有游标时只取最新一页；不足一页或游标没有前进说明已追上
+            if cursor is None or len(data) < limit or data[-1]["timestamp"] == cursor:
+                break
+        return written
+    
+    async def fetch_binance_depth_snapshot(self, symbol: str, limit: int = 1000) -> Optional[Dict]:
+        """从Binance获取深度快照，用于内存盘口的初始化和丢包重同步"""
+        try:
+            url = f"{BINANCE_REST_URL}/api/v3/depth"
+            params = {
+                "symbol": symbol.upper(),
+                "limit": limit
+            }
+            
+            async with self.session.get(url, params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    log_manager.log_data_collection(symbol, "binance", "error", 
+                                                   f"深度快照API错误: {response.status}")
+                    return None
+                    
+        except Exception as e:
+            log_manager.log_data_collection(symbol, "binance", "error", 
+                                           "获取深度快照失败", e)
+            return None
+    
     # Tushare A股数据 - 改进版
     async def fetch_tushare_data(self, symbol: str, start_date: str, end_date: str, 
                                  freq: str = "D", adj: str = "qfq") -> Optional[pd.DataFrame]:
@@ -277,6 +392,7 @@ class DataCollector:
     async def save_market_data(self, symbol: str, data: List[Dict], period: str = "1d") -> bool:
         """保存市场数据到数据库"""
         try:
+            added_bars = []
             for item in data:
                 market_data = MarketData(
                     symbol=symbol,
@@ -298,8 +414,11 @@ class DataCollector:
                 
                 if not existing:
                     self.db.add(market_data)
+                    added_bars.append((item["timestamp"], item["open"], item["high"],
+                                       item["low"], item["close"], item["volume"]))
             
             self.db.commit()
+            kline_hot_store.upsert_bars(symbol, period, added_bars)
             log_manager.log_data_collection(symbol, "database", "success", 
                                            f"成功保存{len(data)}条数据到数据库")
             return True
@@ -310,6 +429,31 @@ class DataCollector:
                                            "保存数据到数据库失败", e)
             return False
     
+    # 盘口快照保存到数据库
+    async def save_order_book(self, symbol: str, timestamp: datetime,
+                              bids: List, asks: List) -> bool:
+        """
+        保存盘口快照（二进制格式）
+        
+        Args:
+            symbol: 交易对符号
+            timestamp: 快照时间
+            bids: 买盘档位，{"price", "amount"} 字典或 (price, amount) 列表，价格从高到低
+            asks: 卖盘档位，价格从低到高
+        """
+        try:
+            # 经写后缓冲批量提交
+            await market_write_buffer.put("order_book", {
+                "symbol": symbol,
+                "timestamp": timestamp,
+                "book_data": encode_book(bids, asks)
+            })
+            return True
+        except Exception as e:
+            log_manager.log_data_collection(symbol, "database", "error", 
+                                           "保存盘口快照失败", e)
+            return False
+    
     # 批量数据采集 - 更新版
     async def collect_batch_data(self, symbols: List[str], data_source: str = "tushare", 
                                  **kwargs) -> Dict[str, bool]:
@@ -384,48 +528,193 @@ class DataCollector:
         return results
     
     # 实时数据采集（WebSocket）
-    async def start_realtime_collection(self, symbols: List[str]):
-        """启动实时数据采集"""
-        # 这里可以实现WebSocket连接
-        # 由于WebSocket实现较复杂，这里只提供框架
+    async def start_realtime_collection(self, symbols: List[str], url: Optional[str] = None,
+                                        queue_size: int = 10000, batch_size: int = 500,
+                                        batch_interval: float = 0.5, bar_source: str = "kline"):
+        """
+        启动实时数据采集，直到调用 stop_realtime_collection
+        
+        WebSocket读取协程负责连接、订阅和解析，断线后按指数退避重连并重新订阅；
+        深度增量直接应用到内存盘口，K线和行情写入写后缓冲，由缓冲按条数或时间在一个事务中批量提交。
+        
+        Args:
+            symbols: 交易对列表
+            url: WebSocket地址，默认读取环境变量 BINANCE_WS_URL（可指向本地回放服务器）
+            queue_size: 写后缓冲上限，缓冲满时读取协程等待（背压）
+            batch_size: 单次提交的最大行数
+            batch_interval: 单次提交的最长等待时间（秒）
+            bar_source: K线来源，"kline" 使用交易所推送的K线，"trade" 订阅逐笔成交自行合成K线
+        """
+        url = url or os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443/ws")
         log_manager.log_data_collection("realtime", "websocket", "info", 
                                        f"开始实时采集: {', '.join(symbols)}")
         
-        # 示例：Binance WebSocket
-        # async with websockets.connect("wss://stream.binance.com:9443/ws") as websocket:
-        #     # 订阅行情
-        #     subscribe_msg = {
-        #         "method": "SUBSCRIBE",
-        #         "params": [f"{symbol.lower()}@kline_1m" for symbol in symbols],
-        #         "id": 1
-        #     }
-        #     await websocket.send(json.dumps(subscribe_msg))
-        #     
-        #     while True:
-        #         message = await websocket.recv()
-        #         data = json.loads(message)
-        #         # 处理实时数据
-        #         await self.process_realtime_data(data)
+        # 深度增量序号不连续时通过REST快照重同步内存盘口
+        order_book_manager.set_snapshot_fetcher(self.fetch_binance_depth_snapshot)
+        # 盘口历史：增量日志 + 定期检查点
+        order_book_recorder.attach(order_book_manager)
+        # 盘口变更发布到事件总线
+        order_book_manager.add_listener(publish_book_changed)
+        
+        market_write_buffer.configure(max_rows=batch_size, max_delay=batch_interval, max_pending=queue_size)
+        self._realtime_stop = asyncio.Event()
+        self.realtime_stats = {
+            "url": url,
+            "symbols": list(symbols),
+            "connected": False,
+            "connects": 0,
+            "messages": 0,
+            "klines": 0,
+            "tickers": 0,
+            "depth_updates": 0,
+            "errors": 0,
+            "bar_source": bar_source,
+            "trades": 0,
+            "last_message_time": None
+        }
+        
+        reader = asyncio.ensure_future(self._realtime_reader(url, symbols, bar_source))
+        bar_flusher = asyncio.ensure_future(self._bar_flusher(batch_interval)) if bar_source == "trade" else None
+        try:
+            await self._realtime_stop.wait()
+        finally:
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+            if bar_flusher is not None:
+                bar_flusher.cancel()
+                try:
+                    await bar_flusher
+                except asyncio.CancelledError:
+                    pass
+                # 输出已定稿和修订的K线（仍在形成中的K线不写库）
+                await self._flush_bars()
+            # 缓冲中剩余的数据提交后再退出
+            await market_write_buffer.flush()
+            self._realtime_stop = None
+            data_logger.info(f"实时采集已停止: {market_write_buffer.stats()['rows_written']}")
+    
+    def stop_realtime_collection(self):
+        """停止实时数据采集"""
+        if self._realtime_stop is not None:
+            self._realtime_stop.set()
+    
+    async def _realtime_reader(self, url: str, symbols: List[str], bar_source: str = "kline"):
+        """WebSocket读取协程：连接、订阅、解析，断线后指数退避重连"""
+        import websockets
+        
+        bar_stream = "aggTrade" if bar_source == "trade" else "kline_1m"
+        streams = [f"{symbol.lower()}@{kind}" for symbol in symbols
+                   for kind in (bar_stream, "ticker", "depth@100ms")]
+        backoff = 1.0
+        
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=20, ping_timeout=20,
+                                              max_size=2 ** 22) as websocket:
+                    # 每次（重新）连接后都需要重新订阅
+                    await websocket.send(json.dumps({"method": "SUBSCRIBE", "params": streams, "id": 1}))
+                    self.realtime_stats["connected"] = True
+                    self.realtime_stats["connects"] += 1
+                    data_logger.info(f"WebSocket已连接并订阅{len(streams)}个数据流: {url}")
+                    backoff = 1.0
+                    
+                    async for message in websocket:
+                        self.realtime_stats["messages"] += 1
+                        self.realtime_stats["last_message_time"] = time.time()
+                        await self.process_realtime_data(json.loads(message))
+                    
+                    log_manager.log_data_collection("realtime", "websocket", "warning", 
+                                                   f"WebSocket连接被服务端关闭，{backoff:.0f}秒后重连")
+                        
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.realtime_stats["errors"] += 1
+                log_manager.log_data_collection("realtime", "websocket", "warning", 
+                                               f"WebSocket连接断开，{backoff:.0f}秒后重连: {str(e)}")
+            finally:
+                self.realtime_stats["connected"] = False
+            
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, 60.0)
+    
+    async def _bar_flusher(self, interval: float):
+        """逐笔合成K线的输出协程：定期按处理时间推进水位线，将定稿和修订的K线送入写后缓冲"""
+        while True:
+            await asyncio.sleep(interval)
+            bar_aggregator.advance()
+            await self._flush_bars()
+    
+    async def _flush_bars(self):
+        """将合成器已输出的K线放入写后缓冲"""
+        for update in bar_aggregator.drain():
+            row = to_market_data(update)
+            await market_write_buffer.put("market_data", row)
+            market_event_bus.publish(BarClosed(revision=update[-1], **row))
     
     async def process_realtime_data(self, data: Dict):
         """处理实时数据"""
         try:
+            # 组合流格式 {"stream": ..., "data": {...}}
+            if "stream" in data and "data" in data:
+                data = data["data"]
+            
+            # 深度增量直接应用到内存盘口
+            if data.get("e") == "depthUpdate":
+                order_book_manager.apply_binance_depth_event(data)
+                if self.realtime_stats is not None:
+                    self.realtime_stats["depth_updates"] += 1
+                return
+            
+            # 逐笔成交送入K线合成器
+            if data.get("e") in ("aggTrade", "trade"):
+                bar_aggregator.add_tick(data["s"], data["T"], float(data["p"]), float(data["q"]))
+                if self.realtime_stats is not None:
+                    self.realtime_stats["trades"] += 1
+                return
+            
+            # 24小时行情
+            if data.get("e") == "24hrTicker":
+                ticker = {
+                    "symbol": data["s"],
+                    "timestamp": datetime.fromtimestamp(data["E"] / 1000),
+                    "last_price": float(data["c"]),
+                    "price_change": float(data["p"]),
+                    "price_change_percent": float(data["P"]),
+                    "high": float(data["h"]),
+                    "low": float(data["l"]),
+                    "volume": float(data["v"]),
+                    "turnover": float(data["q"])
+                }
+                await market_write_buffer.put("market_ticker", ticker)
+                market_event_bus.publish(TickerUpdated(**ticker))
+                if self.realtime_stats is not None:
+                    self.realtime_stats["tickers"] += 1
+                return
+            
             # 解析WebSocket数据
             if "k" in data:
                 kline = data["k"]
-                market_data = MarketData(
-                    symbol=kline["s"],
-                    timestamp=datetime.fromtimestamp(kline["t"] / 1000),
-                    open=float(kline["o"]),
-                    high=float(kline["h"]),
-                    low=float(kline["l"]),
-                    close=float(kline["c"]),
-                    volume=float(kline["v"]),
-                    period="1m"
-                )
+                market_data = {
+                    "symbol": kline["s"],
+                    "timestamp": datetime.fromtimestamp(kline["t"] / 1000),
+                    "open": float(kline["o"]),
+                    "high": float(kline["h"]),
+                    "low": float(kline["l"]),
+                    "close": float(kline["c"]),
+                    "volume": float(kline["v"]),
+                    "period": "1m"
+                }
                 
-                self.db.add(market_data)
-                self.db.commit()
+                # 写后缓冲批量提交，缓冲已满时在此等待
+                await market_write_buffer.put("market_data", market_data)
+                if kline.get("x"):
+                    market_event_bus.publish(BarClosed(**market_data))
+                if self.realtime_stats is not None:
+                    self.realtime_stats["klines"] += 1
                 
         except Exception as e:
             log_manager.log_data_collection("realtime", "websocket", "error", 
@@ -0,0 +1,685 @@
+"""
+事件驱动回测
+逐根K线推进：先用本根K线的开高低收撮合挂单，再调用策略的 on_bar，最后按收盘价记录权益。
+策略在第 t 根K线下的单最早在第 t+1 根K线成交，不使用未来数据：
+- 市价单按开盘价成交（加滑点）
+- 限价单在开盘价优于限价时按开盘价成交，否则K线区间触及限价时按限价成交
+- 止损单在开盘价跳空越过触发价时按开盘价成交，否则触及触发价时按触发价成交（加滑点）；
+  带限价的止损单触发后转为限价单
+- 可按K线成交量比例限制每根K线的成交数量，未成交部分继续挂单（部分成交）
+- 开仓单可附带止损/止盈，开仓成交后生成互斥的止损单和止盈限价单（从下一根K线起生效）；
+  同一根K线同时触及两者时无法判断先后，按止损先成交处理
+热循环中K线以Python列表顺序读取，策略拿到的 Bar 是同一个对象（属性按需读取当前K线），
+订单和持仓为 __slots__ 记录，没有挂单时不进入撮合
+"""
+
+import math
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.models.strategy import Strategy
+from app.services.backtest_engine import Bars, BacktestOutput, build_output, load_bars, save_backtest
+
+NAN = float("nan")
+
+# 事件驱动策略的回调函数名
+EVENT_CALLBACKS = ("initialize", "on_bar", "on_fill")
+
+# 订单状态
+PENDING = "pending"
+FILLED = "filled"
+CANCELLED = "cancelled"
+REJECTED = "rejected"
+
+
+class PercentCommission:
+    """按成交金额比例收取手续费，可设最低收费（如A股佣金万三、最低5元）"""
+
+    __slots__ = ("rate", "minimum")
+
+    def __init__(self, rate: float = 0.0003, minimum: float = 0.0):
+        self.rate = rate
+        self.minimum = minimum
+
+    def __call__(self, price: float, quantity: float) -> float:
+        fee = price * quantity * self.rate
+        return fee if fee > self.minimum else self.minimum
+
+
+class PerShareCommission:
+    """按成交数量收取手续费"""
+
+    __slots__ = ("per_share", "minimum")
+
+    def __init__(self, per_share: float = 0.005, minimum: float = 0.0):
+        self.per_share = per_share
+        self.minimum = minimum
+
+    def __call__(self, price: float, quantity: float) -> float:
+        fee = quantity * self.per_share
+        return fee if fee > self.minimum else self.minimum
+
+
+class PercentSlippage:
+    """成交价按比例向不利方向偏移"""
+
+    __slots__ = ("rate",)
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = rate
+
+    def __call__(self, price: float, side: int) -> float:
+        return price * (1.0 + side * self.rate)
+
+
+class TickSlippage:
+    """成交价向不利方向偏移固定个最小价位"""
+
+    __slots__ = ("ticks", "tick_size")
+
+    def __init__(self, ticks: int = 1, tick_size: float = 0.01):
+        self.ticks = ticks
+        self.tick_size = tick_size
+
+    def __call__(self, price: float, side: int) -> float:
+        return price + side * self.ticks * self.tick_size
+
+
+class Order:
+    """订单记录"""
+
+    __slots__ = ("id", "side", "quantity", "filled", "order_type", "limit_price", "stop_price",
+                 "status", "bar", "avg_price", "oco", "stop_loss", "take_profit", "tag")
+
+    def __init__(self, order_id: int, side: int, quantity: float, order_type: str, limit_price: float,
+                 stop_price: float, bar: int, stop_loss: float = NAN, take_profit: float = NAN, tag: str = ""):
+        self.id = order_id
+        # 1 买入，-1 卖出
+        self.side = side
+        self.quantity = quantity
+        self.filled = 0.0
+        self.order_type = order_type
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.status = PENDING
+        # 下单时的K线序号，之后的K线才参与撮合
+        self.bar = bar
+        self.avg_price = NAN
+        # 互斥订单：其中一个成交后撤销另一个
+        self.oco: Optional["Order"] = None
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.tag = tag
+
+    @property
+    def remaining(self) -> float:
+        return self.quantity - self.filled
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == PENDING
+
+    def __repr__(self):
+        return (f"<Order(id={self.id}, side={self.side}, type={self.order_type}, "
+                f"quantity={self.quantity}, filled={self.filled}, status={self.status})>")
+
+
+class Bar:
+    """
+    当前K线的只读视图，回测过程中始终是同一个对象
+    第一根K线之前（initialize 中）没有当前K线，价格和成交量为NaN，时间为NaT
+    """
+
+    __slots__ = ("index", "_t", "_open", "_high", "_low", "_close", "_volume")
+
+    def __init__(self, feed: "BarFeed"):
+        self.index = -1
+        self._t = feed.t
+        self._open, self._high, self._low = feed.open, feed.high, feed.low
+        self._close, self._volume = feed.close, feed.volume
+
+    @property
+    def timestamp(self) -> np.datetime64:
+        return self._t[self.index] if self.index >= 0 else np.datetime64("NaT", "ms")
+
+    @property
+    def open(self) -> float:
+        return self._open[self.index] if self.index >= 0 else NAN
+
+    @property
+    def high(self) -> float:
+        return self._high[self.index] if self.index >= 0 else NAN
+
+    @property
+    def low(self) -> float:
+        return self._low[self.index] if self.index >= 0 else NAN
+
+    @property
+    def close(self) -> float:
+        return self._close[self.index] if self.index >= 0 else NAN
+
+    @property
+    def volume(self) -> float:
+        return self._volume[self.index] if self.index >= 0 else NAN
+
+
+class BarFeed:
+    """内存K线源：各列为Python列表（热循环顺序读取），同时保留NumPy数组供策略按窗口切片"""
+
+    def __init__(self, bars: Bars):
+        self.arrays = {name: np.asarray(bars[name], dtype=np.float64)
+                       for name in ("open", "high", "low", "close", "volume")}
+        self.arrays["t"] = np.asarray(bars["t"], dtype="datetime64[ms]")
+        self.t = self.arrays["t"]
+        self.open = self.arrays["open"].tolist()
+        self.high = self.arrays["high"].tolist()
+        self.low = self.arrays["low"].tolist()
+        self.close = self.arrays["close"].tolist()
+        self.volume = self.arrays["volume"].tolist()
+
+    @classmethod
+    def from_db(cls, db: Session, symbol: str, period: str = "1d", start_date=None, end_date=None) -> "BarFeed":
+        return cls(load_bars(db, symbol, period, start_date, end_date))
+
+    def __len__(self):
+        return len(self.close)
+
+
+class Context:
+    """
+    策略上下文：下单接口、持仓与资金；策略可以在上面保存自己的状态
+    """
+
+    def __init__(self, engine: "EventBacktest", params: Dict[str, Any]):
+        self._engine = engine
+        self.params = params
+        self.bar = engine.bar
+
+    # ---------- 账户 ----------
+
+    @property
+    def position(self) -> float:
+        """持仓数量（空头为负）"""
+        return self._engine.position
+
+    @property
+    def avg_price(self) -> float:
+        """持仓均价"""
+        return self._engine.avg_price
+
+    @property
+    def cash(self) -> float:
+        return self._engine.cash
+
+    @property
+    def equity(self) -> float:
+        """按当前K线收盘价计算的权益"""
+        engine = self._engine
+        if engine.bar.index < 0:
+            return engine.cash
+        return engine.cash + engine.position * engine.feed.close[engine.bar.index]
+
+    @property
+    def open_orders(self) -> List[Order]:
+        return [order for order in self._engine.pending if order.status == PENDING]
+
+    def history(self, name: str, n: int) -> np.ndarray:
+        """截至当前K线（含）最近n根K线的某一列，返回数组视图"""
+        end = self._engine.bar.index + 1
+        return self._engine.feed.arrays[name][max(end - n, 0):end]
+
+    # ---------- 下单 ----------
+
+    def buy(self, quantity: float, limit: Optional[float] = None, stop: Optional[float] = None,
+            stop_loss: Optional[float] = None, take_profit: Optional[float] = None, tag: str = "") -> Order:
+        """
+        买入
+
+        Args:
+            quantity: 数量
+            limit: 限价，不指定时为市价单
+            stop: 止损触发价（价格上涨到触发价时买入），与 limit 同时指定时为止损限价单
+            stop_loss: 成交后附带的止损价
+            take_profit: 成交后附带的止盈价
+            tag: 订单标记
+
+        Returns:
+            订单
+        """
+        return self._engine.submit(1, quantity, limit, stop, stop_loss, take_profit, tag)
+
+    def sell(self, quantity: float, limit: Optional[float] = None, stop: Optional[float] = None,
+             stop_loss: Optional[float] = None, take_profit: Optional[float] = None, tag: str = "") -> Order:
+        """卖出（或卖空），参数见 buy"""
+        return self._engine.submit(-1, quantity, limit, stop, stop_loss, take_profit, tag)
+
+    def order_target(self, target: float, limit: Optional[float] = None) -> Optional[Order]:
+        """调整持仓到目标数量，已持有目标数量时不下单"""
+        delta = target - self._engine.position
+        if abs(delta) < 1e-12:
+            return None
+        return self._engine.submit(1 if delta > 0 else -1, abs(delta), limit)
+
+    def order_target_percent(self, percent: float, limit: Optional[float] = None) -> Optional[Order]:
+        """按当前收盘价把持仓调整到权益的 percent（按交易单位取整），第一根K线之前不可用"""
+        index = self._engine.bar.index
+        if index < 0:
+            raise ValueError("第一根K线之前没有收盘价，order_target_percent 只能在 on_bar 中调用")
+        price = self._engine.feed.close[index]
+        return self.order_target(self._engine.round_lot(percent * self.equity / price), limit)
+
+    def cancel(self, order: Order) -> None:
+        self._engine.cancel(order)
+
+    def cancel_all(self) -> None:
+        for order in self.open_orders:
+            self._engine.cancel(order)
+
+
+class EventBacktest:
+    """事件驱动回测引擎（单个交易对）"""
+
+    def __init__(
+        self,
+        feed: BarFeed,
+        on_bar: Callable[[Context, Bar], None],
+        initialize: Optional[Callable[[Context], None]] = None,
+        on_fill: Optional[Callable[[Context, Order, float, float], None]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        initial_capital: float = 1_000_000.0,
+        commission: Optional[Callable[[float, float], float]] = None,
+        slippage: Optional[Callable[[float, int], float]] = None,
+        lot_size: float = 0.0,
+        allow_short: bool = False,
+        max_volume_ratio: float = 0.0
+    ):
+        """
+        Args:
+            feed: K线源
+            on_bar: 每根K线调用 on_bar(context, bar)
+            initialize: 开始前调用 initialize(context)
+            on_fill: 每次成交后调用 on_fill(context, order, quantity, price)
+            params: 策略参数，策略中通过 context.params 读取
+            initial_capital: 初始资金
+            commission: 手续费模型 (price, quantity) -> 手续费，默认万三
+            slippage: 滑点模型 (price, side) -> 成交价，默认无滑点；只作用于市价单和止损单
+            lot_size: 交易单位（A股为100），0 表示不取整
+            allow_short: 是否允许卖空，不允许时卖出数量不超过持仓
+            max_volume_ratio: 每根K线成交数量不超过其成交量的比例，0 表示不限制
+        """
+        self.feed = feed
+        self.bar = Bar(feed)
+        self.on_bar = on_bar
+        self.initialize = initialize
+        self.on_fill = on_fill
+        self.initial_capital = float(initial_capital)
+        self.commission = commission or PercentCommission()
+        self.slippage = slippage or PercentSlippage(0.0)
+        self.lot_size = lot_size
+        self.allow_short = allow_short
+        self.max_volume_ratio = max_volume_ratio
+        self.context = Context(self, params or {})
+
+        self.cash = self.initial_capital
+        self.position = 0.0
+        self.avg_price = 0.0
+        self.pending: List[Order] = []
+        self.orders: List[Order] = []
+        self._ids = count(1)
+
+        # 成交明细（按列追加）
+        self._fills: Dict[str, list] = {name: [] for name in (
+            "bar", "direction", "order_type", "quantity", "price", "commission", "position",
+            "profit_loss", "profit_loss_ratio", "holding_period")}
+        # 往返交易：当前持仓的开仓信息和累计盈亏
+        self._trades: Dict[str, list] = {name: [] for name in (
+            "entry_bar", "exit_bar", "entry_fill", "exit_fill", "direction", "profit_loss", "return")}
+        self._entry: Optional[Tuple[int, int, float]] = None
+        self._trade_pnl = 0.0
+
+    # ---------- 下单与撮合 ----------
+
+    def round_lot(self, quantity: float) -> float:
+        """按交易单位向零取整"""
+        if self.lot_size:
+            return math.copysign(math.floor(abs(quantity) / self.lot_size + 1e-9) * self.lot_size, quantity)
+        return quantity
+
+    def submit(self, side: int, quantity: float, limit: Optional[float] = None, stop: Optional[float] = None,
+               stop_loss: Optional[float] = None, take_profit: Optional[float] = None, tag: str = "") -> Order:
+        """创建订单，从下一根K线开始撮合"""
+        order_type = "stop" if stop is not None else "limit" if limit is not None else "market"
+        order = Order(next(self._ids), side, float(self.round_lot(quantity)), order_type,
+                      NAN if limit is None else float(limit), NAN if stop is None else float(stop),
+                      self.bar.index,
+                      NAN if stop_loss is None else float(stop_loss),
+                      NAN if take_profit is None else float(take_profit), tag)
+        self.orders.append(order)
+        if order.quantity <= 0:
+            order.status = REJECTED
+        else:
+            self.pending.append(order)
+        return order
+
+    def cancel(self, order: Order) -> None:
+        if order.status == PENDING:
+            order.status = CANCELLED
+
+    def _match(self, i: int, o: float, h: float, l: float, v: float) -> None:
+        """用第 i 根K线撮合挂单"""
+        budget = v * self.max_volume_ratio if self.max_volume_ratio else math.inf
+        pending = self.pending
+        changed = False
+        # 成交回调中新下的单追加在末尾，本根K线不参与撮合
+        for k in range(len(pending)):
+            order = pending[k]
+            if order.status != PENDING:
+                changed = True
+                continue
+            if order.bar >= i:
+                continue
+            side = order.side
+            kind = order.order_type
+            if kind == "market":
+                price = self.slippage(o, side)
+            elif kind == "limit":
+                limit = order.limit_price
+                if side > 0:
+                    price = o if o <= limit else limit if l <= limit else NAN
+                else:
+                    price = o if o >= limit else limit if h >= limit else NAN
+            else:
+                stop = order.stop_price
+                if side > 0:
+                    trigger = o if o >= stop else stop if h >= stop else NAN
+                else:
+                    trigger = o if o <= stop else stop if l <= stop else NAN
+                if trigger != trigger:
+                    continue
+                if order.limit_price == order.limit_price:
+                    # 止损限价单触发后转为限价单，本根K线剩余区间内按限价撮合
+                    order.order_type = "limit"
+                    limit = order.limit_price
+                    if side > 0:
+                        price = trigger if trigger <= limit else NAN
+                    else:
+                        price = trigger if trigger >= limit else NAN
+                else:
+                    price = self.slippage(trigger, side)
+            if price != price:
+                continue
+
+            quantity = order.remaining
+            if quantity > budget:
+                quantity = self.round_lot(budget)
+                if quantity <= 0:
+                    continue
+            quantity = self._affordable(side, quantity, price)
+            if quantity <= 0:
+                # 资金或持仓不足，剩余部分不再成交
+                order.status = REJECTED if order.filled == 0 else CANCELLED
+                changed = True
+                continue
+            budget -= quantity
+            self._fill(order, kind, i, quantity, price)
+            changed = True
+
+        if changed:
+            self.pending = [order for order in self.pending if order.status == PENDING]
+
+    def _affordable(self, side: int, quantity: float, price: float) -> float:
+        """按资金和持仓限制可成交数量"""
+        position = self.position
+        if side < 0:
+            if not self.allow_short and quantity > position:
+                quantity = self.round_lot(max(position, 0.0))
+            return quantity
+        # 买入平空不受资金限制，开多部分不超过现金
+        cover = -position if position < 0 else 0.0
+        opening = quantity - cover
+        if opening <= 0:
+            return quantity
+        cash = self.cash - cover * price
+        if price * opening + self.commission(price, quantity) > cash:
+            opening = self.round_lot(max(cash - self.commission(price, quantity), 0.0) / price)
+        return cover + opening
+
+    def _fill(self, order: Order, kind: str, i: int, quantity: float, price: float) -> None:
+        """成交：更新现金、持仓、往返交易和订单状态"""
+        side = order.side
+        fee = self.commission(price, quantity)
+        self.cash -= side * quantity * price + fee
+
+        position = self.position
+        realized = 0.0
+        if position and (position > 0) != (side > 0):
+            # 平仓部分
+            closing = min(quantity, abs(position))
+            realized = (price - self.avg_price) * closing * (1.0 if position > 0 else -1.0)
+            close_fee = fee * closing / quantity
+            self._trade_pnl += realized - close_fee
+            position += side * closing
+            if abs(position) < 1e-12:
+                position = 0.0
+                self._close_trade(i)
+            opening = quantity - closing
+            if opening > 0:
+                self.avg_price = price
+                position = side * opening
+                self._open_trade(i, side, opening * price, fee - close_fee)
+        else:
+            if not position:
+                self._open_trade(i, side, quantity * price, fee)
+            else:
+                self._trade_pnl -= fee
+                self._entry = (self._entry[0], self._entry[1], self._entry[2] + quantity * price)
+            self.avg_price = (self.avg_price * abs(position) + price * quantity) / (abs(position) + quantity)
+            position += side * quantity
+        self.position = position
+
+        fills = self._fills
+        fills["bar"].append(i)
+        fills["direction"].append("buy" if side > 0 else "sell")
+        fills["order_type"].append(kind)
+        fills["quantity"].append(quantity)
+        fills["price"].append(price)
+        fills["commission"].append(fee)
+        fills["position"].append(position)
+        closed = self._trades["exit_fill"] and self._trades["exit_fill"][-1] == len(fills["bar"]) - 1
+        fills["profit_loss"].append(self._trades["profit_loss"][-1] if closed else NAN)
+        fills["profit_loss_ratio"].append(self._trades["return"][-1] if closed else NAN)
+        fills["holding_period"].append(NAN)
+
+        order.avg_price = price if order.filled == 0 else \
+            (order.avg_price * order.filled + price * quantity) / (order.filled + quantity)
+        order.filled += quantity
+        if order.remaining <= 1e-12:
+            order.status = FILLED
+            if order.oco is not None:
+                self.cancel(order.oco)
+            self._attach_exits(order)
+        if self.on_fill is not None:
+            self.on_fill(self.context, order, quantity, price)
+
+    def _attach_exits(self, order: Order) -> None:
+        """开仓单成交后生成互斥的止损单和止盈单"""
+        if order.stop_loss != order.stop_loss and order.take_profit != order.take_profit:
+            return
+        exit_side = -order.side
+        quantity = order.filled
+        stop = take = None
+        if order.stop_loss == order.stop_loss:
+            stop = self.submit(exit_side, quantity, stop=order.stop_loss, tag="stop_loss")
+        if order.take_profit == order.take_profit:
+            take = self.submit(exit_side, quantity, limit=order.take_profit, tag="take_profit")
+        if stop is not None and take is not None:
+            stop.oco, take.oco = take, stop
+
+    def _open_trade(self, i: int, side: int, notional: float, fee: float) -> None:
+        # (开仓K线, 开仓成交序号, 开仓金额)
+        self._entry = (i, len(self._fills["bar"]), notional)
+        self._trade_pnl = -fee
+        self._trades["direction"].append("long" if side > 0 else "short")
+
+    def _close_trade(self, i: int) -> None:
+        entry_bar, entry_fill, notional = self._entry
+        trades = self._trades
+        trades["entry_bar"].append(entry_bar)
+        trades["exit_bar"].append(i)
+        trades["entry_fill"].append(entry_fill)
+        trades["exit_fill"].append(len(self._fills["bar"]))
+        trades["profit_loss"].append(self._trade_pnl)
+        trades["return"].append(self._trade_pnl / notional if notional else NAN)
+        self._entry = None
+
+    # ---------- 主循环 ----------
+
+    def run(self, annualization: Optional[float] = None, risk_free: float = 0.0) -> BacktestOutput:
+        """
+        运行回测
+
+        Args:
+            annualization: 每年K线根数，默认按K线时间跨度估算
+            risk_free: 年化无风险利率
+
+        Returns:
+            回测结果（结构与向量化回测相同，成交明细多 order_type 列）
+        """
+        feed = self.feed
+        n_bars = len(feed)
+        if not n_bars:
+            raise ValueError("没有K线数据")
+        equity = [0.0] * n_bars
+        positions = [0.0] * n_bars
+        bar = self.bar
+        context = self.context
+        on_bar = self.on_bar
+        if self.initialize is not None:
+            self.initialize(context)
+
+        for i, o, h, l, c, v in zip(range(n_bars), feed.open, feed.high, feed.low, feed.close, feed.volume):
+            if self.pending:
+                self._match(i, o, h, l, v)
+            bar.index = i
+            on_bar(context, bar)
+            position = self.position
+            equity[i] = self.cash + position * c
+            positions[i] = position
+
+        return self._output(np.array(equity), np.array(positions), annualization, risk_free)
+
+    def _output(self, equity: np.ndarray, positions: np.ndarray,
+                annualization: Optional[float], risk_free: float) -> BacktestOutput:
+        t = self.feed.t
+        fills = {name: np.array(values) for name, values in self._fills.items()}
+        fills["bar"] = fills["bar"].astype(np.int64)
+        fills["timestamp"] = t[fills["bar"]]
+        for name in ("quantity", "price", "commission", "position", "profit_loss", "profit_loss_ratio"):
+            fills[name] = fills[name].astype(np.float64)
+
+        trades = {name: list(values) for name, values in self._trades.items()}
+        if self._entry is not None:
+            # 期末未平仓：按最后收盘价计算浮动盈亏
+            entry_bar, entry_fill, notional = self._entry
+            unrealized = (self.feed.close[-1] - self.avg_price) * self.position
+            pnl = self._trade_pnl + unrealized
+            trades["entry_bar"].append(entry_bar)
+            trades["exit_bar"].append(len(t) - 1)
+            trades["entry_fill"].append(entry_fill)
+            trades["exit_fill"].append(-1)
+            trades["profit_loss"].append(pnl)
+            trades["return"].append(pnl / notional if notional else NAN)
+        entry_bar = np.array(trades.pop("entry_bar"), dtype=np.int64)
+        exit_bar = np.array(trades.pop("exit_bar"), dtype=np.int64)
+        trades = {
+            "entry_time": t[entry_bar],
+            "exit_time": t[exit_bar],
+            "entry_fill": np.array(trades["entry_fill"], dtype=np.int64),
+            "exit_fill": np.array(trades["exit_fill"], dtype=np.int64),
+            "direction": np.array(trades["direction"], dtype="<U5"),
+            "profit_loss": np.array(trades["profit_loss"], dtype=np.float64),
+            "return": np.array(trades["return"], dtype=np.float64),
+            "holding_period": (t[exit_bar] - t[entry_bar]) / np.timedelta64(1, "D")
+        }
+        closed = trades["exit_fill"] >= 0
+        fills["holding_period"] = np.full(len(fills["bar"]), np.nan)
+        fills["holding_period"][trades["exit_fill"][closed]] = trades["holding_period"][closed]
+
+        return build_output(t, equity, positions, fills, trades, self.initial_capital, annualization, risk_free)
+
+
+def load_strategy_code(code: str) -> Dict[str, Callable]:
+    """
+    编译策略代码（Strategy.code），取出回调函数
+    事件驱动策略定义 on_bar(context, bar)，可选 initialize(context) 和 on_fill(context, order, quantity, price)；
+    向量化策略定义 signals(bars, params)，返回与K线等长的目标仓位（见 backtest_engine.simulate）。
+    命名空间中预置 np / pd / math。策略代码与服务同权限执行，只应运行可信的代码
+
+    Returns:
+        回调名 -> 函数
+    """
+    namespace = {"__name__": "strategy", "np": np, "pd": pd, "math": math}
+    try:
+        exec(compile(code, "<strategy>", "exec"), namespace)
+    except SyntaxError as exc:
+        raise ValueError(f"策略代码语法错误: {exc}") from exc
+    callbacks = {name: namespace.get(name) for name in EVENT_CALLBACKS + ("signals",)}
+    callbacks = {name: func for name, func in callbacks.items() if callable(func)}
+    if "on_bar" not in callbacks and "signals" not in callbacks:
+        raise ValueError("策略代码必须定义 on_bar(context, bar) 或 signals(bars, params)")
+    return callbacks
+
+
+def run_event_backtest(
+    db: Session,
+    strategy: Strategy,
+    symbol: str,
+    period: str = "1d",
+    start_date=None,
+    end_date=None,
+    params: Optional[Dict[str, Any]] = None,
+    persist: bool = True,
+    name: Optional[str] = None,
+    annualization: Optional[float] = None,
+    **options
+) -> BacktestOutput:
+    """
+    用策略代码回测并保存结果
+
+    Args:
+        db: 数据库会话
+        strategy: 策略（使用其 code 和 parameters）
+        symbol: 交易对符号
+        period: K线周期
+        start_date: 开始时间
+        end_date: 结束时间
+        params: 覆盖策略默认参数
+        persist: 是否写入 backtest_results / trade_records
+        name: 回测名称
+        annualization: 每年K线根数
+        **options: EventBacktest 的账户与撮合参数
+
+    Returns:
+        回测结果，persist 时 statistics 中含 backtest_id
+    """
+    feed = BarFeed.from_db(db, symbol, period, start_date, end_date)
+    if not len(feed):
+        raise ValueError(f"{symbol} 在该时间范围内没有 {period} K线")
+    callbacks = load_strategy_code(strategy.code)
+    if "on_bar" not in callbacks:
+        raise ValueError("事件驱动回测的策略代码必须定义 on_bar(context, bar)")
+    merged = {**(strategy.parameters or {}), **(params or {})}
+    handlers = {name: callbacks[name] for name in EVENT_CALLBACKS if name in callbacks}
+    engine = EventBacktest(feed, params=merged, **handlers, **options)
+    output = engine.run(annualization)
+    if persist:
+        parameters = {"period": period, "engine": "event", "params": merged,
+                      **{key: value for key, value in options.items() if isinstance(value, (int, float, bool, str))}}
+        result = save_backtest(db, output, symbol, strategy.id, name or f"{strategy.name} {symbol}", parameters)
+        db.commit()
+        output.statistics["backtest_id"] = result.id
+    return output
@@ -0,0 +1,416 @@
+"""
+进程内行情事件总线
+采集和实时处理路径发布K线定稿、行情更新、盘口变更事件，订阅者在事件循环中以独立协程消费，
+每个订阅者有自己的有界队列和溢出策略，慢订阅者不会拖慢发布方或其他订阅者；
+可选的多进程转发把事件送到本机工作进程
+"""
+
+import asyncio
+import inspect
+import multiprocessing
+import queue
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+from app.core.logging_config import get_data_logger_instance
+from app.core.metrics import metrics_registry
+
+data_logger = get_data_logger_instance()
+
+# 队列已满时的处理方式:
+# drop_oldest 丢弃最早的事件；drop_newest 丢弃新事件；
+# coalesce 同一键（如交易对）只保留最新事件，队列满时丢弃最早的键；
+# block 通过 publish_async 发布时等待队列腾出空间（同步 publish 时按 drop_newest 处理）
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "coalesce", "block")
+
+
+@dataclass
+class MarketEvent:
+    """行情事件基类"""
+    symbol: str
+    timestamp: datetime
+
+    def key(self) -> Any:
+        """合并键，coalesce 策略下同一键只保留最新事件"""
+        return self.symbol
+
+
+@dataclass
+class BarClosed(MarketEvent):
+    """K线定稿（revision 大于0表示迟到成交修订后的再次输出）"""
+    period: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    revision: int = 0
+
+    def key(self) -> Any:
+        return self.symbol, self.period, self.timestamp
+
+
+@dataclass
+class TickerUpdated(MarketEvent):
+    """24小时行情更新"""
+    last_price: float
+    price_change: float
+    price_change_percent: float
+    high: float
+    low: float
+    volume: float
+    turnover: float
+
+
+@dataclass
+class BookChanged(MarketEvent):
+    """盘口变更（只携带一档，完整盘口从 order_book_manager 读取）"""
+    last_update_id: int
+    best_bid: Optional[Tuple[float, float]]
+    best_ask: Optional[Tuple[float, float]]
+    snapshot: bool = False
+
+
+# 事件处理函数，可以是普通函数或协程函数
+Handler = Callable[[MarketEvent], Any]
+
+
+class Subscription:
+    """订阅者：有界队列 + 消费协程"""
+
+    def __init__(self, name: str, handler: Handler, event_types: Tuple[Type[MarketEvent], ...],
+                 maxsize: int, overflow: str):
+        self.name = name
+        self.handler = handler
+        self.event_types = event_types
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self._items = OrderedDict() if overflow == "coalesce" else deque()
+        self._ready: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.handler_seconds = 0.0
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        if self._items:
+            self._ready.set()
+        self._task = loop.create_task(self._run())
+
+    def offer(self, event: MarketEvent) -> bool:
+        """
+        放入事件（不等待），队列已满时按溢出策略处理
+
+        Returns:
+            事件是否进入队列
+        """
+        self.received += 1
+        items = self._items
+        if self.overflow == "coalesce":
+            key = event.key()
+            if key in items:
+                items[key] = event
+                self.coalesced += 1
+                return True
+            if len(items) >= self.maxsize:
+                items.popitem(last=False)
+                self.dropped += 1
+            items[key] = event
+        else:
+            if len(items) >= self.maxsize:
+                if self.overflow != "drop_oldest":
+                    self.dropped += 1
+                    return False
+                items.popleft()
+                self.dropped += 1
+            items.append(event)
+
+        if self._ready is not None:
+            self._ready.set()
+        return True
+
+    async def offer_wait(self, event: MarketEvent) -> bool:
+        """放入事件，block 策略下队列已满时等待消费协程腾出空间"""
+        if self.overflow == "block":
+            while len(self._items) >= self.maxsize and self._task is not None and not self._task.done():
+                self._space.clear()
+                await self._space.wait()
+        return self.offer(event)
+
+    async def _run(self) -> None:
+        """消费协程"""
+        while True:
+            await self._ready.wait()
+            processed = 0
+            while self._items:
+                if self.overflow == "coalesce":
+                    _, event = self._items.popitem(last=False)
+                else:
+                    event = self._items.popleft()
+                self._space.set()
+
+                start = time.perf_counter()
+                try:
+                    result = self.handler(event)
+                    if inspect.isawaitable(result):
+                        await result
+                    self.delivered += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    data_logger.error(f"事件订阅者处理失败 - {self.name} - {type(event).__name__} - {str(e)}")
+                self.handler_seconds += time.perf_counter() - start
+
+                # 同步处理函数连续处理一批后让出事件循环
+                processed += 1
+                if processed % 100 == 0:
+                    await asyncio.sleep(0)
+            self._ready.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "event_types": [event_type.__name__ for event_type in self.event_types],
+            "overflow": self.overflow,
+            "maxsize": self.maxsize,
+            "queued": len(self._items),
+            "received": self.received,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "handler_seconds": round(self.handler_seconds, 6)
+        }
+
+
+class EventBus:
+    """进程内发布/订阅总线"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.subscriptions: List[Subscription] = []
+        self.published: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, name: str, handler: Handler,
+                  event_types: Sequence[Type[MarketEvent]] = (MarketEvent,),
+                  maxsize: int = 1000, overflow: str = "drop_oldest") -> Subscription:
+        """
+        注册订阅者
+
+        Args:
+            name: 订阅者名称（用于指标和日志）
+            handler: 事件处理函数（普通函数或协程函数），在订阅者自己的协程中依次调用
+            event_types: 订阅的事件类型（含子类）
+            maxsize: 队列容量
+            overflow: 队列已满时的处理方式，见 OVERFLOW_POLICIES
+
+        Returns:
+            订阅对象，用于取消订阅和查看统计
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"不支持的溢出策略: {overflow}")
+        if maxsize <= 0:
+            raise ValueError("队列容量必须大于0")
+        subscription = Subscription(name, handler, tuple(event_types), maxsize, overflow)
+        self.subscriptions.append(subscription)
+        self._ensure_started()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """取消订阅，队列中未处理的事件被丢弃"""
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        if subscription._task is not None:
+            subscription._task.cancel()
+
+    def wants(self, event_type: Type[MarketEvent]) -> bool:
+        """是否有订阅者订阅该事件类型（发布方可据此跳过构造事件）"""
+        return any(issubclass(event_type, sub.event_types) for sub in self.subscriptions)
+
+    def _ensure_started(self) -> bool:
+        """在当前事件循环中启动订阅者协程，没有运行中的事件循环时返回False"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if loop is not self._loop:
+            self._loop = loop
+            for sub in self.subscriptions:
+                sub._start(loop)
+        else:
+            for sub in self.subscriptions:
+                if sub._task is None or sub._task.done():
+                    sub._start(loop)
+        return True
+
+    def publish(self, event: MarketEvent) -> int:
+        """
+        发布事件（不等待订阅者），可在其他线程中调用
+
+        Returns:
+            事件进入的订阅者队列数（跨线程转交时为0）
+        """
+        if not self._ensure_started() and self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self.publish, event)
+            return 0
+        name = type(event).__name__
+        self.published[name] = self.published.get(name, 0) + 1
+        return sum(sub.offer(event) for sub in self.subscriptions if isinstance(event, sub.event_types))
+
+    async def publish_async(self, event: MarketEvent) -> int:
+        """发布事件，block 策略的订阅者队列已满时等待"""
+        self._ensure_started()
+        name = type(event).__name__
+        self.published[name] = self.published.get(name, 0) + 1
+        accepted = 0
+        for sub in list(self.subscriptions):
+            if isinstance(event, sub.event_types):
+                accepted += await sub.offer_wait(event)
+        return accepted
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """等待订阅者处理完队列中的事件后停止（服务关闭时调用）"""
+        deadline = time.monotonic() + timeout
+        while any(sub._items for sub in self.subscriptions if sub._task is not None and not sub._task.done()):
+            if time.monotonic() >= deadline:
+                data_logger.warning(f"事件总线关闭超时，丢弃未处理事件 - {self.name}")
+                break
+            await asyncio.sleep(0.01)
+        for sub in self.subscriptions:
+            if sub._task is not None:
+                sub._task.cancel()
+                sub._task = None
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        """总线统计信息"""
+        return {
+            "name": self.name,
+            "published": dict(self.published),
+            "subscriptions": [sub.stats() for sub in self.subscriptions]
+        }
+
+    def collect(self):
+        """导出Prometheus指标族"""
+        published = [({"bus": self.name, "event": name}, count) for name, count in self.published.items()]
+        per_sub = {
+            "delivered": [], "dropped": [], "coalesced": [], "errors": [], "queued": [], "handler_seconds": []
+        }
+        for sub in self.subscriptions:
+            labels = {"bus": self.name, "subscriber": sub.name}
+            per_sub["delivered"].append((labels, sub.delivered))
+            per_sub["dropped"].append((labels, sub.dropped))
+            per_sub["coalesced"].append((labels, sub.coalesced))
+            per_sub["errors"].append((labels, sub.errors))
+            per_sub["queued"].append((labels, len(sub._items)))
+            per_sub["handler_seconds"].append((labels, sub.handler_seconds))
+        return [
+            ("event_bus_published_total", "counter", "发布的事件数", published),
+            ("event_bus_delivered_total", "counter", "订阅者处理完成的事件数", per_sub["delivered"]),
+            ("event_bus_dropped_total", "counter", "队列已满被丢弃的事件数", per_sub["dropped"]),
+            ("event_bus_coalesced_total", "counter", "被同键新事件替换的事件数", per_sub["coalesced"]),
+            ("event_bus_handler_errors_total", "counter", "订阅者处理失败次数", per_sub["errors"]),
+            ("event_bus_handler_seconds_total", "counter", "订阅者处理事件累计耗时（秒）", per_sub["handler_seconds"]),
+            ("event_bus_queue_depth", "gauge", "订阅者队列中待处理的事件数", per_sub["queued"]),
+        ]
+
+
+class ProcessTransport:
+    """
+    多进程转发：作为订阅者把事件放入 multiprocessing 队列（pickle序列化），
+    工作进程用 iter_process_events 或 relay_process_events 读取
+    """
+
+    def __init__(self, bus: EventBus, event_types: Sequence[Type[MarketEvent]] = (MarketEvent,),
+                 maxsize: int = 10000, context: Optional[str] = None, name: str = "process"):
+        """
+        Args:
+            bus: 事件来源总线
+            event_types: 转发的事件类型
+            maxsize: 进程间队列容量，队列满时丢弃新事件
+            context: multiprocessing 启动方式（fork/spawn/forkserver），默认使用平台默认值
+            name: 订阅者名称
+        """
+        self.bus = bus
+        self.queue = multiprocessing.get_context(context).Queue(maxsize)
+        self.sent = 0
+        self.dropped = 0
+        # 转发使用 put_nowait，进程间队列满时丢弃新事件，不阻塞事件循环
+        self.subscription = bus.subscribe(name, self._forward, event_types, maxsize=maxsize, overflow="drop_oldest")
+
+    def _forward(self, event: MarketEvent) -> None:
+        try:
+            self.queue.put_nowait(event)
+            self.sent += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """停止转发并通知工作进程结束"""
+        self.bus.unsubscribe(self.subscription)
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self.queue.close()
+
+
+def iter_process_events(event_queue, timeout: Optional[float] = None) -> Iterator[MarketEvent]:
+    """
+    在工作进程中读取转发的事件
+
+    Args:
+        event_queue: ProcessTransport.queue
+        timeout: 等待单个事件的超时（秒），超时或收到结束标记后返回
+    """
+    while True:
+        try:
+            event = event_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        if event is None:
+            return
+        yield event
+
+
+async def relay_process_events(event_queue, bus: EventBus) -> None:
+    """在工作进程的事件循环中把转发的事件发布到本进程的总线，收到结束标记后返回"""
+    loop = asyncio.get_running_loop()
+    while True:
+        event = await loop.run_in_executor(None, event_queue.get)
+        if event is None:
+            return
+        bus.publish(event)
+
+
+# 全局行情事件总线
+market_event_bus = EventBus("market")
+metrics_registry.register_collector(market_event_bus.collect)
+
+
+def publish_book_changed(book, delta) -> None:
+    """盘口变更监听（注册到 order_book_manager），有订阅者时发布 BookChanged"""
+    if not market_event_bus.wants(BookChanged):
+        return
+    market_event_bus.publish(BookChanged(
+        symbol=book.symbol,
+        timestamp=book.timestamp or datetime.utcnow(),
+        last_update_id=book.last_update_id,
+        best_bid=book.best_bid(),
+        best_ask=book.best_ask(),
+        snapshot=delta is None
+    ))
@@ -0,0 +1,379 @@
+"""
+截面因子计算
+因子定义为 交易对 × 时间 矩阵上的向量化运算（时间序列算子沿 axis=1，截面算子沿 axis=0），
+面板由 panel_loader 一次批量加载；截面处理依次为去极值、行业中性化、标准化，结果按日写入 factor_value 表
+"""
+
+import warnings
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import Session
+
+from app.models.market import FactorValue, MarketData, SymbolIndustry
+from app.services.indicators import spec_key
+from app.services.panel_loader import Panel, load_panel
+from app.services.rolling import rolling_max, rolling_median, rolling_min
+
+# 因子参数: 名称和参数，如 ("momentum", (20, 0))
+FactorSpec = Tuple[str, Tuple[float, ...]]
+
+# 年化使用的交易日数
+TRADING_DAYS = 252
+
+
+# ---------- 时间序列算子（沿时间轴，窗口不足时为NaN） ----------
+
+def delay(x: np.ndarray, n: int = 1) -> np.ndarray:
+    """n期前的值"""
+    result = np.full(x.shape, np.nan, dtype=np.float64)
+    if n < x.shape[1]:
+        result[:, n:] = x[:, :x.shape[1] - n]
+    return result
+
+
+def pct_change(x: np.ndarray, n: int = 1) -> np.ndarray:
+    """n期收益率"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return x / delay(x, n) - 1.0
+
+
+def _rolling(x: np.ndarray, n: int):
+    return pd.DataFrame(x.T).rolling(n, min_periods=n)
+
+
+def ts_mean(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动均值"""
+    return np.ascontiguousarray(_rolling(x, n).mean().to_numpy().T)
+
+
+def ts_sum(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动求和"""
+    return np.ascontiguousarray(_rolling(x, n).sum().to_numpy().T)
+
+
+def ts_std(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动样本标准差"""
+    return np.ascontiguousarray(_rolling(x, n).std().to_numpy().T)
+
+
+def ts_max(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动最大值"""
+    return rolling_max(x, n)
+
+
+def ts_min(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动最小值"""
+    return rolling_min(x, n)
+
+
+def ts_median(x: np.ndarray, n: int) -> np.ndarray:
+    """滚动中位数"""
+    return rolling_median(x, n)
+
+
+# ---------- 截面算子（每个时间点在交易对之间计算，忽略NaN） ----------
+
+def cs_rank(x: np.ndarray) -> np.ndarray:
+    """截面百分位排名，取值 (0, 1]"""
+    return pd.DataFrame(x).rank(axis=0, pct=True).to_numpy()
+
+
+def cs_zscore(x: np.ndarray) -> np.ndarray:
+    """截面标准化，截面标准差为0时结果为0"""
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(x, axis=0)
+        std = np.nanstd(x, axis=0)
+        result = (x - mean) / std
+    result[:, std == 0] = np.where(np.isnan(x[:, std == 0]), np.nan, 0.0)
+    return result
+
+
+def winsorize(x: np.ndarray, method: str = "mad", k: float = 5.0,
+              lower: float = 0.01, upper: float = 0.99) -> np.ndarray:
+    """
+    截面去极值
+
+    Args:
+        x: 因子矩阵
+        method: mad 为截到 中位数 ± k × 1.4826 × MAD；quantile 为截到 [lower, upper] 分位数
+        k: MAD倍数
+        lower: 下分位数
+        upper: 上分位数
+
+    Returns:
+        去极值后的矩阵
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if method == "mad":
+            median = np.nanmedian(x, axis=0)
+            mad = np.nanmedian(np.abs(x - median), axis=0) * 1.4826
+            low, high = median - k * mad, median + k * mad
+        elif method == "quantile":
+            low, high = np.nanquantile(x, [lower, upper], axis=0)
+        else:
+            raise ValueError(f"不支持的去极值方法: {method}")
+    return np.clip(x, low, high)
+
+
+def neutralize(x: np.ndarray, groups: Sequence) -> np.ndarray:
+    """
+    行业中性化：每个时间点减去所属行业的截面均值（等价于对行业哑变量回归取残差）
+
+    Args:
+        x: 因子矩阵
+        groups: 每个交易对的行业，长度与矩阵行数相同；行业未知的交易对归为同一组
+
+    Returns:
+        中性化后的矩阵
+    """
+    _, codes = np.unique(np.asarray([str(g) if g is not None else "" for g in groups]), return_inverse=True)
+    onehot = np.zeros((codes.max() + 1, len(codes)))
+    onehot[codes, np.arange(len(codes))] = 1.0
+    valid = ~np.isnan(x)
+    sums = onehot @ np.where(valid, x, 0.0)
+    counts = onehot @ valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return x - means[codes]
+
+
+# ---------- 因子定义 ----------
+
+def momentum(close: np.ndarray, n: int = 20, skip: int = 0) -> np.ndarray:
+    """动量：跳过最近 skip 天后的 n 日收益率"""
+    return pct_change(delay(close, skip) if skip else close, n)
+
+
+def reversal(close: np.ndarray, n: int = 5) -> np.ndarray:
+    """短期反转：n 日收益率取负"""
+    return -pct_change(close, n)
+
+
+def volatility(close: np.ndarray, n: int = 20) -> np.ndarray:
+    """波动率：n 日日收益率的年化标准差"""
+    return ts_std(pct_change(close, 1), n) * np.sqrt(TRADING_DAYS)
+
+
+def turnover(close: np.ndarray, volume: np.ndarray, amount: np.ndarray, n: int = 20) -> np.ndarray:
+    """换手：n 日平均成交额取对数，成交额缺失时用 收盘价 × 成交量 估算"""
+    amount = np.where(np.isnan(amount), close * volume, amount)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.log1p(ts_mean(amount, n))
+
+
+# 因子注册表: 名称 -> (计算函数, 面板字段, 默认参数)
+FACTORS = {
+    "momentum": (momentum, ("close",), (20, 0)),
+    "reversal": (reversal, ("close",), (5,)),
+    "volatility": (volatility, ("close",), (20,)),
+    "turnover": (turnover, ("close", "volume", "turnover"), (20,)),
+}
+
+
+def parse_factor_specs(text: str) -> List[FactorSpec]:
+    """
+    解析因子参数字符串
+
+    Args:
+        text: 逗号分隔的因子，每项为 名称[:参数...]，如 "momentum:20,momentum:60:5,volatility"
+
+    Returns:
+        去重后的规范化因子参数列表
+    """
+    specs = []
+    for item in text.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        name, *raw = item.split(":")
+        if name not in FACTORS:
+            raise ValueError(f"不支持的因子: {name}")
+        defaults = FACTORS[name][2]
+        if len(raw) > len(defaults):
+            raise ValueError(f"因子参数过多: {item}")
+        try:
+            params = tuple(float(p) for p in raw) + tuple(float(p) for p in defaults[len(raw):])
+        except ValueError:
+            raise ValueError(f"无效的因子参数: {item}")
+        if any(p < 0 or not p.is_integer() for p in params) or params[0] < 1:
+            raise ValueError(f"窗口长度必须为正整数: {item}")
+        spec = (name, params)
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def lookback_bars(specs: Sequence[FactorSpec]) -> int:
+    """计算首个交易日的因子值需要的前置K线数"""
+    bars = 0
+    for name, params in specs:
+        # 各因子窗口之和再加1根计算收益率
+        bars = max(bars, int(sum(params)) + 1)
+    return bars
+
+
+def compute_factor(spec: FactorSpec, panel: Panel) -> np.ndarray:
+    """计算单个原始因子矩阵，当天没有K线（停牌）的位置为NaN"""
+    name, params = spec
+    func, fields, _ = FACTORS[name]
+    args = [panel[field] for field in fields] + [int(p) for p in params]
+    values = func(*args)
+    values[~panel.observed] = np.nan
+    return values
+
+
+def process_factor(values: np.ndarray, industries: Optional[Sequence] = None,
+                   winsorize_method: Optional[str] = "mad", standardize: Optional[str] = "zscore") -> np.ndarray:
+    """
+    截面处理：去极值 -> 行业中性化 -> 标准化
+
+    Args:
+        values: 原始因子矩阵
+        industries: 各交易对的行业，为None时不做中性化
+        winsorize_method: 去极值方法（mad/quantile），为None时不处理
+        standardize: zscore / rank，为None时不处理
+
+    Returns:
+        处理后的矩阵
+    """
+    if winsorize_method:
+        values = winsorize(values, winsorize_method)
+    if industries is not None:
+        values = neutralize(values, industries)
+    if standardize == "zscore":
+        values = cs_zscore(values)
+    elif standardize == "rank":
+        values = cs_rank(values)
+    elif standardize:
+        raise ValueError(f"不支持的标准化方法: {standardize}")
+    return values
+
+
+def load_industries(db: Session, symbols: Sequence[str]) -> List[Optional[str]]:
+    """读取交易对的行业分类，未登记的为None"""
+    mapping = {}
+    for i in range(0, len(symbols), 500):
+        chunk = list(symbols[i:i + 500])
+        mapping.update(db.query(SymbolIndustry.symbol, SymbolIndustry.industry).filter(
+            SymbolIndustry.symbol.in_(chunk)).all())
+    return [mapping.get(symbol) for symbol in symbols]
+
+
+def default_universe(db: Session, period: str = "1d") -> List[str]:
+    """默认股票池：有该周期K线的全部A股"""
+    rows = db.query(MarketData.symbol).distinct().filter(
+        MarketData.period == period,
+        or_(MarketData.symbol.like("%.SH"), MarketData.symbol.like("%.SZ"))
+    ).all()
+    return sorted(row[0] for row in rows)
+
+
+def save_factor_values(db: Session, factor: str, symbols: Sequence[str],
+                       dates: np.ndarray, values: np.ndarray, batch_size: int = 10000) -> int:
+    """
+    写入因子值，先删除同一因子在该日期范围内这些交易对的旧值
+
+    Args:
+        db: 数据库会话
+        factor: 因子规范名
+        symbols: 矩阵行对应的交易对
+        dates: 矩阵列对应的交易日
+        values: 因子矩阵，NaN不写入
+        batch_size: 每批插入行数
+
+    Returns:
+        写入行数
+    """
+    if not len(dates):
+        return 0
+    first, last = pd.Timestamp(dates[0]).to_pydatetime(), pd.Timestamp(dates[-1]).to_pydatetime()
+    for i in range(0, len(symbols), 500):
+        db.query(FactorValue).filter(
+            FactorValue.factor == factor,
+            FactorValue.trade_date >= first,
+            FactorValue.trade_date <= last,
+            FactorValue.symbol.in_(list(symbols[i:i + 500]))
+        ).delete(synchronize_session=False)
+
+    rows_idx, cols_idx = np.nonzero(~np.isnan(values))
+    day_list = [pd.Timestamp(d).to_pydatetime() for d in dates]
+    now = datetime.utcnow()
+    total = len(rows_idx)
+    for start in range(0, total, batch_size):
+        r, c = rows_idx[start:start + batch_size], cols_idx[start:start + batch_size]
+        db.connection().execute(insert(FactorValue.__table__), [
+            {"symbol": symbols[i], "trade_date": day_list[j], "factor": factor,
+             "value": float(values[i, j]), "created_at": now}
+            for i, j in zip(r.tolist(), c.tolist())
+        ])
+    return total
+
+
+def compute_daily_factors(
+    db: Session,
+    specs: Sequence[FactorSpec],
+    symbols: Optional[Sequence[str]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    neutralize_industry: bool = True,
+    winsorize_method: Optional[str] = "mad",
+    standardize: Optional[str] = "zscore",
+    persist: bool = True
+) -> dict:
+    """
+    计算并保存日频因子
+
+    Args:
+        db: 数据库会话
+        specs: 规范化的因子参数
+        symbols: 股票池，默认为全部A股
+        start_date: 第一个输出交易日，默认为 end_date 前30天
+        end_date: 最后一个输出交易日，默认为今天
+        neutralize_industry: 是否行业中性化（行业见 symbol_industry 表）
+        winsorize_method: 去极值方法
+        standardize: 标准化方法
+        persist: 是否写入数据库
+
+    Returns:
+        计算摘要及各因子矩阵（values: 因子规范名 -> 矩阵）
+    """
+    symbols = list(symbols) if symbols else default_universe(db)
+    end_date = end_date or datetime.utcnow()
+    start_date = start_date or end_date - timedelta(days=30)
+
+    # 前置K线按交易日折算自然日，留出节假日余量
+    lookback = lookback_bars(specs)
+    fields = sorted({field for name, _ in specs for field in FACTORS[name][1]})
+    panel = load_panel(db, symbols, fields, period="1d",
+                       start_time=start_date - timedelta(days=int(lookback * 1.6) + 20),
+                       end_time=end_date, ffill=True)
+
+    keep = panel.timestamps >= np.datetime64(start_date, "ms")
+    industries = load_industries(db, symbols) if neutralize_industry else None
+
+    results = {}
+    rows = 0
+    for spec in specs:
+        key = spec_key(spec)
+        values = process_factor(compute_factor(spec, panel), industries, winsorize_method, standardize)[:, keep]
+        results[key] = values
+        if persist:
+            rows += save_factor_values(db, key, symbols, panel.timestamps[keep], values)
+    if persist:
+        db.commit()
+
+    return {
+        "factors": list(results),
+        "symbols": len(symbols),
+        "dates": int(keep.sum()),
+        "rows": rows,
+        "timestamps": panel.timestamps[keep],
+        "symbol_list": symbols,
+        "values": results
+    }
@@ -0,0 +1,270 @@
+"""
+技术指标结果缓存
+按 (交易对, 周期, 指标参数) 缓存已计算的指标序列，总内存按字节数限制，超出时淘汰最久未使用的条目；
+请求的K线比缓存多出新K线时，只用缓存末尾的预热K线加上新K线重算尾部并追加，不整体失效
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics_registry
+from app.services.indicators import INDICATORS, IndicatorOutput, IndicatorSpec, compute_indicator, spec_key, warmup_bars
+
+# 每个条目除数组外的固定开销估算（字节）
+ENTRY_OVERHEAD = 512
+
+# 从计算起点的0开始累计的指标：返回时平移到请求的第一根K线为0，追加时接续缓存末值累计
+CUMULATIVE_INDICATORS = ("obv",)
+
+
+def _prefix_len(spec: IndicatorSpec) -> int:
+    """追加新K线时需要的前置K线数：累计类指标只需前一根K线确定方向，其余为预热长度"""
+    return 1 if spec[0] in CUMULATIVE_INDICATORS else warmup_bars([spec])
+
+
+def _to_ms(ts: datetime) -> int:
+    """时间戳转为UTC毫秒（与K线列式格式的 t 一致）"""
+    return int(ts.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+class _CacheEntry:
+    """单个指标序列：t 为K线时间（毫秒），outputs 与 t 逐根对齐，tail 为末尾若干根K线的输入列（尾部重算的预热）"""
+
+    __slots__ = ("t", "outputs", "tail", "nbytes")
+
+    def __init__(self, t: np.ndarray, outputs: IndicatorOutput, tail: Dict[str, np.ndarray]):
+        self.t = t
+        self.outputs = outputs
+        self.tail = tail
+        self.nbytes = (ENTRY_OVERHEAD + t.nbytes + sum(a.nbytes for a in outputs.values())
+                       + sum(a.nbytes for a in tail.values()))
+
+
+class IndicatorCache:
+    """技术指标结果缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_bars: int = 20000):
+        """
+        Args:
+            max_bytes: 缓存总内存上限（字节）
+            max_bars: 单个条目最多保留的K线根数，追加后超出时丢弃最早的部分
+        """
+        self.max_bytes = max_bytes
+        self.max_bars = max_bars
+        self._entries: "OrderedDict[Tuple[str, str, str], _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.extends = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bars_recomputed = 0
+
+    def get(self, symbol: str, period: str, spec: IndicatorSpec,
+            t: np.ndarray, columns: Dict[str, np.ndarray]) -> Optional[IndicatorOutput]:
+        """
+        读取与请求K线逐根对齐的指标序列
+
+        缓存覆盖全部请求K线时直接切片返回；缓存在请求范围内结束时用新K线重算尾部、追加到缓存后返回。
+        缓存的最后一根K线可能仍在形成中，其输入值变化时从这一根开始重算。
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            spec: 规范化的指标参数
+            t: 请求K线的时间（UTC毫秒，升序）
+            columns: 请求K线的输入列（open/high/low/close/volume）
+
+        Returns:
+            输出名 -> 与 t 等长的数组；缓存不能覆盖请求起点或时间序列不连续时返回None
+        """
+        key = (symbol, period, spec_key(spec))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None or not len(t):
+            return self._miss()
+
+        idx = int(np.searchsorted(entry.t, t[0]))
+        if idx == len(entry.t) or entry.t[idx] != t[0]:
+            return self._miss()
+        overlap = min(len(entry.t) - idx, len(t))
+        if not np.array_equal(entry.t[idx:idx + overlap], t[:overlap]):
+            return self._miss()
+
+        keep = len(entry.t)
+        if idx + overlap == keep:
+            last = overlap - 1
+            if any(columns[name][last] != entry.tail[name][-1] for name in entry.tail):
+                keep -= 1
+                overlap -= 1
+
+        if overlap == len(t):
+            with self._lock:
+                self.hits += 1
+        else:
+            entry = self._extend(key, spec, entry, keep, t[overlap:],
+                                 {name: columns[name][overlap:] for name in entry.tail})
+            idx = len(entry.t) - len(t)
+
+        output = {name: series[idx:idx + len(t)] for name, series in entry.outputs.items()}
+        if spec[0] in CUMULATIVE_INDICATORS:
+            output = {name: series - series[0] for name, series in output.items()}
+        return output
+
+    def put(self, symbol: str, period: str, spec: IndicatorSpec, t: np.ndarray,
+            output: IndicatorOutput, columns: Dict[str, np.ndarray]) -> None:
+        """
+        缓存新计算的指标序列
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            spec: 规范化的指标参数
+            t: 输出对应的K线时间（UTC毫秒，升序）
+            output: 输出名 -> 与 t 等长的数组
+            columns: 计算使用的输入列，可以比 t 多出前置的预热K线
+        """
+        if not len(t):
+            return
+        # 多保留一根，末根被修订时仍有足够的前置K线
+        tail_len = _prefix_len(spec) + 1
+        inputs = INDICATORS[spec[0]][1]
+        entry = _CacheEntry(
+            np.array(t, dtype=np.int64),
+            {name: np.array(series[-len(t):], dtype=np.float64) for name, series in output.items()},
+            {name: np.array(columns[name][-tail_len:], dtype=np.float64) for name in inputs}
+        )
+        self._store((symbol, period, spec_key(spec)), entry)
+
+    def on_bars_written(self, rows: List[dict]) -> None:
+        """
+        K线写入后的回调：早于缓存末根的K线被改写时使该序列的缓存失效
+        （末根及之后的K线由读取时的比对和追加处理）
+
+        Args:
+            rows: 写入的K线行，含 symbol/period/timestamp
+        """
+        earliest: Dict[Tuple[str, str], int] = {}
+        for row in rows:
+            series = (row["symbol"], row["period"])
+            ts = _to_ms(row["timestamp"])
+            if series not in earliest or ts < earliest[series]:
+                earliest[series] = ts
+        if not earliest:
+            return
+
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if key[:2] in earliest and earliest[key[:2]] < entry.t[-1]]
+            for key in stale:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self.invalidations += len(stale)
+
+    def invalidate(self, symbol: Optional[str] = None, period: Optional[str] = None) -> None:
+        """清除缓存，不指定参数时清空全部"""
+        with self._lock:
+            stale = [key for key in self._entries
+                     if symbol is None or (key[0] == symbol and (period is None or key[1] == period))]
+            for key in stale:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self.invalidations += len(stale)
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _extend(self, key: Tuple[str, str, str], spec: IndicatorSpec, entry: _CacheEntry,
+                keep: int, new_t: np.ndarray, new_columns: Dict[str, np.ndarray]) -> _CacheEntry:
+        """保留缓存的前 keep 根，用末尾预热K线和新K线重算尾部并追加"""
+        cumulative = spec[0] in CUMULATIVE_INDICATORS
+        tail_len = _prefix_len(spec) + 1
+        n_prefix = tail_len - 1
+        drop = len(entry.t) - keep
+        prefix = {name: tail[:len(tail) - drop][-n_prefix:] if n_prefix else tail[:0]
+                  for name, tail in entry.tail.items()}
+        n_prefix = len(next(iter(prefix.values())))
+        columns = {name: np.concatenate((prefix[name], new_columns[name])) for name in prefix}
+        output = compute_indicator(spec, columns)
+        if cumulative and n_prefix and keep:
+            output = {name: series + (entry.outputs[name][keep - 1] - series[n_prefix - 1])
+                      for name, series in output.items()}
+
+        t = np.concatenate((entry.t[:keep], new_t))
+        outputs = {name: np.concatenate((entry.outputs[name][:keep], series[n_prefix:]))
+                   for name, series in output.items()}
+        if len(t) > self.max_bars:
+            t = t[-self.max_bars:].copy()
+            outputs = {name: series[-self.max_bars:].copy() for name, series in outputs.items()}
+        tail = {name: column[-tail_len:].copy() for name, column in columns.items()}
+
+        extended = _CacheEntry(t, outputs, tail)
+        self._store(key, extended, extended=len(new_t))
+        return extended
+
+    def _store(self, key: Tuple[str, str, str], entry: _CacheEntry, extended: int = 0) -> None:
+        """写入条目并按字节上限淘汰最久未使用的条目"""
+        with self._lock:
+            if extended:
+                self.extends += 1
+                self.bars_recomputed += extended
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.extends + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "extends": self.extends,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.extends) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "bars_recomputed": self.bars_recomputed
+            }
+
+    def collect(self):
+        """导出Prometheus指标族"""
+        with self._lock:
+            lookups = [({"result": "hit"}, self.hits), ({"result": "extend"}, self.extends),
+                       ({"result": "miss"}, self.misses)]
+            return [
+                ("indicator_cache_lookups_total", "counter", "指标缓存查询次数（hit 直接命中，extend 追加重算尾部，miss 未命中）", lookups),
+                ("indicator_cache_evictions_total", "counter", "按内存上限淘汰的条目数", [({}, self.evictions)]),
+                ("indicator_cache_invalidations_total", "counter", "因历史K线改写而失效的条目数", [({}, self.invalidations)]),
+                ("indicator_cache_recomputed_bars_total", "counter", "追加时重算的新K线根数", [({}, self.bars_recomputed)]),
+                ("indicator_cache_entries", "gauge", "缓存条目数", [({}, len(self._entries))]),
+                ("indicator_cache_bytes", "gauge", "缓存占用内存估算（字节）", [({}, self.nbytes)]),
+            ]
+
+
+# 全局指标缓存，内存上限可通过环境变量配置
+indicator_cache = IndicatorCache(
+    max_bytes=int(os.getenv("INDICATOR_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    max_bars=int(os.getenv("INDICATOR_CACHE_MAX_BARS", "20000"))
+)
+metrics_registry.register_collector(indicator_cache.collect)
@@ -0,0 +1,460 @@
+"""
+增量技术指标状态
+实时行情每收到一根新K线只需在已有状态上递推一步（O(1)），不必对整段历史重新计算；
+递推算术与 indicators 中的批量实现（pandas ewm(adjust=False)）逐步一致，结果按位相同。
+状态可导出为检查点（可JSON序列化的字典）并从检查点恢复，便于进程重启后继续递推
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.services.indicators import INDICATORS, IndicatorSpec, spec_key
+from app.services.rolling import RollingMax, RollingMin
+
+# 单根K线: 列名（open/high/low/close/volume） -> 数值
+Bar = Mapping[str, float]
+
+NAN = float("nan")
+
+
+class _Ewm:
+    """
+    单序列递推平均，逐步复现 pandas ewm(alpha, adjust=False, ignore_na=False).mean() 的算术：
+    权重 a = 1 / (1 + com)，com = (1 - alpha) / alpha；以第一个有效值为初值，
+    新值与当前值相等时保持不变，否则 y = (f * y + a * x) / (f + a)，f 为上次有效值后累计的衰减
+    """
+
+    __slots__ = ("a", "f", "value", "old_wt")
+
+    def __init__(self, alpha: float, value: float = NAN):
+        self.a = 1.0 / (1.0 + (1.0 - alpha) / alpha)
+        self.f = 1.0 - self.a
+        self.value = value
+        self.old_wt = 1.0
+
+    def update(self, x: float) -> float:
+        value = self.value
+        if value != value:
+            # 尚无有效值，第一个有效值即为初值
+            if x == x:
+                self.value = x
+            return self.value
+        self.old_wt *= self.f
+        if x == x:
+            if value != x:
+                self.value = (self.old_wt * value + self.a * x) / (self.old_wt + self.a)
+            self.old_wt = 1.0
+        return self.value
+
+    def get_state(self) -> list:
+        return [self.value, self.old_wt]
+
+    def set_state(self, state: Sequence[float]) -> None:
+        self.value, self.old_wt = float(state[0]), float(state[1])
+
+
+class IndicatorState:
+    """增量指标状态基类，子类实现 _step 与状态导出/导入"""
+
+    # 输入列与输出名，与 indicators.INDICATORS 中的定义一致
+    inputs: Tuple[str, ...] = ("close",)
+    outputs: Tuple[str, ...] = ()
+
+    __slots__ = ("spec", "count")
+
+    def __init__(self, spec: IndicatorSpec):
+        self.spec = spec
+        self.count = 0
+
+    def update(self, bar: Bar) -> Dict[str, float]:
+        """
+        推入一根已收盘K线
+
+        Args:
+            bar: K线，须包含该指标的输入列
+
+        Returns:
+            输出名 -> 该K线上的指标值，预热不足时为NaN
+        """
+        values = self._step(*[float(bar[column]) for column in self.inputs])
+        self.count += 1
+        return dict(zip(self.outputs, values))
+
+    def preview(self, bar: Bar) -> Dict[str, float]:
+        """计算未收盘K线上的指标值，不改变状态"""
+        return restore_state(self.checkpoint()).update(bar)
+
+    def checkpoint(self) -> dict:
+        """导出检查点"""
+        return {"indicator": spec_key(self.spec), "count": self.count, "state": self._get_state()}
+
+    def _step(self, *values: float) -> Tuple[float, ...]:
+        raise NotImplementedError
+
+    def _get_state(self) -> list:
+        raise NotImplementedError
+
+    def _set_state(self, state: list) -> None:
+        raise NotImplementedError
+
+
+class EMAState(IndicatorState):
+    """EMA增量状态"""
+
+    outputs = ("ema",)
+    __slots__ = ("ewm",)
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        self.ewm = _Ewm(2.0 / (spec[1][0] + 1))
+
+    def _step(self, close: float) -> Tuple[float, ...]:
+        return (self.ewm.update(close),)
+
+    def _get_state(self) -> list:
+        return self.ewm.get_state()
+
+    def _set_state(self, state: list) -> None:
+        self.ewm.set_state(state)
+
+
+class MACDState(IndicatorState):
+    """MACD增量状态"""
+
+    outputs = ("dif", "dea", "hist")
+    __slots__ = ("fast", "slow", "signal")
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        fast, slow, signal = spec[1]
+        self.fast = _Ewm(2.0 / (fast + 1))
+        self.slow = _Ewm(2.0 / (slow + 1))
+        self.signal = _Ewm(2.0 / (signal + 1))
+
+    def _step(self, close: float) -> Tuple[float, ...]:
+        dif = self.fast.update(close) - self.slow.update(close)
+        dea = self.signal.update(dif)
+        return dif, dea, 2.0 * (dif - dea)
+
+    def _get_state(self) -> list:
+        return [self.fast.get_state(), self.slow.get_state(), self.signal.get_state()]
+
+    def _set_state(self, state: list) -> None:
+        self.fast.set_state(state[0])
+        self.slow.set_state(state[1])
+        self.signal.set_state(state[2])
+
+
+class RSIState(IndicatorState):
+    """RSI增量状态"""
+
+    outputs = ("rsi",)
+    __slots__ = ("prev_close", "gain", "loss")
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        self.prev_close = NAN
+        self.gain = _Ewm(1.0 / spec[1][0])
+        self.loss = _Ewm(1.0 / spec[1][0])
+
+    def _step(self, close: float) -> Tuple[float, ...]:
+        prev_close, self.prev_close = self.prev_close, close
+        if self.count == 0:
+            return (NAN,)
+        change = close - prev_close
+        gain = self.gain.update(max(change, 0.0))
+        loss = self.loss.update(max(-change, 0.0))
+        total = gain + loss
+        if total == 0.0:
+            return (NAN,)
+        return (100.0 * gain / total,)
+
+    def _get_state(self) -> list:
+        return [self.prev_close, self.gain.get_state(), self.loss.get_state()]
+
+    def _set_state(self, state: list) -> None:
+        self.prev_close = float(state[0])
+        self.gain.set_state(state[1])
+        self.loss.set_state(state[2])
+
+
+class KDJState(IndicatorState):
+    """KDJ增量状态"""
+
+    inputs = ("high", "low", "close")
+    outputs = ("k", "d", "j")
+    __slots__ = ("highest", "lowest", "k", "d")
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        n, m1, m2 = spec[1]
+        self.highest = RollingMax(int(n))
+        self.lowest = RollingMin(int(n))
+        # K、D 初值为50
+        self.k = _Ewm(1.0 / m1, 50.0)
+        self.d = _Ewm(1.0 / m2, 50.0)
+
+    def _step(self, high: float, low: float, close: float) -> Tuple[float, ...]:
+        highest = self.highest.update(high)
+        lowest = self.lowest.update(low)
+        span = highest - lowest
+        rsv = (close - lowest) / span * 100.0 if span > 0 else 50.0
+        k = self.k.update(rsv)
+        d = self.d.update(k)
+        return k, d, 3.0 * k - 2.0 * d
+
+    def _get_state(self) -> list:
+        return [self.highest.get_state(), self.lowest.get_state(), self.k.get_state(), self.d.get_state()]
+
+    def _set_state(self, state: list) -> None:
+        self.highest.set_state(state[0])
+        self.lowest.set_state(state[1])
+        self.k.set_state(state[2])
+        self.d.set_state(state[3])
+
+
+class ATRState(IndicatorState):
+    """ATR增量状态"""
+
+    inputs = ("high", "low", "close")
+    outputs = ("atr",)
+    __slots__ = ("prev_close", "ewm")
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        self.prev_close = NAN
+        self.ewm = _Ewm(1.0 / spec[1][0])
+
+    def _step(self, high: float, low: float, close: float) -> Tuple[float, ...]:
+        prev_close, self.prev_close = self.prev_close, close
+        tr = high - low
+        if prev_close == prev_close:
+            tr = max(tr, abs(high - prev_close), abs(low - prev_close))
+        return (self.ewm.update(tr),)
+
+    def _get_state(self) -> list:
+        return [self.prev_close, self.ewm.get_state()]
+
+    def _set_state(self, state: list) -> None:
+        self.prev_close = float(state[0])
+        self.ewm.set_state(state[1])
+
+
+class OBVState(IndicatorState):
+    """OBV增量状态"""
+
+    inputs = ("close", "volume")
+    outputs = ("obv",)
+    __slots__ = ("prev_close", "total")
+
+    def __init__(self, spec: IndicatorSpec):
+        super().__init__(spec)
+        self.prev_close = NAN
+        self.total = 0.0
+
+    def _step(self, close: float, volume: float) -> Tuple[float, ...]:
+        prev_close, self.prev_close = self.prev_close, close
+        change = close - prev_close if self.count else 0.0
+        direction = 1.0 if change > 0 else (-1.0 if change < 0 else 0.0)
+        if self.count == 0:
+            self.total = direction * volume
+        else:
+            self.total += direction * volume
+        return (self.total,)
+
+    def _get_state(self) -> list:
+        return [self.prev_close, self.total]
+
+    def _set_state(self, state: list) -> None:
+        self.prev_close, self.total = float(state[0]), float(state[1])
+
+
+# 支持增量计算的指标；ma/boll 为窗口类指标，pandas 的滚动求和带补偿项，直接用最近n根K线批量计算即可
+STATE_CLASSES = {
+    "ema": EMAState,
+    "macd": MACDState,
+    "rsi": RSIState,
+    "kdj": KDJState,
+    "atr": ATRState,
+    "obv": OBVState,
+}
+
+
+def create_state(spec: IndicatorSpec) -> IndicatorState:
+    """
+    创建指标的增量状态
+
+    Args:
+        spec: 规范化的指标参数（indicators.parse_indicator_specs 的结果）
+
+    Returns:
+        初始状态，推入的第一根K线对应批量计算结果的第一个元素
+    """
+    name = spec[0]
+    if name not in STATE_CLASSES:
+        raise ValueError(f"指标不支持增量计算: {name}")
+    return STATE_CLASSES[name](spec)
+
+
+def restore_state(checkpoint: Mapping) -> IndicatorState:
+    """从检查点恢复指标状态"""
+    name, *raw = checkpoint["indicator"].split(":")
+    defaults = INDICATORS[name][2] if name in INDICATORS else ()
+    if len(raw) != len(defaults):
+        raise ValueError(f"无效的指标检查点: {checkpoint['indicator']}")
+    state = create_state((name, tuple(float(p) for p in raw)))
+    state.count = int(checkpoint["count"])
+    state._set_state(checkpoint["state"])
+    return state
+
+
+class IndicatorStateStore:
+    """
+    按 (交易对, 周期) 维护一组指标的增量状态
+    只接受时间戳递增的已收盘K线，重复或乱序的K线被忽略
+    """
+
+    def __init__(self):
+        # (symbol, period) -> {"specs", "states", "last_time", "values"}
+        self._entries: Dict[Tuple[str, str], dict] = {}
+        self.bars_applied = 0
+        self.bars_ignored = 0
+
+    def track(self, symbol: str, period: str, specs: Sequence[IndicatorSpec]) -> None:
+        """开始跟踪指标，已跟踪的指标保持原状态"""
+        entry = self._entries.setdefault((symbol, period), {"states": {}, "last_time": None, "values": {}})
+        for spec in specs:
+            key = spec_key(spec)
+            if key not in entry["states"]:
+                entry["states"][key] = create_state(spec)
+
+    def tracked_specs(self, symbol: str, period: str) -> List[IndicatorSpec]:
+        """已跟踪的指标"""
+        entry = self._entries.get((symbol, period))
+        return [state.spec for state in entry["states"].values()] if entry else []
+
+    def missing_specs(self, symbol: str, period: str, specs: Sequence[IndicatorSpec]) -> List[IndicatorSpec]:
+        """尚未跟踪的指标"""
+        tracked = {spec_key(spec) for spec in self.tracked_specs(symbol, period)}
+        return [spec for spec in specs if spec_key(spec) not in tracked]
+
+    def rebuild(self, symbol: str, period: str, specs: Sequence[IndicatorSpec],
+                bars: Sequence[Tuple[object, Bar]]) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        重建 (交易对, 周期) 的全部状态并用历史K线预热，
+        已跟踪的序列加入新指标时调用，所有指标从同一段历史开始递推
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            specs: 全部指标
+            bars: 按时间升序的 (K线开始时间, K线) 列表，只包含已收盘K线
+
+        Returns:
+            最后一根K线上的指标值
+        """
+        self._entries.pop((symbol, period), None)
+        self.track(symbol, period, specs)
+        for timestamp, bar in bars:
+            self.update(symbol, period, timestamp, bar)
+        return self.latest(symbol, period)
+
+    def untrack(self, symbol: str, period: str) -> bool:
+        """停止跟踪"""
+        return self._entries.pop((symbol, period), None) is not None
+
+    def update(self, symbol: str, period: str, timestamp, bar: Bar) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        推入一根已收盘K线
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            timestamp: K线开始时间
+            bar: K线
+
+        Returns:
+            指标规范字符串 -> 输出值；未跟踪或K线被忽略时返回None
+        """
+        entry = self._entries.get((symbol, period))
+        if entry is None:
+            return None
+        if entry["last_time"] is not None and timestamp <= entry["last_time"]:
+            self.bars_ignored += 1
+            return None
+        values = {key: state.update(bar) for key, state in entry["states"].items()}
+        entry["last_time"] = timestamp
+        entry["values"] = values
+        self.bars_applied += 1
+        return values
+
+    def preview(self, symbol: str, period: str, bar: Bar) -> Optional[Dict[str, Dict[str, float]]]:
+        """计算未收盘K线上的指标值，不改变状态"""
+        entry = self._entries.get((symbol, period))
+        if entry is None:
+            return None
+        return {key: state.preview(bar) for key, state in entry["states"].items()}
+
+    def latest(self, symbol: str, period: str) -> Optional[Dict[str, Dict[str, float]]]:
+        """最近一根已收盘K线上的指标值"""
+        entry = self._entries.get((symbol, period))
+        return entry["values"] if entry else None
+
+    def attach(self, bus=None):
+        """
+        订阅事件总线上的收盘K线；丢弃K线会使递推状态出错，因此使用较大的队列和 block 策略
+
+        Returns:
+            订阅对象
+        """
+        from app.services.event_bus import BarClosed, market_event_bus
+
+        bus = bus or market_event_bus
+        return bus.subscribe("indicator_state", self.on_bar_closed, (BarClosed,), maxsize=10000, overflow="block")
+
+    def on_bar_closed(self, event) -> None:
+        """事件总线 BarClosed 回调"""
+        self.update(event.symbol, event.period, event.timestamp, {
+            "open": event.open, "high": event.high, "low": event.low,
+            "close": event.close, "volume": event.volume
+        })
+
+    def checkpoint(self) -> List[dict]:
+        """导出全部状态的检查点"""
+        result = []
+        for (symbol, period), entry in self._entries.items():
+            last_time = entry["last_time"]
+            result.append({
+                "symbol": symbol,
+                "period": period,
+                "last_time": last_time.isoformat() if hasattr(last_time, "isoformat") else last_time,
+                "states": [state.checkpoint() for state in entry["states"].values()]
+            })
+        return result
+
+    def restore(self, checkpoints: Sequence[Mapping]) -> None:
+        """从检查点恢复状态，覆盖同一 (交易对, 周期) 的现有状态"""
+        from datetime import datetime
+
+        for item in checkpoints:
+            last_time = item.get("last_time")
+            if isinstance(last_time, str):
+                last_time = datetime.fromisoformat(last_time)
+            states = [restore_state(checkpoint) for checkpoint in item["states"]]
+            self._entries[(item["symbol"], item["period"])] = {
+                "states": {spec_key(state.spec): state for state in states},
+                "last_time": last_time,
+                "values": {}
+            }
+
+    def stats(self) -> dict:
+        """统计信息"""
+        return {
+            "series": len(self._entries),
+            "states": sum(len(entry["states"]) for entry in self._entries.values()),
+            "bars_applied": self.bars_applied,
+            "bars_ignored": self.bars_ignored
+        }
+
+
+# 全局增量指标状态
+indicator_state_store = IndicatorStateStore()
@@ -0,0 +1,207 @@
+"""
+技术指标计算
+基于NumPy/pandas的向量化实现，对整段K线一次性计算，不在Python层逐根循环；
+递推类指标（EMA/SMA(X,N,M)）使用 pandas ewm(adjust=False)，与通达信/同花顺公式的递推方式一致
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.rolling import rolling_max, rolling_min
+
+# 指标参数: 规范化后的名称和参数，如 ("macd", (12, 26, 9))
+IndicatorSpec = Tuple[str, Tuple[float, ...]]
+
+# 单个指标的输出: 输出名 -> 与输入K线等长的数组，预热不足的位置为NaN
+IndicatorOutput = Dict[str, np.ndarray]
+
+
+def _ewm(x: np.ndarray, alpha: float) -> np.ndarray:
+    """递推平均 y[i] = alpha * x[i] + (1 - alpha) * y[i-1]，以第一个有效值为初值"""
+    return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def sma(close: np.ndarray, n: int = 5) -> np.ndarray:
+    """简单移动平均（MA）"""
+    return pd.Series(close).rolling(n).mean().to_numpy()
+
+
+def ema(close: np.ndarray, n: int = 12) -> np.ndarray:
+    """指数移动平均，alpha = 2 / (n + 1)"""
+    return _ewm(close, 2.0 / (n + 1))
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> IndicatorOutput:
+    """MACD：DIF = EMA(fast) - EMA(slow)，DEA = EMA(DIF, signal)，柱 = 2 * (DIF - DEA)"""
+    dif = ema(close, fast) - ema(close, slow)
+    dea = ema(dif, signal)
+    return {"dif": dif, "dea": dea, "hist": 2.0 * (dif - dea)}
+
+
+def rsi(close: np.ndarray, n: int = 14) -> np.ndarray:
+    """相对强弱指标（Wilder平滑，alpha = 1 / n），第一根K线为NaN"""
+    change = np.diff(close)
+    gain = _ewm(np.maximum(change, 0.0), 1.0 / n)
+    loss = _ewm(np.maximum(-change, 0.0), 1.0 / n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        value = 100.0 * gain / (gain + loss)
+    return np.concatenate(([np.nan], value))
+
+
+def kdj(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        n: int = 9, m1: int = 3, m2: int = 3) -> IndicatorOutput:
+    """
+    随机指标KDJ
+    RSV 使用最近n根（不足n根时用已有K线）的最高/最低价，区间为0时取50；
+    K = SMA(RSV, m1, 1)，D = SMA(K, m2, 1)，初值均为50；J = 3K - 2D
+    """
+    highest = rolling_max(high, n, min_periods=1)
+    lowest = rolling_min(low, n, min_periods=1)
+    span = highest - lowest
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rsv = np.where(span > 0, (close - lowest) / span * 100.0, 50.0)
+    k = _ewm(np.concatenate(([50.0], rsv)), 1.0 / m1)[1:]
+    d = _ewm(np.concatenate(([50.0], k)), 1.0 / m2)[1:]
+    return {"k": k, "d": d, "j": 3.0 * k - 2.0 * d}
+
+
+def boll(close: np.ndarray, n: int = 20, k: float = 2.0) -> IndicatorOutput:
+    """布林带：中轨为n日均线，上下轨为中轨 ± k 倍总体标准差"""
+    rolling = pd.Series(close).rolling(n)
+    mid = rolling.mean().to_numpy()
+    std = rolling.std(ddof=0).to_numpy()
+    return {"mid": mid, "upper": mid + k * std, "lower": mid - k * std}
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> np.ndarray:
+    """平均真实波幅（Wilder平滑），第一根K线的真实波幅为最高价减最低价"""
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return _ewm(tr, 1.0 / n)
+
+
+def obv(close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """能量潮：上涨K线累加成交量、下跌K线累减，从第一根K线的0开始"""
+    direction = np.sign(np.diff(close, prepend=close[:1]))
+    return np.cumsum(direction * volume)
+
+
+# 指标注册表: 名称 -> (计算函数, 输入列, 默认参数, 单输出时的输出名)
+INDICATORS = {
+    "ma": (sma, ("close",), (5,), "ma"),
+    "ema": (ema, ("close",), (12,), "ema"),
+    "macd": (macd, ("close",), (12, 26, 9), None),
+    "rsi": (rsi, ("close",), (14,), "rsi"),
+    "kdj": (kdj, ("high", "low", "close"), (9, 3, 3), None),
+    "boll": (boll, ("close",), (20, 2), None),
+    "atr": (atr, ("high", "low", "close"), (14,), "atr"),
+    "obv": (obv, ("close", "volume"), (), "obv"),
+}
+
+# 单个指标预热K线数上限
+MAX_WARMUP = 5000
+
+
+def _format_param(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def spec_key(spec: IndicatorSpec) -> str:
+    """指标参数的规范字符串，如 macd:12:26:9"""
+    name, params = spec
+    return ":".join([name] + [_format_param(p) for p in params])
+
+
+def parse_indicator_specs(text: str) -> List[IndicatorSpec]:
+    """
+    解析指标参数字符串
+
+    Args:
+        text: 逗号分隔的指标，每项为 名称[:参数1[:参数2...]]，省略的参数取默认值，如 "ma:5,ma:20,macd,kdj:9:3:3"
+
+    Returns:
+        去重后的规范化指标参数列表
+    """
+    specs = []
+    for item in text.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        name, *raw = item.split(":")
+        if name not in INDICATORS:
+            raise ValueError(f"不支持的指标: {name}")
+        defaults = INDICATORS[name][2]
+        if len(raw) > len(defaults):
+            raise ValueError(f"指标参数过多: {item}")
+        try:
+            params = tuple(float(p) for p in raw) + tuple(float(p) for p in defaults[len(raw):])
+        except ValueError:
+            raise ValueError(f"无效的指标参数: {item}")
+        # 除布林带倍数外的参数均为窗口长度
+        windows = params[:1] if name == "boll" else params
+        if any(p < 1 or not p.is_integer() for p in windows):
+            raise ValueError(f"窗口长度必须为正整数: {item}")
+        spec = (name, params)
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def warmup_bars(specs: Sequence[IndicatorSpec]) -> int:
+    """
+    计算首根输出K线的指标值所需的前置K线数
+    窗口类指标为窗口长度减一；递推类指标取初值权重衰减到约 e^-10 以下所需的长度
+    （RSI为比值，对平滑初值更敏感，取 e^-20）
+    """
+    warmup = 0
+    for name, params in specs:
+        if name in ("ma", "boll"):
+            bars = params[0] - 1
+        elif name == "ema":
+            bars = 5 * (params[0] + 1)
+        elif name == "macd":
+            bars = 5 * (max(params[0], params[1]) + 1) + 5 * (params[2] + 1)
+        elif name == "rsi":
+            bars = 20 * params[0]
+        elif name == "atr":
+            bars = 10 * params[0]
+        elif name == "kdj":
+            bars = params[0] - 1 + 10 * (params[1] + params[2])
+        else:
+            bars = 0
+        warmup = max(warmup, int(bars))
+    return min(warmup, MAX_WARMUP)
+
+
+def compute_indicator(spec: IndicatorSpec, columns: Dict[str, np.ndarray]) -> IndicatorOutput:
+    """
+    计算单个指标
+
+    Args:
+        spec: 规范化的指标参数
+        columns: K线列（open/high/low/close/volume），float64数组
+
+    Returns:
+        输出名 -> 数组
+    """
+    name, params = spec
+    func, inputs, _, output_name = INDICATORS[name]
+    args = [columns[column] for column in inputs]
+    args += [int(p) if float(p).is_integer() else p for p in params]
+    result = func(*args)
+    return {output_name: result} if output_name else result
+
+
+def compute_indicators(columns: Dict[str, np.ndarray], specs: Sequence[IndicatorSpec]) -> Dict[str, IndicatorOutput]:
+    """批量计算指标，返回 规范字符串 -> 输出"""
+    return {spec_key(spec): compute_indicator(spec, columns) for spec in specs}
+
+
+def to_json_series(values: np.ndarray) -> List:
+    """数组转为列表，NaN/Inf 转为 None"""
+    values = np.asarray(values, dtype=np.float64)
+    result = values.astype(object)
+    result[~np.isfinite(values)] = None
+    return result.tolist()
@@ -0,0 +1,143 @@
+"""
+K线热数据存储
+在进程内缓存每个 (symbol, period) 最近的一段连续K线，供增量刷新等高频读取直接命中内存
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# 单根K线在热存储中的紧凑表示: (timestamp, open, high, low, close, volume)
+Bar = Tuple[datetime, float, float, float, float, float]
+
+
+def normalize_timestamp(ts: datetime) -> datetime:
+    """将带时区的时间统一转换为UTC无时区时间（与数据库中的存储方式一致）"""
+    if ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+class _KlineSeries:
+    """单个 (symbol, period) 的K线序列，保存数据库中从 timestamps[0] 开始的完整后缀"""
+
+    __slots__ = ("timestamps", "bars", "version", "loaded_at")
+
+    def __init__(self, bars: List[Bar]):
+        self.bars = bars
+        self.timestamps = [bar[0] for bar in bars]
+        self.version = 0
+        self.loaded_at = time.monotonic()
+
+
+class KlineHotStore:
+    """K线热数据存储"""
+
+    def __init__(self, max_bars: int = 2000, ttl: float = 5.0):
+        """
+        Args:
+            max_bars: 每个序列最多保留的K线条数
+            ttl: 从数据库加载的序列在没有进程内写入时的有效期（秒）
+        """
+        self.max_bars = max_bars
+        self.ttl = ttl
+        self._series: Dict[Tuple[str, str], _KlineSeries] = {}
+        self._lock = threading.Lock()
+
+    def load(self, symbol: str, period: str, bars: List[Bar]) -> None:
+        """
+        用数据库中最近的一段K线（按时间升序）替换热存储中的序列
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            bars: 按时间升序排列的K线
+        """
+        bars = bars[-self.max_bars:]
+        with self._lock:
+            old = self._series.get((symbol, period))
+            series = _KlineSeries(bars)
+            if old is not None:
+                series.version = old.version + 1
+            self._series[(symbol, period)] = series
+
+    def upsert_bars(self, symbol: str, period: str, bars: List[Bar]) -> None:
+        """
+        将新写入数据库的K线同步到热存储
+        新K线追加到末尾，时间戳已存在的K线（如仍在形成中的最后一根）原地修订。
+        只更新已加载的序列，未加载的序列等待下次读取时从数据库加载。
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            bars: 新写入的K线
+        """
+        with self._lock:
+            series = self._series.get((symbol, period))
+            if series is None or not series.timestamps:
+                return
+
+            first_ts = series.timestamps[0]
+            for bar in bars:
+                ts = bar[0]
+                if ts < first_ts:
+                    # 早于热存储覆盖范围的历史数据不影响增量读取
+                    continue
+                if ts > series.timestamps[-1]:
+                    series.timestamps.append(ts)
+                    series.bars.append(bar)
+                    continue
+                idx = bisect_left(series.timestamps, ts)
+                if series.timestamps[idx] == ts:
+                    series.bars[idx] = bar
+                else:
+                    series.timestamps.insert(idx, ts)
+                    series.bars.insert(idx, bar)
+
+            overflow = len(series.bars) - self.max_bars
+            if overflow > 0:
+                del series.timestamps[:overflow]
+                del series.bars[:overflow]
+
+            series.version += 1
+            series.loaded_at = time.monotonic()
+
+    def slice_since(self, symbol: str, period: str, since: datetime) -> Optional[Tuple[List[Bar], int]]:
+        """
+        读取时间戳不早于 since 的K线
+
+        Args:
+            symbol: 交易对符号
+            period: K线周期
+            since: 起始时间（包含）
+
+        Returns:
+            (K线列表, 序列版本号)；序列未加载、已过期或不能覆盖 since 时返回None
+        """
+        with self._lock:
+            series = self._series.get((symbol, period))
+            if series is None or not series.timestamps:
+                return None
+            if time.monotonic() - series.loaded_at > self.ttl:
+                return None
+            if since < series.timestamps[0]:
+                return None
+
+            idx = bisect_left(series.timestamps, since)
+            return series.bars[idx:], series.version
+
+    def invalidate(self, symbol: Optional[str] = None, period: Optional[str] = None) -> None:
+        """使热存储中的序列失效，不指定参数时清空全部"""
+        with self._lock:
+            if symbol is None:
+                self._series.clear()
+                return
+            for key in list(self._series):
+                if key[0] == symbol and (period is None or key[1] == period):
+                    del self._series[key]
+
+
+# 全局K线热存储实例
+kline_hot_store = KlineHotStore()
@@ -2,10 +2,31 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc, asc, func, case
 from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
+import numpy as np
 from app.models.market import MarketData, OrderBook, SymbolInfo, MarketTicker
-from app.schemas.market import KLineData, OrderBookData, MarketTickerData
+from app.schemas.market import KLineData, KLineDelta, KLineColumns, KLineBatch, IndicatorData, FactorCrossSection, FactorValueItem, CorrelationData, OrderBookData, OrderBookAnalytics, OrderBookReplay, MarketTickerData
+from app.services.kline_store import kline_hot_store, normalize_timestamp
+from app.services.orderbook_codec import decode_book
+from app.services.orderbook_engine import order_book_manager
+from app.services.orderbook_analytics import analyze_books, DEFAULT_IMBALANCE_DEPTHS
+from app.services.indicators import IndicatorSpec, compute_indicator, spec_key, to_json_series, warmup_bars
+from app.services.indicator_cache import indicator_cache
+from app.services.orderbook_history import replay_order_book
 import json
 
+
+def _bars_to_columns(bars: List[tuple]) -> Dict[str, list]:
+    """将 (timestamp, open, high, low, close, volume) 元组列表转换为列式字典"""
+    return {
+        "t": [int(bar[0].replace(tzinfo=timezone.utc).timestamp() * 1000) for bar in bars],
+        "o": [bar[1] for bar in bars],
+        "h": [bar[2] for bar in bars],
+        "l": [bar[3] for bar in bars],
+        "c": [bar[4] for bar in bars],
+        "v": [float(bar[5]) for bar in bars]
+    }
+
+
 class MarketService:
     """市场数据服务类"""
     
@@ -57,6 +78,421 @@ class MarketService:
             )
             for data in kline_data
         ]
+
+    @staticmethod
+    def get_indicators(
+        db: Session,
+        symbol: str,
+        specs: List[IndicatorSpec],
+        period: str = "1m",
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 1000
+    ) -> IndicatorData:
+        """
+        计算技术指标
+        输出序列与 get_kline_data 相同参数返回的K线逐根对齐；另取起点之前的K线作为预热，
+        每个指标只使用自身需要的预热长度，结果不受同一请求中其他指标的影响。
+        计算结果进入指标缓存，之后的请求直接复用，K线有追加时只重算新增的尾部。
+
+        Args:
+            db: 数据库会话
+            symbol: 交易对符号
+            specs: 规范化的指标参数列表（parse_indicator_specs 的结果）
+            period: K线周期
+            start_time: 开始时间
+            end_time: 结束时间
+            limit: 数据条数限制
+
+        Returns:
+            技术指标序列
+        """
+        columns = (MarketData.timestamp, MarketData.open, MarketData.high,
+                   MarketData.low, MarketData.close, MarketData.volume)
+        query = db.query(*columns).filter(
+            MarketData.symbol == symbol,
+            MarketData.period == period
+        )
+        if start_time:
+            query = query.filter(MarketData.timestamp >= start_time)
+        if end_time:
+            query = query.filter(MarketData.timestamp <= end_time)
+        bars = [tuple(row) for row in query.order_by(MarketData.timestamp.asc()).limit(limit).all()]
+
+        if not bars:
+            return IndicatorData(symbol=symbol, period=period, indicators={spec_key(spec): {} for spec in specs})
+
+        names = ("open", "high", "low", "close", "volume")
+        t = _bars_to_columns(bars)["t"]
+        t_ms = np.array(t, dtype=np.int64)
+        bar_arrays = dict(zip(names, np.ascontiguousarray(
+            np.array([row[1:] for row in bars], dtype=np.float64).T)))
+
+        # 先查指标缓存，只有未命中的指标才需要读取预热K线并完整计算
+        outputs = {}
+        missing = []
+        for spec in specs:
+            cached = indicator_cache.get(symbol, period, spec, t_ms, bar_arrays)
+            if cached is None:
+                missing.append(spec)
+            else:
+                outputs[spec_key(spec)] = cached
+
+        warmup = warmup_bars(missing)
+        prefix = []
+        if warmup:
+            prefix = db.query(*columns).filter(
+                MarketData.symbol == symbol,
+                MarketData.period == period,
+                MarketData.timestamp < bars[0][0]
+            ).order_by(MarketData.timestamp.desc()).limit(warmup).all()
+            prefix = [tuple(row) for row in reversed(prefix)]
+
+        n_prefix = len(prefix)
+        if missing:
+            values = np.array([row[1:] for row in prefix + bars], dtype=np.float64)
+            arrays = dict(zip(names, np.ascontiguousarray(values.T)))
+
+        for spec in missing:
+            start = n_prefix - min(warmup_bars([spec]), n_prefix)
+            spec_arrays = {name: array[start:] for name, array in arrays.items()}
+            output = {name: series[n_prefix - start:] for name, series in compute_indicator(spec, spec_arrays).items()}
+            indicator_cache.put(symbol, period, spec, t_ms, output, spec_arrays)
+            outputs[spec_key(spec)] = output
+
+        indicators = {
+            spec_key(spec): {name: to_json_series(series) for name, series in outputs[spec_key(spec)].items()}
+            for spec in specs
+        }
+
+        return IndicatorData(
+            symbol=symbol,
+            period=period,
+            t=t,
+            warmup=n_prefix,
+            indicators=indicators
+        )
+
+    @staticmethod
+    def get_closed_bars(
+        db: Session,
+        symbol: str,
+        period: str,
+        limit: int
+    ) -> List[tuple]:
+        """
+        读取最近的已收盘K线，用于增量指标状态的预热（仍在形成中的最新K线不计入，
+        它收盘后由事件总线上的 BarClosed 推入）
+
+        Args:
+            db: 数据库会话
+            symbol: 交易对符号
+            period: K线周期
+            limit: 最多读取的K线根数
+
+        Returns:
+            按时间升序的 (K线开始时间, K线) 列表
+        """
+        from app.services.realtime_supervisor import PERIOD_SECONDS
+
+        closed_before = datetime.utcnow() - timedelta(seconds=PERIOD_SECONDS.get(period, 0))
+        rows = db.query(
+            MarketData.timestamp, MarketData.open, MarketData.high,
+            MarketData.low, MarketData.close, MarketData.volume
+        ).filter(
+            MarketData.symbol == symbol,
+            MarketData.period == period,
+            MarketData.timestamp <= closed_before
+        ).order_by(MarketData.timestamp.desc()).limit(limit).all()
+        return [
+            (row[0], {"open": row[1], "high": row[2], "low": row[3], "close": row[4], "volume": row[5]})
+            for row in reversed(rows)
+        ]
+
+    @staticmethod
+    def compute_factors(
+        db: Session,
+        factors: str,
+        symbols: Optional[List[str]] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        neutralize: bool = True,
+        standardize: Optional[str] = "zscore"
+    ) -> Dict[str, Any]:
+        """
+        计算日频截面因子并写入因子表
+
+        Args:
+            db: 数据库会话
+            factors: 因子列表字符串（见 factor_engine.parse_factor_specs）
+            symbols: 股票池，默认为全部A股
+            start_date: 第一个输出交易日
+            end_date: 最后一个输出交易日
+            neutralize: 是否行业中性化
+            standardize: 标准化方法（zscore/rank/None）
+
+        Returns:
+            计算摘要
+        """
+        from app.services.factor_engine import compute_daily_factors, parse_factor_specs
+
+        specs = parse_factor_specs(factors)
+        if not specs:
+            raise ValueError("至少需要一个因子")
+        result = compute_daily_factors(
+            db, specs, symbols=symbols, start_date=start_date, end_date=end_date,
+            neutralize_industry=neutralize, standardize=standardize
+        )
+        timestamps = result["timestamps"]
+        return {
+            "factors": result["factors"],
+            "symbols": result["symbols"],
+            "dates": result["dates"],
+            "rows": result["rows"],
+            "start_date": str(timestamps[0].astype("datetime64[s]")) if len(timestamps) else None,
+            "end_date": str(timestamps[-1].astype("datetime64[s]")) if len(timestamps) else None
+        }
+
+    @staticmethod
+    def get_factor_values(
+        db: Session,
+        factor: str,
+        trade_date: Optional[datetime] = None,
+        symbols: Optional[List[str]] = None,
+        limit: int = 100,
+        ascending: bool = False
+    ) -> FactorCrossSection:
+        """
+        读取因子截面
+
+        Args:
+            db: 数据库会话
+            factor: 因子（名称[:参数...]，省略的参数取默认值）
+            trade_date: 交易日，取不晚于该日的最近一个有因子值的交易日，默认为最新
+            symbols: 只返回这些交易对
+            limit: 返回条数
+            ascending: 是否按因子值升序
+
+        Returns:
+            因子截面
+        """
+        from app.models.market import FactorValue
+        from app.services.factor_engine import parse_factor_specs
+
+        specs = parse_factor_specs(factor)
+        if len(specs) != 1:
+            raise ValueError("只能指定一个因子")
+        key = spec_key(specs[0])
+
+        date_query = db.query(func.max(FactorValue.trade_date)).filter(FactorValue.factor == key)
+        if trade_date:
+            date_query = date_query.filter(FactorValue.trade_date <= trade_date)
+        date = date_query.scalar()
+        if date is None:
+            return FactorCrossSection(factor=key)
+
+        query = db.query(FactorValue.symbol, FactorValue.value).filter(
+            FactorValue.factor == key,
+            FactorValue.trade_date == date
+        )
+        if symbols:
+            query = query.filter(FactorValue.symbol.in_(symbols))
+        order = FactorValue.value.asc() if ascending else FactorValue.value.desc()
+        rows = query.order_by(order).limit(limit).all()
+
+        return FactorCrossSection(
+            factor=key,
+            trade_date=date,
+            count=len(rows),
+            values=[FactorValueItem(symbol=symbol, value=value, rank=i + 1) for i, (symbol, value) in enumerate(rows)]
+        )
+
+    @staticmethod
+    def get_correlation(
+        db: Session,
+        symbols: List[str],
+        benchmark: Optional[str] = "000300.SH",
+        window: int = 60,
+        period: str = "1d",
+        end_date: Optional[datetime] = None,
+        history: int = 0
+    ) -> CorrelationData:
+        """
+        计算股票池的滚动协方差、相关系数和相对基准的贝塔
+
+        Args:
+            db: 数据库会话
+            symbols: 股票池
+            benchmark: 基准代码
+            window: 窗口长度
+            period: K线周期
+            end_date: 结束时间，默认为最新
+            history: 额外返回的滚动贝塔序列长度
+
+        Returns:
+            相关性数据
+        """
+        from app.services.correlation_engine import compute_correlation
+
+        return CorrelationData(**compute_correlation(
+            db, symbols, benchmark=benchmark, window=window, period=period,
+            end_date=end_date, history=history
+        ))
+
+    @staticmethod
+    def get_kline_delta(
+        db: Session,
+        symbol: str,
+        period: str = "1m",
+        since: Optional[datetime] = None,
+        limit: int = 1000
+    ) -> KLineDelta:
+        """
+        获取水位时间之后的增量K线
+        返回时间戳不早于 since 的K线，包含客户端已持有的最后一根（仍在形成中的K线可能已被修订）。
+        优先从K线热存储读取，热存储未覆盖时回源数据库并加载热存储。
+
+        Args:
+            db: 数据库会话
+            symbol: 交易对符号
+            period: K线周期
+            since: 客户端持有的最后一根K线时间
+            limit: 数据条数限制
+
+        Returns:
+            列式紧凑格式的增量K线
+        """
+        since = normalize_timestamp(since)
+
+        cached = kline_hot_store.slice_since(symbol, period, since)
+        if cached is None:
+            # 热存储未命中，从数据库加载最近一段K线
+            recent = db.query(
+                MarketData.timestamp, MarketData.open, MarketData.high,
+                MarketData.low, MarketData.close, MarketData.volume
+            ).filter(
+                MarketData.symbol == symbol,
+                MarketData.period == period
+            ).order_by(MarketData.timestamp.desc()).limit(kline_hot_store.max_bars).all()
+            kline_hot_store.load(symbol, period, [tuple(row) for row in reversed(recent)])
+            cached = kline_hot_store.slice_since(symbol, period, since)
+
+        if cached is not None:
+            bars, version = cached
+            bars = bars[:limit]
+        else:
+            # 水位早于热存储覆盖范围，直接查询数据库
+            version = 0
+            bars = [tuple(row) for row in db.query(
+                MarketData.timestamp, MarketData.open, MarketData.high,
+                MarketData.low, MarketData.close, MarketData.volume
+            ).filter(
+                MarketData.symbol == symbol,
+                MarketData.period == period,
+                MarketData.timestamp >= since
+            ).order_by(MarketData.timestamp.asc()).limit(limit).all()]
+
+        return KLineDelta(
+            symbol=symbol,
+            period=period,
+            since=since,
+            watermark=bars[-1][0] if bars else since,
+            version=version,
+            **_bars_to_columns(bars)
+        )
+
+    @staticmethod
+    def get_kline_batch(
+        db: Session,
+        symbols: List[str],
+        period: str = "1m",
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: int = 200
+    ) -> KLineBatch:
+        """
+        批量获取多个交易对的K线数据
+        热存储能覆盖时间范围的交易对直接切片，其余交易对合并为一次集合查询，
+        通过窗口函数为每个交易对分别取时间范围内最近的 limit 条K线。
+
+        Args:
+            db: 数据库会话
+            symbols: 交易对符号列表
+            period: K线周期
+            start_time: 开始时间
+            end_time: 结束时间
+            limit: 每个交易对的数据条数限制
+
+        Returns:
+            按交易对分组的列式K线数据
+        """
+        end_time = normalize_timestamp(end_time or datetime.utcnow())
+        start_time = normalize_timestamp(start_time or end_time - timedelta(days=7))
+
+        bars_by_symbol: Dict[str, List[tuple]] = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            cached = kline_hot_store.slice_since(symbol, period, start_time)
+            if cached is None:
+                missing.append(symbol)
+                continue
+            bars = [bar for bar in cached[0] if bar[0] <= end_time]
+            bars_by_symbol[symbol] = bars[-limit:]
+
+        if missing:
+            row_number = func.row_number().over(
+                partition_by=MarketData.symbol,
+                order_by=MarketData.timestamp.desc()
+            ).label("rn")
+            ranked = db.query(
+                MarketData.symbol, MarketData.timestamp, MarketData.open, MarketData.high,
+                MarketData.low, MarketData.close, MarketData.volume, row_number
+            ).filter(
+                MarketData.symbol.in_(missing),
+                MarketData.period == period,
+                MarketData.timestamp >= start_time,
+                MarketData.timestamp <= end_time
+            ).subquery()
+
+            rows = db.query(ranked).filter(ranked.c.rn <= limit).order_by(
+                ranked.c.symbol, ranked.c.timestamp.asc()
+            ).all()
+
+            for symbol in missing:
+                bars_by_symbol[symbol] = []
+            for row in rows:
+                bars_by_symbol[row.symbol].append(
+                    (row.timestamp, row.open, row.high, row.low, row.close, row.volume)
+                )
+
+        return KLineBatch(
+            period=period,
+            start_time=start_time,
+            end_time=end_time,
+            limit=limit,
+            data={symbol: KLineColumns(**_bars_to_columns(bars)) for symbol, bars in bars_by_symbol.items()}
+        )
+
+    @staticmethod
+    def get_live_order_book(
+        symbol: str,
+        depth: int = 10
+    ) -> Optional[OrderBookData]:
+        """
+        从内存盘口获取盘口数据
+        
+        Args:
+            symbol: 交易对符号
+            depth: 盘口深度
+        
+        Returns:
+            盘口数据，盘口不存在或尚未完成快照同步时返回None
+        """
+        book = order_book_manager.get(symbol)
+        if book is None or not book.synced:
+            return None
+        
+        return OrderBookData(**book.to_dict(depth))
     
     @staticmethod
     def get_order_book(
@@ -82,9 +518,12 @@ class MarketService:
         if not order_book:
             return None
         
-        # 解析盘口数据
-        bids = json.loads(order_book.bids)[:depth]
-        asks = json.loads(order_book.asks)[:depth]
+        # 解析盘口数据：二进制快照只切片前depth档，旧版JSON快照需要完整解析
+        if order_book.book_data:
+            bids, asks = decode_book(order_book.book_data, depth)
+        else:
+            bids = json.loads(order_book.bids)[:depth]
+            asks = json.loads(order_book.asks)[:depth]
         
         return OrderBookData(
             symbol=order_book.symbol,
@@ -93,6 +532,86 @@ class MarketService:
             asks=asks
         )
     
+    @staticmethod
+    def replay_order_book(
+        db: Session,
+        symbol: str,
+        at: datetime,
+        depth: int = 10
+    ) -> Optional[OrderBookReplay]:
+        """
+        回放指定时刻的历史盘口
+        
+        Args:
+            db: 数据库会话
+            symbol: 交易对符号
+            at: 目标时间
+            depth: 盘口深度
+        
+        Returns:
+            历史盘口，目标时间之前没有检查点时返回None
+        """
+        result = replay_order_book(db, symbol, normalize_timestamp(at))
+        if result is None:
+            return None
+        
+        book = result["book"]
+        return OrderBookReplay(
+            **book.to_dict(depth),
+            update_id=book.last_update_id,
+            checkpoint_time=result["checkpoint_time"],
+            deltas_applied=result["deltas_applied"],
+            complete=result["complete"]
+        )
+    
+    @staticmethod
+    def get_order_book_analytics(
+        db: Session,
+        symbols: Optional[List[str]] = None,
+        depth: int = 20,
+        imbalance_depths: Optional[List[int]] = None,
+        sizes: Optional[List[float]] = None
+    ) -> List[OrderBookAnalytics]:
+        """
+        批量计算盘口微观结构指标
+        
+        Args:
+            db: 数据库会话
+            symbols: 交易对列表，为空时分析所有已同步的内存盘口
+            depth: 参与计算的档数
+            imbalance_depths: 失衡计算的档数列表
+            sizes: 预估滑点的委托数量列表
+        
+        Returns:
+            盘口分析结果列表，没有盘口数据的交易对不返回
+        """
+        if not symbols:
+            symbols = [symbol for symbol, book in order_book_manager.books.items() if book.synced]
+        
+        found, books, timestamps = [], [], []
+        for symbol in symbols:
+            # 优先使用内存盘口，未同步时回退到最新快照
+            book = order_book_manager.get(symbol)
+            if book is not None and book.synced:
+                bids, asks = book.top(depth)
+                timestamp = book.timestamp
+            else:
+                snapshot = MarketService.get_order_book(db, symbol, depth)
+                if snapshot is None:
+                    continue
+                bids = [(entry.price, entry.amount) for entry in snapshot.bids]
+                asks = [(entry.price, entry.amount) for entry in snapshot.asks]
+                timestamp = snapshot.timestamp
+            found.append(symbol)
+            books.append((bids, asks))
+            timestamps.append(timestamp)
+        
+        results = analyze_books(
+            found, books, timestamps, depth,
+            imbalance_depths or DEFAULT_IMBALANCE_DEPTHS, sizes or ()
+        )
+        return [OrderBookAnalytics(**item) for item in results]
+    
     @staticmethod
     def get_market_tickers(
         db: Session,
@@ -507,44 +1026,68 @@ class MarketService:
     def start_realtime_update(
         db: Session,
         symbols: List[str],
-        update_interval: int = 60
+        update_interval: int = 60,
+        data_source: Optional[str] = None,
+        period: Optional[str] = None,
+        mode: str = "poll",
+        bar_source: str = "kline"
     ) -> Dict[str, Any]:
         """
-        启动实时数据更新任务
+        启动实时数据更新任务（需在事件循环中调用）
         
         Args:
             db: 数据库会话
             symbols: 交易对符号列表
-            update_interval: 更新间隔（秒）
+            update_interval: 交易时段的更新间隔（秒），休市时自动放慢
+            data_source: 数据源（binance/baostock/tushare），默认按代码格式推断
+            period: K线周期
+            mode: poll（轮询，binance同周期交易对合并为一个任务）/ stream（WebSocket推送，仅binance）
+            bar_source: stream任务的K线来源，kline（交易所推送的K线）/ trade（逐笔成交合成K线）
         
         Returns:
             实时更新任务状态
         """
+        from app.services.realtime_supervisor import realtime_supervisor
+        
         try:
-            # 这里可以启动后台任务或定时任务
-            # 实际项目中可以使用APScheduler、Celery等
-            
-            from app.core.logging_config import get_app_logger
-            app_logger = get_app_logger()
-            
-            app_logger.info(f"启动实时数据更新任务: symbols={symbols}, interval={update_interval}s")
-            
-            # 返回任务信息
-            return {
-                "success": True,
-                "message": "实时更新任务已启动",
-                "task_id": f"realtime_update_{datetime.now(timezone.utc).timestamp()}",
-                "symbols": symbols,
-                "update_interval": update_interval,
-                "start_time": datetime.now(timezone.utc).isoformat(),
-                "status": "running"
-            }
-            
-        except Exception as e:
-            from app.core.logging_config import get_app_logger
-            app_logger = get_app_logger()
-            app_logger.error(f"启动实时更新任务失败: {str(e)}", exc_info=True)
-            return {"success": False, "message": f"启动实时更新任务失败: {str(e)}"}
+            tasks = realtime_supervisor.start(symbols, update_interval, data_source, period, mode, bar_source)
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+        
+        return {
+            "success": True,
+            "message": "实时更新任务已启动",
+            "task_id": tasks[0]["task_id"] if len(tasks) == 1 else None,
+            "symbols": symbols,
+            "update_interval": update_interval,
+            "start_time": datetime.now(timezone.utc).isoformat(),
+            "status": "running",
+            "tasks": tasks
+        }
+
+    @staticmethod
+    def stop_realtime_update(
+        task_id: Optional[str] = None,
+        symbols: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        停止实时数据更新任务，未指定任务ID和交易对时停止全部任务
+        
+        Args:
+            task_id: 任务ID（可选）
+            symbols: 交易对符号列表（可选）
+        
+        Returns:
+            已停止的任务
+        """
+        from app.services.realtime_supervisor import realtime_supervisor
+        
+        stopped = realtime_supervisor.stop(task_id, symbols)
+        return {
+            "success": bool(stopped),
+            "message": f"已停止{len(stopped)}个实时更新任务" if stopped else "没有匹配的实时更新任务",
+            "tasks": stopped
+        }
 
     @staticmethod
     def get_update_status(
@@ -562,9 +1105,16 @@ class MarketService:
             任务状态信息
         """
         try:
-            # 查询最近的更新记录
             from app.models.market import MarketDataUpdateLog
+            from app.services.realtime_supervisor import realtime_supervisor
             
+            # 实时更新任务直接返回运行状态（延迟、吞吐）
+            if task_id:
+                realtime_task = realtime_supervisor.get(task_id)
+                if realtime_task is not None:
+                    return {"success": True, **realtime_task}
+            
+            # 查询最近的更新记录
             query = db.query(MarketDataUpdateLog)
             if task_id:
                 query = query.filter(MarketDataUpdateLog.task_id == task_id)
@@ -582,15 +1132,18 @@ class MarketService:
                     "data_count": latest_log.data_count,
                     "start_time": latest_log.start_time.isoformat() if latest_log.start_time else None,
                     "end_time": latest_log.end_time.isoformat() if latest_log.end_time else None,
-                    "updated_at": latest_log.updated_at.isoformat()
+                    "updated_at": latest_log.updated_at.isoformat(),
+                    "realtime_tasks": realtime_supervisor.list()
                 }
             else:
                 # 返回默认状态
+                realtime_tasks = realtime_supervisor.list()
                 return {
                     "success": True,
-                    "message": "暂无更新记录",
-                    "status": "idle",
-                    "last_update": None
+                    "message": "暂无更新记录" if not realtime_tasks else f"{len(realtime_tasks)}个实时更新任务运行中",
+                    "status": "running" if realtime_tasks else "idle",
+                    "last_update": None,
+                    "realtime_tasks": realtime_tasks
                 }
                 
         except Exception as e:
@@ -0,0 +1,180 @@
+"""
+盘口微观结构分析
+将多个交易对的盘口堆叠为 (交易对数, 档数) 数组，一次性计算中间价、微观价格、
+多档买卖盘失衡、累计深度曲线以及给定委托数量的预期成交均价和滑点
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 单侧档位: [(price, amount), ...]，买盘价格从高到低、卖盘价格从低到高
+Levels = Sequence[Tuple[float, float]]
+
+DEFAULT_IMBALANCE_DEPTHS = (1, 5, 10)
+
+
+def stack_books(books: Sequence[Tuple[Levels, Levels]], depth: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    将盘口堆叠为定长数组，档位不足的位置价格为NaN、数量为0
+
+    Args:
+        books: [(买盘档位, 卖盘档位), ...]
+        depth: 每侧保留的档数
+
+    Returns:
+        (买价, 买量, 卖价, 卖量)，形状均为 (交易对数, depth)
+    """
+    n = len(books)
+    bid_px = np.full((n, depth), np.nan)
+    bid_sz = np.zeros((n, depth))
+    ask_px = np.full((n, depth), np.nan)
+    ask_sz = np.zeros((n, depth))
+
+    for i, (bids, asks) in enumerate(books):
+        if bids:
+            levels = np.asarray(bids[:depth], dtype=np.float64).reshape(-1, 2)
+            bid_px[i, :len(levels)] = levels[:, 0]
+            bid_sz[i, :len(levels)] = levels[:, 1]
+        if asks:
+            levels = np.asarray(asks[:depth], dtype=np.float64).reshape(-1, 2)
+            ask_px[i, :len(levels)] = levels[:, 0]
+            ask_sz[i, :len(levels)] = levels[:, 1]
+
+    return bid_px, bid_sz, ask_px, ask_sz
+
+
+def mid_and_micro_price(bid_px: np.ndarray, bid_sz: np.ndarray,
+                        ask_px: np.ndarray, ask_sz: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算中间价和微观价格（按对手方一档数量加权）
+
+    Returns:
+        (中间价, 微观价格)，形状 (交易对数,)
+    """
+    best_bid = bid_px[:, 0]
+    best_ask = ask_px[:, 0]
+    bid_qty = bid_sz[:, 0]
+    ask_qty = ask_sz[:, 0]
+
+    mid = (best_bid + best_ask) / 2.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        micro = (best_ask * bid_qty + best_bid * ask_qty) / (bid_qty + ask_qty)
+    return mid, micro
+
+
+def book_imbalance(bid_sz: np.ndarray, ask_sz: np.ndarray, depths: Sequence[int]) -> np.ndarray:
+    """
+    计算前k档买卖盘失衡 (买量 - 卖量) / (买量 + 卖量)
+
+    Args:
+        bid_sz: 买量 (交易对数, 档数)
+        ask_sz: 卖量 (交易对数, 档数)
+        depths: 档数列表
+
+    Returns:
+        形状 (交易对数, len(depths))，取值 [-1, 1]
+    """
+    bid_cum = np.cumsum(bid_sz, axis=1)
+    ask_cum = np.cumsum(ask_sz, axis=1)
+    idx = np.clip(np.asarray(depths, dtype=np.intp), 1, bid_sz.shape[1]) - 1
+    bid_k = bid_cum[:, idx]
+    ask_k = ask_cum[:, idx]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (bid_k - ask_k) / (bid_k + ask_k)
+
+
+def cumulative_depth(sz: np.ndarray) -> np.ndarray:
+    """累计深度曲线（按档累加数量）"""
+    return np.cumsum(sz, axis=1)
+
+
+def fill_estimates(px: np.ndarray, sz: np.ndarray, sizes: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算市价委托吃单的预期成交均价
+
+    Args:
+        px: 对手方价格 (交易对数, 档数)，买入时为卖盘、卖出时为买盘
+        sz: 对手方数量 (交易对数, 档数)
+        sizes: 委托数量列表
+
+    Returns:
+        (成交均价, 实际可成交数量)，形状均为 (交易对数, len(sizes))；深度不足时只按可成交部分计算均价
+    """
+    q = np.asarray(sizes, dtype=np.float64)[None, :, None]  # (1, m, 1)
+    cum = np.cumsum(sz, axis=1)[:, None, :]  # (n, 1, d)
+    prev = cum - sz[:, None, :]
+    filled = np.clip(q - prev, 0.0, sz[:, None, :])  # 每档成交数量 (n, m, d)
+    notional = np.nansum(filled * px[:, None, :], axis=2)
+    qty = filled.sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        vwap = np.where(qty > 0, notional / qty, np.nan)
+    return vwap, qty
+
+
+def analyze_books(symbols: Sequence[str], books: Sequence[Tuple[Levels, Levels]],
+                  timestamps: Sequence[Optional[datetime]], depth: int = 20,
+                  imbalance_depths: Sequence[int] = DEFAULT_IMBALANCE_DEPTHS,
+                  sizes: Sequence[float] = ()) -> List[Dict]:
+    """
+    批量计算盘口分析指标
+
+    Args:
+        symbols: 交易对列表
+        books: 与 symbols 对应的 (买盘档位, 卖盘档位)
+        timestamps: 与 symbols 对应的盘口时间
+        depth: 参与计算的档数
+        imbalance_depths: 失衡计算的档数列表
+        sizes: 预估滑点的委托数量列表
+
+    Returns:
+        每个交易对的分析结果字典
+    """
+    if not symbols:
+        return []
+
+    bid_px, bid_sz, ask_px, ask_sz = stack_books(books, depth)
+    mid, micro = mid_and_micro_price(bid_px, bid_sz, ask_px, ask_sz)
+    imbalance = book_imbalance(bid_sz, ask_sz, imbalance_depths)
+    bid_depth = cumulative_depth(bid_sz)
+    ask_depth = cumulative_depth(ask_sz)
+
+    if sizes:
+        buy_vwap, buy_qty = fill_estimates(ask_px, ask_sz, sizes)
+        sell_vwap, sell_qty = fill_estimates(bid_px, bid_sz, sizes)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            buy_bps = (buy_vwap - mid[:, None]) / mid[:, None] * 1e4
+            sell_bps = (mid[:, None] - sell_vwap) / mid[:, None] * 1e4
+
+    results = []
+    for i, symbol in enumerate(symbols):
+        n_bids = int(np.count_nonzero(~np.isnan(bid_px[i])))
+        n_asks = int(np.count_nonzero(~np.isnan(ask_px[i])))
+        fills = []
+        for j, size in enumerate(sizes):
+            fills.append({"side": "buy", "size": size, "vwap": _finite(buy_vwap[i, j]),
+                          "filled": float(buy_qty[i, j]), "slippage_bps": _finite(buy_bps[i, j])})
+            fills.append({"side": "sell", "size": size, "vwap": _finite(sell_vwap[i, j]),
+                          "filled": float(sell_qty[i, j]), "slippage_bps": _finite(sell_bps[i, j])})
+
+        results.append({
+            "symbol": symbol,
+            "timestamp": timestamps[i],
+            "best_bid": _finite(bid_px[i, 0]),
+            "best_ask": _finite(ask_px[i, 0]),
+            "spread": _finite(ask_px[i, 0] - bid_px[i, 0]),
+            "mid_price": _finite(mid[i]),
+            "micro_price": _finite(micro[i]),
+            "imbalance": {str(k): _finite(imbalance[i, j]) for j, k in enumerate(imbalance_depths)},
+            "bid_depth": bid_depth[i, :n_bids].tolist(),
+            "ask_depth": ask_depth[i, :n_asks].tolist(),
+            "fills": fills
+        })
+    return results
+
+
+def _finite(value) -> Optional[float]:
+    """NaN/Inf 转为 None，便于JSON序列化"""
+    value = float(value)
+    return value if np.isfinite(value) else None
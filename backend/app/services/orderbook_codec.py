@@ -0,0 +1,135 @@
+"""
+盘口快照二进制编解码
+快照格式: 12字节头部 + 买盘 (price, amount) float64 对 + 卖盘 (price, amount) float64 对，小端序
+
+头部: magic(2字节 b"OB") | version(uint8) | reserved(uint8) | 买盘档数(uint32) | 卖盘档数(uint32)
+
+买盘按价格从高到低、卖盘按价格从低到高存储，读取前N档只需对原始字节做切片，不需要解析整个快照。
+"""
+
+import struct
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+MAGIC = b"OB"
+VERSION = 1
+HEADER = struct.Struct("<2sBBII")
+HEADER_SIZE = HEADER.size
+LEVEL_SIZE = 16  # 每档 price + amount 两个 float64
+
+# 盘口档位输入: {"price": .., "amount": ..} 或 (price, amount)
+LevelInput = Union[Dict[str, Any], Sequence[float]]
+
+
+def _flatten(levels: Iterable[LevelInput]) -> List[float]:
+    """将档位列表展开为 [price0, amount0, price1, amount1, ...]"""
+    flat: List[float] = []
+    for level in levels:
+        if isinstance(level, dict):
+            flat.append(float(level["price"]))
+            flat.append(float(level["amount"]))
+        else:
+            flat.append(float(level[0]))
+            flat.append(float(level[1]))
+    return flat
+
+
+def encode_book(bids: Iterable[LevelInput], asks: Iterable[LevelInput]) -> bytes:
+    """
+    编码盘口快照
+
+    Args:
+        bids: 买盘档位（价格从高到低）
+        asks: 卖盘档位（价格从低到高）
+
+    Returns:
+        二进制快照
+    """
+    bid_values = _flatten(bids)
+    ask_values = _flatten(asks)
+    n_bids = len(bid_values) // 2
+    n_asks = len(ask_values) // 2
+    return HEADER.pack(MAGIC, VERSION, 0, n_bids, n_asks) + struct.pack(
+        f"<{len(bid_values) + len(ask_values)}d", *bid_values, *ask_values
+    )
+
+
+def read_header(blob: bytes) -> Tuple[int, int]:
+    """
+    读取快照头部
+
+    Returns:
+        (买盘档数, 卖盘档数)
+    """
+    magic, version, _, n_bids, n_asks = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"无效的盘口快照格式: magic={magic!r}, version={version}")
+    return n_bids, n_asks
+
+
+def side_offset(blob: bytes, side: str) -> Tuple[int, int]:
+    """
+    获取某一侧档位数据在快照中的字节偏移和档数
+
+    Args:
+        blob: 二进制快照
+        side: "bids" 或 "asks"
+
+    Returns:
+        (字节偏移, 档数)
+    """
+    n_bids, n_asks = read_header(blob)
+    if side == "bids":
+        return HEADER_SIZE, n_bids
+    if side == "asks":
+        return HEADER_SIZE + n_bids * LEVEL_SIZE, n_asks
+    raise ValueError(f"无效的盘口方向: {side}")
+
+
+def top_levels(blob: bytes, side: str, depth: int) -> memoryview:
+    """
+    零拷贝读取某一侧前 depth 档
+
+    Args:
+        blob: 二进制快照
+        side: "bids" 或 "asks"
+        depth: 档数
+
+    Returns:
+        float64 视图 [price0, amount0, price1, amount1, ...]
+    """
+    offset, count = side_offset(blob, side)
+    count = min(count, depth)
+    return memoryview(blob)[offset:offset + count * LEVEL_SIZE].cast("d")
+
+
+def to_entries(levels: memoryview) -> List[Dict[str, float]]:
+    """将档位视图转换为盘口条目列表（price/amount/total）"""
+    prices = levels[0::2]
+    amounts = levels[1::2]
+    return [
+        {"price": price, "amount": amount, "total": price * amount}
+        for price, amount in zip(prices, amounts)
+    ]
+
+
+def decode_book(blob: bytes, depth: int) -> Tuple[List[Dict[str, float]], List[Dict[str, float]]]:
+    """
+    解码快照前 depth 档为盘口条目
+
+    Returns:
+        (买盘条目, 卖盘条目)
+    """
+    return to_entries(top_levels(blob, "bids", depth)), to_entries(top_levels(blob, "asks", depth))
+
+
+def decode_levels(blob: bytes) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+    """
+    解码快照全部档位为 (price, amount) 列表
+
+    Returns:
+        (买盘档位, 卖盘档位)
+    """
+    n_bids, n_asks = read_header(blob)
+    bids = top_levels(blob, "bids", n_bids)
+    asks = top_levels(blob, "asks", n_asks)
+    return list(zip(bids[0::2], bids[1::2])), list(zip(asks[0::2], asks[1::2]))
@@ -0,0 +1,329 @@
+"""
+内存L2盘口引擎
+每个交易对维护一份按价格排序的买卖盘，增量应用交易所深度推送，
+通过更新序号检测丢包并在快照重同步后继续应用缓存的增量
+"""
+
+import asyncio
+from datetime import datetime
+from itertools import islice
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sortedcontainers import SortedDict
+
+from app.core.logging_config import get_data_logger_instance
+
+data_logger = get_data_logger_instance()
+
+# 单个档位: (price, amount)
+Level = Tuple[float, float]
+
+# 快照获取函数: symbol -> {"lastUpdateId": int, "bids": [[price, amount], ...], "asks": [...]}
+SnapshotFetcher = Callable[[str], Awaitable[Optional[dict]]]
+
+# 增量: (first_id, final_id, bids, asks, timestamp)
+Delta = Tuple[int, int, Sequence, Sequence, Optional[datetime]]
+
+# 盘口变更监听函数: (盘口, 已应用的增量)，快照重建时增量为None
+BookListener = Callable[["L2OrderBook", Optional[Delta]], None]
+
+
+class L2OrderBook:
+    """单个交易对的L2盘口"""
+
+    def __init__(self, symbol: str, max_buffered: int = 1000):
+        """
+        Args:
+            symbol: 交易对符号
+            max_buffered: 等待快照期间最多缓存的增量条数
+        """
+        self.symbol = symbol
+        # 买盘以负价格为键，使两侧的最优价都位于索引0
+        self.bids: SortedDict = SortedDict()
+        self.asks: SortedDict = SortedDict()
+        self.last_update_id = 0
+        self.timestamp: Optional[datetime] = None
+        self.synced = False
+        self.gaps = 0
+        self.updates = 0
+        self.max_buffered = max_buffered
+        self._buffer: List[Delta] = []
+
+    @staticmethod
+    def _apply_levels(book: SortedDict, levels: Sequence, sign: float) -> None:
+        """应用一侧的档位变更，数量为0表示删除该价位"""
+        for price, amount in levels:
+            price = float(price)
+            amount = float(amount)
+            key = sign * price
+            if amount == 0.0:
+                book.pop(key, None)
+            else:
+                book[key] = amount
+
+    def apply_snapshot(self, bids: Sequence, asks: Sequence, last_update_id: int,
+                       timestamp: Optional[datetime] = None) -> None:
+        """
+        用完整快照重建盘口，并继续应用快照之后缓存的增量；
+        缓存的增量与快照接不上时盘口回到未同步状态，未应用的增量继续缓存等待下一次快照
+
+        Args:
+            bids: 买盘档位 [(price, amount), ...]
+            asks: 卖盘档位
+            last_update_id: 快照对应的最后更新序号
+            timestamp: 快照时间
+        """
+        self.bids.clear()
+        self.asks.clear()
+        self._apply_levels(self.bids, bids, -1.0)
+        self._apply_levels(self.asks, asks, 1.0)
+        self.last_update_id = last_update_id
+        self.timestamp = timestamp or datetime.utcnow()
+        self.synced = True
+
+        buffered, self._buffer = self._buffer, []
+        for i, (first_id, final_id, bid_levels, ask_levels, ts) in enumerate(buffered):
+            if final_id <= self.last_update_id:
+                continue
+            if not self.apply_delta(first_id, final_id, bid_levels, ask_levels, ts):
+                # apply_delta 已把这一条放回缓存，连同其后的增量一起保留
+                self._buffer = buffered[i:]
+                break
+
+    def apply_delta(self, first_id: int, final_id: int, bids: Sequence, asks: Sequence,
+                    timestamp: Optional[datetime] = None) -> bool:
+        """
+        应用一条深度增量，每个档位 O(log n)
+
+        Args:
+            first_id: 本条增量的第一个更新序号
+            final_id: 本条增量的最后一个更新序号
+            bids: 买盘档位变更
+            asks: 卖盘档位变更
+            timestamp: 事件时间
+
+        Returns:
+            是否已应用到盘口；未同步或检测到丢包时返回False，增量会被缓存等待重同步
+        """
+        if not self.synced:
+            self._buffer_delta(first_id, final_id, bids, asks, timestamp)
+            return False
+
+        if final_id <= self.last_update_id:
+            # 快照之前的旧增量
+            return True
+
+        if first_id > self.last_update_id + 1:
+            # 序号不连续，说明丢失了增量，需要重新获取快照
+            self.synced = False
+            self.gaps += 1
+            self._buffer_delta(first_id, final_id, bids, asks, timestamp)
+            data_logger.warning(
+                f"盘口增量序号不连续，等待快照重同步 - {self.symbol} - "
+                f"期望{self.last_update_id + 1}，收到{first_id}"
+            )
+            return False
+
+        self._apply_levels(self.bids, bids, -1.0)
+        self._apply_levels(self.asks, asks, 1.0)
+        self.last_update_id = final_id
+        self.timestamp = timestamp or datetime.utcnow()
+        self.updates += 1
+        return True
+
+    def _buffer_delta(self, first_id: int, final_id: int, bids: Sequence, asks: Sequence,
+                      timestamp: Optional[datetime]) -> None:
+        self._buffer.append((first_id, final_id, bids, asks, timestamp))
+        if len(self._buffer) > self.max_buffered:
+            del self._buffer[0]
+
+    def best_bid(self) -> Optional[Level]:
+        """最优买价"""
+        if not self.bids:
+            return None
+        key, amount = self.bids.peekitem(0)
+        return -key, amount
+
+    def best_ask(self) -> Optional[Level]:
+        """最优卖价"""
+        if not self.asks:
+            return None
+        key, amount = self.asks.peekitem(0)
+        return key, amount
+
+    def top(self, depth: int) -> Tuple[List[Level], List[Level]]:
+        """
+        获取前 depth 档
+
+        Returns:
+            (买盘档位（价格从高到低）, 卖盘档位（价格从低到高）)
+        """
+        bids = [(-key, amount) for key, amount in islice(self.bids.items(), depth)]
+        asks = list(islice(self.asks.items(), depth))
+        return bids, asks
+
+    def to_dict(self, depth: int) -> dict:
+        """转换为 OrderBookData 结构"""
+        bids, asks = self.top(depth)
+        return {
+            "symbol": self.symbol,
+            "timestamp": self.timestamp,
+            "bids": [{"price": price, "amount": amount, "total": price * amount} for price, amount in bids],
+            "asks": [{"price": price, "amount": amount, "total": price * amount} for price, amount in asks]
+        }
+
+
+class OrderBookManager:
+    """所有交易对的内存盘口"""
+
+    def __init__(self, resync_delay: float = 0.5, max_resync_delay: float = 30.0, max_resync_attempts: int = 10):
+        """
+        Args:
+            resync_delay: 快照仍接不上或获取失败后，再次重同步前的初始等待（秒），之后每次翻倍
+            max_resync_delay: 重同步等待上限（秒）
+            max_resync_attempts: 连续未同步的重同步次数上限，达到后停止自动重同步，直到重新设置快照获取函数
+        """
+        self.books: Dict[str, L2OrderBook] = {}
+        self.snapshot_fetcher: Optional[SnapshotFetcher] = None
+        self.listeners: List[BookListener] = []
+        self.resync_delay = resync_delay
+        self.max_resync_delay = max_resync_delay
+        self.max_resync_attempts = max_resync_attempts
+        self._resyncing: Dict[str, asyncio.Task] = {}
+        # 交易对 -> 上次同步成功后已发起的重同步次数
+        self._resync_attempts: Dict[str, int] = {}
+
+    def get(self, symbol: str) -> Optional[L2OrderBook]:
+        """获取交易对盘口，不存在时返回None"""
+        return self.books.get(symbol)
+
+    def get_or_create(self, symbol: str) -> L2OrderBook:
+        """获取交易对盘口，不存在时创建（未同步状态）"""
+        book = self.books.get(symbol)
+        if book is None:
+            book = L2OrderBook(symbol)
+            self.books[symbol] = book
+        return book
+
+    def set_snapshot_fetcher(self, fetcher: SnapshotFetcher) -> None:
+        """设置丢包或首次订阅时用于重同步的快照获取函数（重新开始采集时调用，已放弃重同步的交易对恢复重试）"""
+        self.snapshot_fetcher = fetcher
+        self._resync_attempts.clear()
+
+    def add_listener(self, listener: BookListener) -> None:
+        """注册盘口变更监听（在应用增量的事件循环中同步调用，应尽快返回）"""
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def _notify(self, book: L2OrderBook, delta: Optional[Delta]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(book, delta)
+            except Exception as e:
+                data_logger.error(f"盘口变更监听处理失败 - {book.symbol} - {str(e)}")
+
+    def apply_snapshot(self, symbol: str, bids: Sequence, asks: Sequence, last_update_id: int,
+                       timestamp: Optional[datetime] = None) -> L2OrderBook:
+        """应用完整快照，缓存的增量与快照接不上时再次请求重同步"""
+        book = self.get_or_create(symbol)
+        book.apply_snapshot(bids, asks, last_update_id, timestamp)
+        if book.synced:
+            self._resync_attempts.pop(symbol, None)
+            self._notify(book, None)
+        else:
+            self.request_resync(symbol)
+        return book
+
+    def apply_delta(self, symbol: str, first_id: int, final_id: int, bids: Sequence, asks: Sequence,
+                    timestamp: Optional[datetime] = None) -> bool:
+        """应用深度增量，未同步时自动触发快照重同步"""
+        book = self.get_or_create(symbol)
+        last_update_id = book.last_update_id
+        applied = book.apply_delta(first_id, final_id, bids, asks, timestamp)
+        if not applied and not book.synced:
+            self.request_resync(symbol)
+        elif applied and book.last_update_id != last_update_id:
+            self._notify(book, (first_id, final_id, bids, asks, book.timestamp))
+        return applied
+
+    def apply_binance_depth_event(self, event: dict) -> bool:
+        """
+        应用Binance深度增量推送（depthUpdate事件）
+
+        Args:
+            event: {"e": "depthUpdate", "E": 事件时间ms, "s": 交易对, "U": 首个序号, "u": 末个序号, "b": [...], "a": [...]}
+        """
+        return self.apply_delta(
+            event["s"],
+            int(event["U"]),
+            int(event["u"]),
+            event.get("b", []),
+            event.get("a", []),
+            datetime.utcfromtimestamp(event["E"] / 1000) if "E" in event else None
+        )
+
+    def request_resync(self, symbol: str) -> None:
+        """
+        在事件循环中异步获取快照并重同步，同一交易对同时只进行一次；
+        同步成功前的再次重同步按指数退避延迟，连续次数达到上限后停止
+        """
+        if self.snapshot_fetcher is None:
+            return
+        task = self._resyncing.get(symbol)
+        if task is not None and not task.done():
+            return
+        attempts = self._resync_attempts.get(symbol, 0)
+        if attempts >= self.max_resync_attempts:
+            if attempts == self.max_resync_attempts:
+                # 只记录一次
+                self._resync_attempts[symbol] = attempts + 1
+                data_logger.error(f"盘口快照重同步连续{attempts}次未成功，停止自动重同步 - {symbol}")
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = min(self.resync_delay * 2 ** (attempts - 1), self.max_resync_delay) if attempts else 0.0
+        self._resync_attempts[symbol] = attempts + 1
+        self._resyncing[symbol] = loop.create_task(self._resync(symbol, delay))
+
+    async def _resync(self, symbol: str, delay: float = 0.0) -> None:
+        try:
+            try:
+                if delay:
+                    await asyncio.sleep(delay)
+                snapshot = await self.snapshot_fetcher(symbol)
+            finally:
+                # 应用快照时可能需要再次重同步，先解除本次的占用
+                self._resyncing.pop(symbol, None)
+            if snapshot:
+                book = self.apply_snapshot(
+                    symbol,
+                    snapshot.get("bids", []),
+                    snapshot.get("asks", []),
+                    int(snapshot["lastUpdateId"])
+                )
+                if book.synced:
+                    data_logger.info(f"盘口快照重同步完成 - {symbol} - lastUpdateId={snapshot['lastUpdateId']}")
+        except Exception as e:
+            data_logger.error(f"盘口快照重同步失败 - {symbol} - {str(e)}")
+
+    def stats(self) -> Dict[str, dict]:
+        """各交易对盘口状态"""
+        return {
+            symbol: {
+                "synced": book.synced,
+                "last_update_id": book.last_update_id,
+                "bid_levels": len(book.bids),
+                "ask_levels": len(book.asks),
+                "updates": book.updates,
+                "gaps": book.gaps,
+                "resync_attempts": min(self._resync_attempts.get(symbol, 0), self.max_resync_attempts),
+                "timestamp": book.timestamp.isoformat() if book.timestamp else None
+            }
+            for symbol, book in self.books.items()
+        }
+
+
+# 全局内存盘口管理器
+order_book_manager = OrderBookManager()
@@ -0,0 +1,168 @@
+"""
+盘口历史记录与回放
+内存盘口的每条增量写入紧凑的增量日志，并定期保存完整盘口检查点（经写后缓冲与其他实时数据一起批量提交）；
+回放时定位到目标时间之前最近的检查点，再顺序应用其后的增量即可重建任意时刻的盘口。
+写后缓冲已满时增量被丢弃，该交易对的记录进入未同步状态，缓冲有空间后先保存检查点重新锚定
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.market import OrderBookCheckpoint, OrderBookDelta
+from app.services.orderbook_codec import encode_book, decode_levels
+from app.services.orderbook_engine import L2OrderBook, OrderBookManager, Delta, order_book_manager
+from app.services.write_buffer import WriteBuffer, market_write_buffer
+
+
+def _encode_full_book(book: L2OrderBook) -> bytes:
+    """编码完整盘口"""
+    bids, asks = book.top(max(len(book.bids), len(book.asks)))
+    return encode_book(bids, asks)
+
+
+class OrderBookRecorder:
+    """盘口历史记录器"""
+
+    def __init__(self, buffer: WriteBuffer = market_write_buffer,
+                 checkpoint_interval: float = 60.0, checkpoint_max_deltas: int = 2000):
+        """
+        Args:
+            buffer: 写后缓冲
+            checkpoint_interval: 检查点最小间隔（秒）
+            checkpoint_max_deltas: 两个检查点之间最多的增量条数，限制回放需要应用的增量数
+        """
+        self.buffer = buffer
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_max_deltas = checkpoint_max_deltas
+
+        # 每个交易对: [上次检查点时间(monotonic), 此后的增量条数]；没有记录表示未同步，下次变更时保存检查点
+        self._since_checkpoint: Dict[str, list] = {}
+
+        self.deltas_recorded = 0
+        self.checkpoints_recorded = 0
+        self.deltas_dropped = 0
+
+    def attach(self, manager: OrderBookManager = order_book_manager) -> None:
+        """注册到内存盘口管理器"""
+        manager.add_listener(self.on_book_changed)
+
+    def on_book_changed(self, book: L2OrderBook, delta: Optional[Delta]) -> None:
+        """
+        盘口变更回调：记录增量，按时间或增量条数生成检查点
+
+        Args:
+            book: 变更后的盘口
+            delta: 已应用的增量，快照重建时为None
+        """
+        state = self._since_checkpoint.get(book.symbol)
+        timestamp = book.timestamp or datetime.utcnow()
+
+        if delta is not None and state is not None:
+            first_id, final_id, bids, asks, delta_time = delta
+            if not self.buffer.put_nowait("order_book_delta", {
+                "symbol": book.symbol,
+                "timestamp": delta_time or timestamp,
+                "first_update_id": first_id,
+                "final_update_id": final_id,
+                "delta_data": encode_book(bids, asks)
+            }):
+                # 增量日志出现缺口，之后的增量在新检查点之前无法回放
+                self.deltas_dropped += 1
+                del self._since_checkpoint[book.symbol]
+                return
+            self.deltas_recorded += 1
+            state[1] += 1
+            if (state[1] < self.checkpoint_max_deltas
+                    and time.monotonic() - state[0] < self.checkpoint_interval):
+                return
+
+        # 快照重建（含首次同步）、未同步或达到检查点条件时保存完整盘口；
+        # 缓冲已满时不编码盘口，等下次变更再尝试
+        if self.buffer.full or not self.buffer.put_nowait("order_book_checkpoint", {
+            "symbol": book.symbol,
+            "timestamp": timestamp,
+            "update_id": book.last_update_id,
+            "book_data": _encode_full_book(book)
+        }):
+            if delta is None:
+                # 快照重建后旧的增量日志接不上，在新检查点写入前保持未同步
+                self._since_checkpoint.pop(book.symbol, None)
+            return
+        self.checkpoints_recorded += 1
+        self._since_checkpoint[book.symbol] = [time.monotonic(), 0]
+
+    def stats(self) -> dict:
+        """记录器统计信息"""
+        return {
+            "symbols": len(self._since_checkpoint),
+            "deltas_recorded": self.deltas_recorded,
+            "checkpoints_recorded": self.checkpoints_recorded,
+            "deltas_dropped": self.deltas_dropped
+        }
+
+
+def replay_order_book(db: Session, symbol: str, at: datetime) -> Optional[dict]:
+    """
+    重建指定时刻的盘口
+
+    Args:
+        db: 数据库会话
+        symbol: 交易对符号
+        at: 目标时间
+
+    Returns:
+        {"book": L2OrderBook, "checkpoint_time", "deltas_applied", "complete"}，目标时间之前没有检查点时返回None
+    """
+    checkpoint = db.query(OrderBookCheckpoint).filter(
+        OrderBookCheckpoint.symbol == symbol,
+        OrderBookCheckpoint.timestamp <= at
+    ).order_by(OrderBookCheckpoint.timestamp.desc(), OrderBookCheckpoint.update_id.desc()).first()
+
+    if not checkpoint:
+        return None
+
+    book = L2OrderBook(symbol)
+    bids, asks = decode_levels(checkpoint.book_data)
+    book.apply_snapshot(bids, asks, checkpoint.update_id, checkpoint.timestamp)
+
+    deltas = db.query(
+        OrderBookDelta.first_update_id,
+        OrderBookDelta.final_update_id,
+        OrderBookDelta.timestamp,
+        OrderBookDelta.delta_data
+    ).filter(
+        OrderBookDelta.symbol == symbol,
+        OrderBookDelta.final_update_id > checkpoint.update_id,
+        OrderBookDelta.timestamp <= at
+    ).order_by(OrderBookDelta.final_update_id).all()
+
+    applied = 0
+    complete = True
+    for first_id, final_id, timestamp, delta_data in deltas:
+        delta_bids, delta_asks = decode_levels(delta_data)
+        if not book.apply_delta(first_id, final_id, delta_bids, delta_asks, timestamp):
+            # 增量日志不连续（例如记录期间丢包），返回断点之前的盘口
+            complete = False
+            break
+        applied += 1
+
+    if complete:
+        book.timestamp = at
+
+    return {
+        "book": book,
+        "checkpoint_time": checkpoint.timestamp,
+        "deltas_applied": applied,
+        "complete": complete
+    }
+
+
+# 全局盘口历史记录器
+order_book_recorder = OrderBookRecorder(
+    checkpoint_interval=float(os.getenv("ORDERBOOK_CHECKPOINT_INTERVAL", "60")),
+    checkpoint_max_deltas=int(os.getenv("ORDERBOOK_CHECKPOINT_MAX_DELTAS", "2000"))
+)
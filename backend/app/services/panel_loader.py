@@ -0,0 +1,245 @@
+"""
+截面数据面板加载
+从 market_data 一次批量查询多个交易对的K线，按统一的交易日历对齐成 交易对 × 时间 的稠密矩阵，
+供选股、因子计算、组合回测等截面计算使用；股票池过大时按交易对分块加载，每块共用同一日历
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.models.market import MarketData
+from app.services.realtime_supervisor import PERIOD_SECONDS
+
+# 可加载的字段
+PANEL_FIELDS = ("open", "high", "low", "close", "volume", "turnover")
+PRICE_FIELDS = ("open", "high", "low", "close")
+
+# 日历: union 为股票池中任一交易对有K线的时间；regular 为按周期等间隔的连续时间（7×24交易的加密货币）；
+# 也可以直接传入时间序列
+Calendar = Union[str, Sequence[datetime], np.ndarray]
+
+
+@dataclass
+class Panel:
+    """
+    对齐后的面板数据
+    fields 中每个矩阵形状为 (交易对数, 时间数)，行顺序与 symbols 一致，列顺序与 timestamps 一致
+    """
+    symbols: List[str]
+    timestamps: np.ndarray
+    fields: Dict[str, np.ndarray] = field(default_factory=dict)
+    # 该时间点有实际K线
+    observed: Optional[np.ndarray] = None
+    # 停牌：处于首根与最后一根K线之间但没有K线
+    suspended: Optional[np.ndarray] = None
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.fields[name]
+
+    @property
+    def shape(self):
+        return len(self.symbols), len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(matrix.nbytes for matrix in self.fields.values())
+
+    def to_frame(self, name: str) -> pd.DataFrame:
+        """单个字段转为 DataFrame（行为时间，列为交易对）"""
+        return pd.DataFrame(self.fields[name].T, index=pd.DatetimeIndex(self.timestamps), columns=self.symbols)
+
+
+def _validate_fields(fields: Sequence[str]) -> List[str]:
+    fields = list(dict.fromkeys(fields))
+    unknown = [name for name in fields if name not in PANEL_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    if not fields:
+        raise ValueError("至少需要一个字段")
+    return fields
+
+
+def _filter_range(query, period: str, start_time: Optional[datetime], end_time: Optional[datetime]):
+    query = query.filter(MarketData.period == period)
+    if start_time:
+        query = query.filter(MarketData.timestamp >= start_time)
+    if end_time:
+        query = query.filter(MarketData.timestamp <= end_time)
+    return query
+
+
+def _chunks(symbols: Sequence[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(symbols), size):
+        yield list(symbols[i:i + size])
+
+
+def build_calendar(
+    db: Session,
+    symbols: Sequence[str],
+    period: str = "1d",
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    calendar: Calendar = "union",
+    chunk_size: int = 500
+) -> np.ndarray:
+    """
+    生成对齐用的交易日历
+
+    Args:
+        db: 数据库会话
+        symbols: 股票池
+        period: K线周期
+        start_time: 开始时间
+        end_time: 结束时间
+        calendar: union / regular / 时间序列，见 Calendar
+        chunk_size: union 日历按多少个交易对一组查询
+
+    Returns:
+        升序去重的 datetime64[ms] 数组
+    """
+    if isinstance(calendar, str):
+        if calendar == "union":
+            days = [np.empty(0, dtype="datetime64[ms]")]
+            for chunk in _chunks(symbols, chunk_size):
+                query = _filter_range(db.query(MarketData.timestamp).distinct().filter(
+                    MarketData.symbol.in_(chunk)), period, start_time, end_time)
+                days.append(np.array([row[0] for row in query.all()], dtype="datetime64[ms]"))
+            return np.unique(np.concatenate(days))
+        if calendar == "regular":
+            if period not in PERIOD_SECONDS:
+                raise ValueError(f"regular 日历不支持的周期: {period}")
+            if not start_time or not end_time:
+                raise ValueError("regular 日历需要指定开始和结束时间")
+            step = np.timedelta64(PERIOD_SECONDS[period], "s")
+            start = np.datetime64(start_time, "ms")
+            # 对齐到周期边界（与K线开始时间一致）
+            first = start - (start - np.datetime64(0, "ms")) % step
+            if first < start:
+                first += step
+            return np.arange(first, np.datetime64(end_time, "ms") + np.timedelta64(1, "ms"), step).astype("datetime64[ms]")
+        raise ValueError(f"不支持的日历: {calendar}")
+    return np.unique(np.asarray(calendar, dtype="datetime64[ms]"))
+
+
+def load_panel(
+    db: Session,
+    symbols: Sequence[str],
+    fields: Sequence[str] = ("close",),
+    period: str = "1d",
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    calendar: Calendar = "union",
+    dtype=np.float64,
+    ffill: bool = False
+) -> Panel:
+    """
+    加载对齐的面板数据（一次批量查询）
+
+    Args:
+        db: 数据库会话
+        symbols: 股票池，面板行顺序与之相同（重复项被忽略）
+        fields: 字段，见 PANEL_FIELDS
+        period: K线周期
+        start_time: 开始时间
+        end_time: 结束时间
+        calendar: 日历，见 Calendar；不在日历上的K线被丢弃
+        dtype: 矩阵类型，float32 可减少一半内存
+        ffill: 是否填充停牌时段：价格字段取前一根K线的收盘价，成交量/成交额取0；
+               首根K线之前和最后一根K线之后保持NaN
+
+    Returns:
+        面板数据，缺失位置为NaN
+    """
+    fields = _validate_fields(fields)
+    symbols = list(dict.fromkeys(symbols))
+    calendar = build_calendar(db, symbols, period, start_time, end_time, calendar)
+    return _load_chunk(db, symbols, fields, period, start_time, end_time, calendar, dtype, ffill)
+
+
+def iter_panels(
+    db: Session,
+    symbols: Sequence[str],
+    fields: Sequence[str] = ("close",),
+    period: str = "1d",
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    calendar: Calendar = "union",
+    dtype=np.float64,
+    ffill: bool = False,
+    chunk_size: int = 500
+) -> Iterator[Panel]:
+    """
+    分块加载面板数据，适用于整体放不进内存的股票池
+    先生成整个股票池的日历，再按 chunk_size 个交易对一块依次加载，各块的时间轴相同，参数见 load_panel
+
+    Yields:
+        每块交易对的面板数据
+    """
+    fields = _validate_fields(fields)
+    symbols = list(dict.fromkeys(symbols))
+    calendar = build_calendar(db, symbols, period, start_time, end_time, calendar, chunk_size)
+    for chunk in _chunks(symbols, chunk_size):
+        yield _load_chunk(db, chunk, fields, period, start_time, end_time, calendar, dtype, ffill)
+
+
+def estimate_panel_bytes(n_symbols: int, n_timestamps: int, n_fields: int, dtype=np.float64) -> int:
+    """估算面板占用的内存（字段矩阵与两个掩码）"""
+    cells = n_symbols * n_timestamps
+    return cells * n_fields * np.dtype(dtype).itemsize + cells * 2
+
+
+def _load_chunk(db: Session, symbols: List[str], fields: List[str], period: str,
+                start_time: Optional[datetime], end_time: Optional[datetime],
+                calendar: np.ndarray, dtype, ffill: bool) -> Panel:
+    """查询一组交易对并填入矩阵"""
+    n_symbols, n_times = len(symbols), len(calendar)
+    matrices = {name: np.full((n_symbols, n_times), np.nan, dtype=dtype) for name in fields}
+    observed = np.zeros((n_symbols, n_times), dtype=bool)
+
+    if n_symbols and n_times:
+        columns = [MarketData.symbol, MarketData.timestamp] + [getattr(MarketData, name) for name in fields]
+        query = _filter_range(db.query(*columns).filter(MarketData.symbol.in_(symbols)),
+                              period, start_time, end_time)
+        rows = query.all()
+        if rows:
+            row_symbols, row_times, *row_values = zip(*rows)
+            index = {symbol: i for i, symbol in enumerate(symbols)}
+            row_idx = np.fromiter((index[symbol] for symbol in row_symbols), dtype=np.int64, count=len(rows))
+            times = np.array(row_times, dtype="datetime64[ms]")
+            col_idx = np.searchsorted(calendar, times)
+            on_calendar = col_idx < n_times
+            on_calendar[on_calendar] = calendar[col_idx[on_calendar]] == times[on_calendar]
+            row_idx, col_idx = row_idx[on_calendar], col_idx[on_calendar]
+            observed[row_idx, col_idx] = True
+            for name, values in zip(fields, row_values):
+                # 成交额可能为空，None 转为NaN
+                values = np.array(values, dtype=np.float64)
+                matrices[name][row_idx, col_idx] = values[on_calendar]
+
+    # 首根K线之前、最后一根之后视为未上市/已退市，不算停牌
+    seen = np.maximum.accumulate(observed, axis=1)
+    remaining = np.maximum.accumulate(observed[:, ::-1], axis=1)[:, ::-1]
+    suspended = seen & remaining & ~observed
+
+    if ffill and suspended.any():
+        close = matrices.get("close")
+        if close is None and any(name in PRICE_FIELDS for name in fields):
+            close = _load_chunk(db, symbols, ["close"], period, start_time, end_time, calendar, dtype, False)["close"]
+        if close is not None:
+            # 每个位置最近一次有K线的列号
+            last = np.where(observed, np.arange(n_times), 0)
+            np.maximum.accumulate(last, axis=1, out=last)
+            prev_close = np.take_along_axis(close, last, axis=1)
+        for name in fields:
+            matrix = matrices[name]
+            if name in PRICE_FIELDS:
+                matrix[suspended] = prev_close[suspended]
+            else:
+                matrix[suspended] = 0
+
+    return Panel(symbols=symbols, timestamps=calendar, fields=matrices, observed=observed, suspended=suspended)
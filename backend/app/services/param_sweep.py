@@ -0,0 +1,307 @@
+"""
+参数优化
+对策略参数网格的每一组参数回测一次，分发到进程池并行计算：
+K线只读取一次并放入共享内存，工作进程在初始化时挂载（之后每个任务只传参数字典，不重复序列化价格数组），
+策略代码也只在每个工作进程编译一次。
+策略代码定义 signals(bars, params) 时使用向量化回测，否则使用事件驱动回测（on_bar）。
+结果按批写入 backtest_results（只含指标和统计，不含资金曲线和成交），
+执行进度写入 strategy_executions.progress
+"""
+
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context, shared_memory
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.strategy import BacktestResult, Strategy, StrategyExecution
+from app.services.backtest_engine import Bars, load_bars, simulate
+from app.services.event_backtest import EVENT_CALLBACKS, BarFeed, EventBacktest, load_strategy_code
+
+logger = logging.getLogger(__name__)
+
+# 放入共享内存的K线列，t 为 int64 毫秒，其余为 float64
+SHARED_COLUMNS = ("open", "high", "low", "close", "volume")
+
+# 按第一组参数的耗时估算，剩余任务在当前进程内串行执行少于该秒数时不启动进程池
+# （spawn 启动工作进程并导入依赖需要一两秒）
+PARALLEL_THRESHOLD_SECONDS = 5.0
+
+# 每批分发给工作进程的参数组的预计耗时（秒）：批次越大进程间通信越少，
+# 但已分发的批次无法取消，中途退出时需要等待它们完成
+CHUNK_SECONDS = 0.2
+
+# BacktestResult 的指标列，失败的参数组只填写非空列
+METRIC_COLUMNS = ("initial_capital", "final_capital", "total_return", "annual_return", "sharpe_ratio",
+                  "max_drawdown", "win_rate", "total_trades", "profit_factor")
+
+# 共享内存描述: (名称, K线根数)
+SharedBars = Tuple[str, int]
+
+# 工作进程状态：在 _init_worker 中设置
+_worker: Dict[str, Any] = {}
+
+
+def parameter_grid(space: Dict[str, Sequence]) -> List[Dict[str, Any]]:
+    """
+    参数网格的笛卡尔积
+
+    Args:
+        space: 参数名 -> 候选值列表，如 {"fast": [5, 10], "slow": [20, 60]}
+
+    Returns:
+        参数字典列表，按参数名顺序展开
+    """
+    names = list(space)
+    for name in names:
+        if isinstance(space[name], (str, bytes)) or not len(space[name]):
+            raise ValueError(f"参数 {name} 的候选值须为非空列表")
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _share_bars(bars: Bars) -> shared_memory.SharedMemory:
+    """把K线列拷贝到一块共享内存：t (int64) 之后依次为各 float64 列"""
+    n_bars = len(bars["t"])
+    shm = shared_memory.SharedMemory(create=True, size=max(8 * n_bars * (len(SHARED_COLUMNS) + 1), 1))
+    view = _attach_bars(shm, n_bars)
+    view["t"][:] = np.asarray(bars["t"], dtype="datetime64[ms]")
+    for name in SHARED_COLUMNS:
+        view[name][:] = bars[name]
+    return shm
+
+
+def _attach_bars(shm: shared_memory.SharedMemory, n_bars: int) -> Bars:
+    """共享内存上的K线列视图（不拷贝）"""
+    bars = {"t": np.ndarray((n_bars,), dtype="datetime64[ms]", buffer=shm.buf)}
+    for i, name in enumerate(SHARED_COLUMNS, start=1):
+        bars[name] = np.ndarray((n_bars,), dtype=np.float64, buffer=shm.buf, offset=8 * n_bars * i)
+    return bars
+
+
+def _readonly(bars: Bars) -> Bars:
+    """K线列的只读视图，策略代码原地修改时抛出异常，而不是污染后续参数组使用的K线"""
+    views = {}
+    for name, column in bars.items():
+        view = np.asarray(column).view()
+        view.flags.writeable = False
+        views[name] = view
+    return views
+
+
+def _init_worker(shared: Optional[SharedBars], bars: Optional[Bars], code: str,
+                 base_params: Dict[str, Any], options: Dict[str, Any]) -> None:
+    """
+    工作进程初始化：挂载共享内存中的K线、编译策略代码
+
+    Args:
+        shared: 共享内存描述，在当前进程内执行时为None
+        bars: 在当前进程内执行时直接使用的K线
+        code: 策略代码
+        base_params: 策略默认参数
+        options: 回测参数
+    """
+    if shared is not None:
+        name, n_bars = shared
+        shm = shared_memory.SharedMemory(name=name)
+        _worker["shm"] = shm
+        bars = _attach_bars(shm, n_bars)
+    bars = _readonly(bars)
+    callbacks = load_strategy_code(code)
+    _worker.update(bars=bars, callbacks=callbacks, base_params=base_params, options=options)
+    if "signals" not in callbacks:
+        _worker["feed"] = BarFeed(bars)
+
+
+def _evaluate(params: Dict[str, Any]) -> Dict[str, Any]:
+    """回测一组参数，只返回指标和统计"""
+    merged = {**_worker["base_params"], **params}
+    callbacks = _worker["callbacks"]
+    options = _worker["options"]
+    try:
+        if "signals" in callbacks:
+            bars = _worker["bars"]
+            output = simulate(bars, callbacks["signals"](bars, merged), **options)
+        else:
+            handlers = {name: callbacks[name] for name in EVENT_CALLBACKS if name in callbacks}
+            annualization = options.get("annualization")
+            engine_options = {key: value for key, value in options.items() if key != "annualization"}
+            output = EventBacktest(_worker["feed"], params=merged, **handlers, **engine_options).run(annualization)
+    except Exception as exc:
+        return {"params": params, "error": f"{type(exc).__name__}: {exc}"}
+    return {"params": params, "metrics": output.metrics, "statistics": output.statistics}
+
+
+def _iter_results(tasks: List[Dict[str, Any]], bars: Bars, code: str, base_params: Dict[str, Any],
+                  options: Dict[str, Any], max_workers: int) -> Iterator[Dict[str, Any]]:
+    """按任务顺序逐个产出回测结果：先在当前进程内执行第一组，预计剩余耗时较长时再分发到进程池"""
+    _init_worker(None, bars, code, base_params, options)
+    try:
+        start = time.perf_counter()
+        yield _evaluate(tasks[0])
+        elapsed = time.perf_counter() - start
+        remaining = tasks[1:]
+        if max_workers <= 1 or elapsed * len(remaining) < PARALLEL_THRESHOLD_SECONDS:
+            for params in remaining:
+                yield _evaluate(params)
+            return
+    finally:
+        _worker.clear()
+
+    shm = _share_bars(bars)
+    try:
+        chunksize = max(1, min(int(CHUNK_SECONDS / max(elapsed, 1e-6)), len(remaining) // (max_workers * 4)))
+        # spawn 启动的工作进程不继承主进程的数据库连接和线程
+        pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=((shm.name, len(bars["t"])), None, code, base_params, options))
+        try:
+            yield from pool.map(_evaluate, remaining, chunksize=chunksize)
+        except BaseException:
+            # 调用方中途退出（写库失败、生成器被关闭）时取消尚未开始的任务，只等待正在执行的批次
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _result_row(result: Dict[str, Any], execution: StrategyExecution, strategy: Strategy, symbol: str,
+                bars: Bars, period: str, initial_capital: float, now: datetime) -> Dict[str, Any]:
+    """回测结果转为 backtest_results 行"""
+    params = result["params"]
+    label = ", ".join(f"{key}={value}" for key, value in params.items())
+    row = {
+        "strategy_id": strategy.id,
+        "name": f"{strategy.name} 参数优化#{execution.id} ({label})"[:100],
+        "start_date": bars["t"][0].astype(datetime),
+        "end_date": bars["t"][-1].astype(datetime),
+        "symbol": symbol,
+        "parameters": {"period": period, "execution_id": execution.id, "params": params},
+        "equity_curve": [],
+        "trades_data": [],
+        "created_at": now,
+        "completed_at": now
+    }
+    if "error" in result:
+        row.update(dict.fromkeys(METRIC_COLUMNS), initial_capital=initial_capital, final_capital=initial_capital,
+                   total_return=0.0, total_trades=0, statistics={}, status="failed", error_message=result["error"])
+    else:
+        row.update(result["metrics"], statistics=result["statistics"], status="completed", error_message=None)
+    return row
+
+
+def _rank_key(result: Dict[str, Any], objective: str) -> float:
+    value = result.get("metrics", {}).get(objective)
+    return value if value is not None and np.isfinite(value) else -np.inf
+
+
+def run_parameter_sweep(
+    db: Session,
+    strategy: Strategy,
+    symbol: str,
+    space: Dict[str, Sequence],
+    period: str = "1d",
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    objective: str = "sharpe_ratio",
+    max_workers: Optional[int] = None,
+    batch_size: int = 200,
+    top: int = 10,
+    **options
+) -> StrategyExecution:
+    """
+    参数网格优化
+
+    Args:
+        db: 数据库会话
+        strategy: 策略（使用其 code，parameters 为未参与优化的默认参数）
+        symbol: 交易对符号
+        space: 参数名 -> 候选值列表
+        period: K线周期
+        start_date: 开始时间
+        end_date: 结束时间
+        objective: 排序指标（BacktestResult 的指标列，越大越好）
+        max_workers: 工作进程数，默认为CPU核数；为1时在当前进程内执行
+        batch_size: 每累计多少个结果写库并更新一次进度
+        top: 执行记录中保留的最优参数组数
+        **options: 回测参数（向量化回测见 simulate，事件驱动回测见 EventBacktest）
+
+    Returns:
+        执行记录，result_data 中含最优参数和排名
+    """
+    tasks = parameter_grid(space)
+    callbacks = load_strategy_code(strategy.code)
+    bars = load_bars(db, symbol, period, start_date, end_date)
+    if not len(bars["t"]):
+        raise ValueError(f"{symbol} 在该时间范围内没有 {period} K线")
+
+    execution = StrategyExecution(
+        strategy_id=strategy.id,
+        execution_type="optimization",
+        status="running",
+        start_time=datetime.utcnow(),
+        progress=0,
+        parameters={"symbol": symbol, "period": period, "space": space, "objective": objective,
+                    "engine": "vector" if "signals" in callbacks else "event", "tasks": len(tasks)}
+    )
+    db.add(execution)
+    db.commit()
+
+    workers = max_workers or os.cpu_count() or 1
+    initial_capital = float(options.get("initial_capital", 1_000_000.0))
+    ranking: List[Dict[str, Any]] = []
+    buffer: List[Dict[str, Any]] = []
+    done = failed = 0
+
+    def flush():
+        if buffer:
+            db.connection().execute(insert(BacktestResult.__table__), buffer)
+            buffer.clear()
+        execution.progress = round(100.0 * done / len(tasks), 2)
+        db.commit()
+
+    results = _iter_results(tasks, bars, strategy.code, strategy.parameters or {}, options, workers)
+    try:
+        for result in results:
+            done += 1
+            if "error" in result:
+                failed += 1
+            else:
+                ranking.append({"params": result["params"], "metrics": result["metrics"]})
+            buffer.append(_result_row(result, execution, strategy, symbol, bars, period,
+                                      initial_capital, datetime.utcnow()))
+            if len(buffer) >= batch_size:
+                flush()
+        flush()
+    except Exception as exc:
+        # 先关闭结果生成器，取消进程池中尚未执行的参数组
+        results.close()
+        db.rollback()
+        logger.exception("参数优化失败: strategy=%s symbol=%s", strategy.id, symbol)
+        execution.status = "failed"
+        execution.error_message = str(exc)
+        execution.end_time = datetime.utcnow()
+        db.commit()
+        raise
+
+    ranking.sort(key=lambda item: _rank_key(item, objective), reverse=True)
+    execution.status = "completed"
+    execution.progress = 100
+    execution.end_time = datetime.utcnow()
+    execution.result_data = {
+        "objective": objective,
+        "completed": done,
+        "failed": failed,
+        "best_params": ranking[0]["params"] if ranking else None,
+        "top": ranking[:top]
+    }
+    db.commit()
+    return execution
@@ -0,0 +1,452 @@
+"""
+实时更新任务管理
+在服务进程的事件循环中运行轮询任务和WebSocket推送任务（binance 同一周期的交易对合并为一个轮询任务，
+每轮并发拉取；A股数据源按交易对各一个任务）：
+轮询间隔随交易时段自适应（交易时段按设定间隔，休市时放慢），出错后指数退避；
+任务可启动、停止、列出，并报告数据延迟和吞吐
+"""
+
+import asyncio
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from app.core.logging_config import get_data_logger_instance, log_manager
+from app.services.write_buffer import market_write_buffer
+
+data_logger = get_data_logger_instance()
+
+# K线周期 -> 秒
+PERIOD_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "4h": 14400, "1d": 86400}
+
+# A股交易时段（北京时间，不含节假日）
+CN_TZ = timezone(timedelta(hours=8))
+CN_SESSIONS = ((9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60))
+
+
+def infer_data_source(symbol: str) -> str:
+    """根据代码格式推断数据源：A股（.SH/.SZ）使用baostock，其余视为加密货币使用binance"""
+    return "baostock" if symbol.upper().endswith((".SH", ".SZ")) else "binance"
+
+
+def is_market_open(market: str, now: Optional[datetime] = None) -> bool:
+    """
+    判断市场当前是否处于交易时段
+
+    Args:
+        market: crypto（全天交易）/ cn（A股）
+        now: 当前时间（带时区），默认取系统时间
+
+    Returns:
+        是否处于交易时段
+    """
+    if market != "cn":
+        return True
+    now = (now or datetime.now(timezone.utc)).astimezone(CN_TZ)
+    if now.weekday() >= 5:
+        return False
+    minute = now.hour * 60 + now.minute
+    return any(start <= minute < end for start, end in CN_SESSIONS)
+
+
+class SupervisedTask:
+    """单个实时更新任务的状态"""
+
+    def __init__(self, task_id: str, kind: str, symbols: List[str], data_source: str,
+                 period: str, interval: float, bar_source: str = "kline"):
+        self.task_id = task_id
+        self.kind = kind
+        self.symbols = symbols
+        self.data_source = data_source
+        self.market = "crypto" if data_source == "binance" else "cn"
+        self.period = period
+        # 推送任务的K线来源：kline 交易所推送的K线，trade 逐笔成交自行合成
+        self.bar_source = bar_source
+        self.interval = interval
+        self.next_interval = 0.0
+        self.status = "starting"
+
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self.last_run: Optional[datetime] = None
+        self.last_success: Optional[datetime] = None
+        self.last_data_time: Optional[datetime] = None
+        self.last_duration = 0.0
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.rows = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        # 多交易对轮询任务中上一轮失败的交易对
+        self.failed_symbols: List[str] = []
+
+        self.collector = None
+        self.future: Optional[asyncio.Task] = None
+
+    def lag_seconds(self) -> Optional[float]:
+        """数据延迟：最新K线结束时间到当前的秒数，最新K线仍在形成中时为0"""
+        if self.kind == "stream":
+            stats = self.collector.realtime_stats if self.collector is not None else None
+            last_message = stats.get("last_message_time") if stats else None
+            return round(time.time() - last_message, 3) if last_message else None
+        if self.last_data_time is None:
+            return None
+        bar_end = self.last_data_time + timedelta(seconds=PERIOD_SECONDS.get(self.period, 0))
+        return round(max((datetime.now() - bar_end).total_seconds(), 0.0), 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        uptime = max(time.monotonic() - self._started, 1e-9)
+        rows = self.rows
+        result = {
+            "task_id": self.task_id,
+            "kind": self.kind,
+            "symbols": self.symbols,
+            "data_source": self.data_source,
+            "period": self.period,
+            "bar_source": self.bar_source,
+            "status": self.status,
+            "update_interval": self.interval,
+            "next_interval": round(self.next_interval, 3),
+            "start_time": self.started_at.isoformat(),
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_success": self.last_success.isoformat() if self.last_success else None,
+            "last_data_time": self.last_data_time.isoformat() if self.last_data_time else None,
+            "last_duration": round(self.last_duration, 3),
+            "lag_seconds": self.lag_seconds(),
+            "runs": self.runs,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "failed_symbols": self.failed_symbols,
+            "last_error": self.last_error
+        }
+        if self.kind == "stream" and self.collector is not None and self.collector.realtime_stats:
+            stats = self.collector.realtime_stats
+            rows = stats["klines"] + stats["tickers"] + stats["trades"]
+            result["connected"] = stats["connected"]
+            result["connects"] = stats["connects"]
+            result["messages"] = stats["messages"]
+            result["messages_per_second"] = round(stats["messages"] / uptime, 3)
+        result["rows"] = rows
+        result["rows_per_second"] = round(rows / uptime, 3)
+        return result
+
+
+class RealtimeSupervisor:
+    """实时更新任务管理器"""
+
+    def __init__(self, idle_factor: float = 10.0, max_idle_interval: float = 1800.0,
+                 max_backoff: float = 600.0):
+        """
+        Args:
+            idle_factor: 休市时轮询间隔相对设定间隔的倍数
+            max_idle_interval: 休市时轮询间隔上限（秒）
+            max_backoff: 出错后退避间隔上限（秒）
+        """
+        self.idle_factor = idle_factor
+        self.max_idle_interval = max_idle_interval
+        self.max_backoff = max_backoff
+
+        self.tasks: Dict[str, SupervisedTask] = {}
+        self._collector = None
+        # baostock/tushare 是同步接口且共享全局登录状态，放在单独的线程中串行调用，避免阻塞事件循环
+        self._blocking_executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self, symbols: List[str], update_interval: float = 60, data_source: Optional[str] = None,
+              period: Optional[str] = None, mode: str = "poll",
+              bar_source: str = "kline") -> List[Dict[str, Any]]:
+        """
+        启动实时更新任务（需在事件循环中调用）
+
+        Args:
+            symbols: 交易对列表
+            update_interval: 交易时段的轮询间隔（秒）
+            data_source: 数据源（binance/baostock/tushare），默认按代码格式推断
+            period: K线周期，默认加密货币1m、A股1d
+            mode: poll（binance 同一周期的交易对共用一个轮询任务，A股每个交易对一个）/
+                  stream（所有交易对共用一个WebSocket推送任务，仅binance）
+            bar_source: 推送任务的K线来源，kline（交易所推送的K线）/ trade（订阅逐笔成交自行合成K线）
+
+        Returns:
+            启动或加入的任务状态列表；交易对已有同类任务时只更新其间隔
+        """
+        if not symbols:
+            raise ValueError("交易对列表不能为空")
+        if mode not in ("poll", "stream"):
+            raise ValueError(f"不支持的任务类型: {mode}")
+        if bar_source not in ("kline", "trade"):
+            raise ValueError(f"不支持的K线来源: {bar_source}")
+        if bar_source == "trade" and mode != "stream":
+            raise ValueError("逐笔成交合成K线仅支持stream任务")
+        loop = asyncio.get_running_loop()
+
+        if mode == "stream":
+            if data_source not in (None, "binance") or any(infer_data_source(s) != "binance" for s in symbols):
+                raise ValueError("WebSocket推送仅支持binance交易对")
+            if any(task.kind == "stream" for task in self.tasks.values()):
+                raise ValueError("已有WebSocket推送任务在运行，请先停止")
+            task = SupervisedTask(self._new_task_id("stream"), "stream", [s.upper() for s in symbols],
+                                  "binance", "1m", update_interval, bar_source)
+            task.future = loop.create_task(self._run_stream(task))
+            self.tasks[task.task_id] = task
+            return [task.to_dict()]
+
+        sources = {symbol: data_source or infer_data_source(symbol) for symbol in symbols}
+        for source in sources.values():
+            if source not in ("binance", "baostock", "tushare"):
+                raise ValueError(f"不支持的数据源: {source}")
+
+        touched: Dict[str, SupervisedTask] = {}
+        for symbol, source in sources.items():
+            task_period = period or ("1m" if source == "binance" else "1d")
+            existing = self._find_poll_task(symbol, task_period)
+            if existing is not None:
+                existing.interval = update_interval
+                touched[existing.task_id] = existing
+                continue
+            if source == "binance":
+                # 同一周期的binance交易对合并到一个任务，每轮共用连接池并发拉取
+                group = self._find_binance_group(task_period)
+                if group is not None:
+                    group.symbols.append(symbol)
+                    group.interval = update_interval
+                    touched[group.task_id] = group
+                    continue
+            task = SupervisedTask(self._new_task_id(f"binance_{task_period}" if source == "binance" else symbol),
+                                  "poll", [symbol], source, task_period, update_interval)
+            task.future = loop.create_task(self._run_poll(task))
+            self.tasks[task.task_id] = task
+            touched[task.task_id] = task
+        started = [task.to_dict() for task in touched.values()]
+
+        data_logger.info(f"启动实时更新任务: {', '.join(item['task_id'] for item in started)}")
+        return started
+
+    def stop(self, task_id: Optional[str] = None, symbols: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        停止任务，未指定任务ID和交易对时停止全部任务；
+        按交易对停止时，多交易对轮询任务只移除这些交易对，全部移除后才停止任务
+
+        Returns:
+            已停止（或移除了交易对）的任务状态列表
+        """
+        stopped = []
+        if task_id:
+            targets = [self.tasks[task_id]] if task_id in self.tasks else []
+        elif symbols:
+            wanted = {s.upper() for s in symbols}
+            targets = []
+            for task in self.tasks.values():
+                if not wanted & {s.upper() for s in task.symbols}:
+                    continue
+                remaining = [s for s in task.symbols if s.upper() not in wanted]
+                if task.kind == "poll" and remaining:
+                    task.symbols = remaining
+                    stopped.append(task.to_dict())
+                    data_logger.info(f"实时更新任务 {task.task_id} 移除交易对，剩余: {', '.join(remaining)}")
+                else:
+                    targets.append(task)
+        else:
+            targets = list(self.tasks.values())
+
+        for task in targets:
+            # 推送任务取消时采集器仍会输出已定稿的K线并提交写后缓冲
+            task.future.cancel()
+            task.status = "stopped"
+            del self.tasks[task.task_id]
+            stopped.append(task.to_dict())
+
+        if stopped:
+            data_logger.info(f"停止实时更新任务: {', '.join(item['task_id'] for item in stopped)}")
+        return stopped
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取单个任务状态"""
+        task = self.tasks.get(task_id)
+        return task.to_dict() if task is not None else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """列出所有运行中的任务"""
+        return [task.to_dict() for task in self.tasks.values()]
+
+    async def shutdown(self) -> None:
+        """停止全部任务并释放连接（服务关闭时调用）"""
+        futures = [task.future for task in self.tasks.values() if task.future is not None]
+        self.stop()
+        if futures:
+            await asyncio.wait(futures, timeout=30)
+        if self._collector is not None:
+            await self._collector.__aexit__(None, None, None)
+            self._collector = None
+        if self._blocking_executor is not None:
+            self._blocking_executor.shutdown(wait=False)
+            self._blocking_executor = None
+
+    def next_interval(self, task: SupervisedTask, now: Optional[datetime] = None) -> float:
+        """
+        计算下一次轮询前的等待时间
+
+        Args:
+            task: 任务
+            now: 当前时间（带时区），默认取系统时间
+
+        Returns:
+            等待秒数：出错时按连续失败次数指数退避，交易时段为设定间隔，休市时放慢
+        """
+        if task.consecutive_errors:
+            delay = min(task.interval * 2 ** (task.consecutive_errors - 1), self.max_backoff)
+            return delay * random.uniform(0.8, 1.2)
+        if is_market_open(task.market, now):
+            return task.interval
+        return min(task.interval * self.idle_factor, max(self.max_idle_interval, task.interval))
+
+    def _new_task_id(self, name: str) -> str:
+        return f"realtime_{name}_{uuid.uuid4().hex[:8]}"
+
+    def _find_poll_task(self, symbol: str, period: str) -> Optional[SupervisedTask]:
+        for task in self.tasks.values():
+            if task.kind == "poll" and task.period == period and symbol.upper() in (s.upper() for s in task.symbols):
+                return task
+        return None
+
+    def _find_binance_group(self, period: str) -> Optional[SupervisedTask]:
+        for task in self.tasks.values():
+            if task.kind == "poll" and task.data_source == "binance" and task.period == period:
+                return task
+        return None
+
+    async def _get_collector(self):
+        """所有轮询任务共用一个采集器（及其HTTP连接池），写库经写后缓冲，不占用数据库会话"""
+        if self._collector is None:
+            from app.services.data_collector import DataCollector
+            self._collector = await DataCollector(None).__aenter__()
+        return self._collector
+
+    async def _run_poll(self, task: SupervisedTask) -> None:
+        """轮询任务主循环"""
+        collector = await self._get_collector()
+        while True:
+            task.status = "running"
+            task.last_run = datetime.now(timezone.utc)
+            start = time.perf_counter()
+            try:
+                rows = await self._poll_once(collector, task)
+                task.rows += rows
+                task.last_success = datetime.now(timezone.utc)
+                task.consecutive_errors = 0
+                task.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                task.errors += 1
+                task.consecutive_errors += 1
+                task.last_error = str(e)
+                log_manager.log_data_collection(",".join(task.symbols), task.data_source, "warning",
+                                                f"实时轮询失败（连续{task.consecutive_errors}次）: {str(e)}")
+            task.runs += 1
+            task.last_duration = time.perf_counter() - start
+
+            task.next_interval = self.next_interval(task)
+            if task.consecutive_errors:
+                task.status = "backoff"
+            elif not is_market_open(task.market):
+                task.status = "idle"
+            await asyncio.sleep(task.next_interval)
+
+    async def _poll_once(self, collector, task: SupervisedTask) -> int:
+        """拉取一次最新K线并写入写后缓冲，返回写入条数"""
+        if task.data_source == "binance":
+            # 任务中的所有交易对并发按游标增量拉取，退避期间落后的K线一并补齐
+            symbols = list(task.symbols)
+            results = await collector.poll_binance_klines(symbols, task.period)
+            task.failed_symbols = [symbol for symbol in symbols if results[symbol] is None]
+            if len(task.failed_symbols) == len(symbols):
+                raise RuntimeError("获取数据失败")
+            if task.failed_symbols:
+                log_manager.log_data_collection(",".join(task.failed_symbols), "binance", "warning",
+                                                "实时轮询部分交易对失败")
+            # 数据延迟按最落后的交易对计算
+            cursors = [collector.kline_cursors.get((symbol, task.period)) for symbol in symbols]
+            cursors = [cursor for cursor in cursors if cursor is not None]
+            task.last_data_time = min(cursors) if cursors else None
+            return sum(rows for rows in results.values() if rows)
+
+        symbol = task.symbols[0]
+        today = datetime.now(CN_TZ)
+        since = today - timedelta(days=7) if task.last_data_time is None else today
+        if task.data_source == "baostock":
+            fetch = collector.fetch_baostock_data(symbol, since.strftime("%Y-%m-%d"),
+                                                  today.strftime("%Y-%m-%d"), "d")
+        else:
+            fetch = collector.fetch_tushare_data(symbol, since.strftime("%Y%m%d"),
+                                                 today.strftime("%Y%m%d"), "D")
+        if self._blocking_executor is None:
+            self._blocking_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="realtime-poll")
+        data = await asyncio.get_running_loop().run_in_executor(self._blocking_executor, asyncio.run, fetch)
+
+        if data is None:
+            raise RuntimeError("获取数据失败")
+
+        rows = _to_market_rows(symbol, task.period, data)
+        for row in rows:
+            await market_write_buffer.put("market_data", row)
+        if rows:
+            latest = max(row["timestamp"] for row in rows)
+            if task.last_data_time is None or latest > task.last_data_time:
+                task.last_data_time = latest
+        return len(rows)
+
+    async def _run_stream(self, task: SupervisedTask) -> None:
+        """WebSocket推送任务：采集器内部负责断线重连，采集协程异常退出时按退避间隔重启"""
+        from app.services.data_collector import DataCollector
+
+        shared = await self._get_collector()
+        while True:
+            task.collector = DataCollector(None)
+            task.collector.session = shared.session
+            task.status = "running"
+            task.last_run = datetime.now(timezone.utc)
+            try:
+                await task.collector.start_realtime_collection(task.symbols, bar_source=task.bar_source)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                task.errors += 1
+                task.consecutive_errors += 1
+                task.last_error = str(e)
+                log_manager.log_data_collection("realtime", "websocket", "error",
+                                                "实时推送任务异常退出", e)
+            task.next_interval = self.next_interval(task)
+            task.status = "backoff"
+            await asyncio.sleep(task.next_interval)
+
+
+def _to_market_rows(symbol: str, period: str, data) -> List[dict]:
+    """将采集结果（K线字典列表或DataFrame）转换为 MarketData 字段"""
+    if isinstance(data, pd.DataFrame):
+        rows = []
+        for index, row in data.iterrows():
+            rows.append({
+                "timestamp": index.to_pydatetime() if hasattr(index, "to_pydatetime") else pd.to_datetime(index),
+                "open": float(row["open"]) if "open" in row else 0,
+                "high": float(row["high"]) if "high" in row else 0,
+                "low": float(row["low"]) if "low" in row else 0,
+                "close": float(row["close"]) if "close" in row else 0,
+                "volume": float(row["volume"]) if "volume" in row else 0
+            })
+        data = rows
+    return [dict(item, symbol=symbol, period=period) for item in data]
+
+
+# 全局实时更新任务管理器
+realtime_supervisor = RealtimeSupervisor(
+    idle_factor=float(os.getenv("REALTIME_IDLE_FACTOR", "10")),
+    max_idle_interval=float(os.getenv("REALTIME_MAX_IDLE_INTERVAL", "1800")),
+    max_backoff=float(os.getenv("REALTIME_MAX_BACKOFF", "600"))
+)
@@ -0,0 +1,272 @@
+"""
+滚动窗口基础算子
+批量版本作用于NumPy数组的最后一维（单序列或 交易对 × 时间 面板），流式版本逐个推入数值，两者结果一致：
+- 滚动最大/最小值：批量用 van Herk/Gil-Werman 分块前缀/后缀极值（每个元素常数次比较，与窗口长度无关），
+  流式用单调队列（每步均摊O(1)）
+- 滚动分位数/中位数：流式用有序表（sortedcontainers，插入/删除O(log w)），
+  批量交给 pandas 的跳表实现；分位数在相邻两个值之间线性插值（与 pandas/NumPy 默认一致）
+NaN 不进入窗口统计，窗口内有效值少于 min_periods 时结果为NaN（与 pandas rolling 一致）
+"""
+
+from collections import deque
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sortedcontainers import SortedList
+
+NAN = float("nan")
+
+
+def _valid_counts(x: np.ndarray, n: int) -> np.ndarray:
+    """每个位置最近n个值中的非NaN个数"""
+    total = np.cumsum(~np.isnan(x), axis=-1)
+    total[..., n:] = total[..., n:] - total[..., :-n]
+    return total
+
+
+def _rolling_extreme(x: np.ndarray, n: int, min_periods: Optional[int], ufunc) -> np.ndarray:
+    if n < 1:
+        raise ValueError("窗口长度至少为1")
+    x = np.asarray(x, dtype=np.float64)
+    length = x.shape[-1]
+    if length == 0:
+        return x.copy()
+
+    if n == 1:
+        result = x.copy()
+    else:
+        # 按窗口长度分块，块内前缀极值 g 与后缀极值 h；
+        # 窗口 [i-n+1, i] 跨越至多两块，其极值为 h[i-n+1] 与 g[i] 中的较大（小）者
+        blocks = -(-length // n)
+        padded = np.full(x.shape[:-1] + (blocks * n,), np.nan)
+        padded[..., :length] = x
+        shaped = padded.reshape(x.shape[:-1] + (blocks, n))
+        # fmax/fmin 忽略NaN，全为NaN时结果为NaN
+        g = ufunc.accumulate(shaped, axis=-1).reshape(padded.shape)[..., :length]
+        h = ufunc.accumulate(shaped[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)[..., :length]
+        result = g.copy()
+        if length >= n:
+            result[..., n - 1:] = ufunc(h[..., :length - n + 1], g[..., n - 1:])
+
+    result[_valid_counts(x, n) < (n if min_periods is None else min(max(min_periods, 1), n))] = np.nan
+    return result
+
+
+def rolling_max(x: np.ndarray, n: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """
+    滚动最大值
+
+    Args:
+        x: 一维序列或二维矩阵（沿最后一维滚动）
+        n: 窗口长度
+        min_periods: 窗口内最少有效值个数，默认为n
+
+    Returns:
+        与 x 同形状的数组
+    """
+    return _rolling_extreme(x, n, min_periods, np.fmax)
+
+
+def rolling_min(x: np.ndarray, n: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """滚动最小值，参数见 rolling_max"""
+    return _rolling_extreme(x, n, min_periods, np.fmin)
+
+
+def rolling_quantile(x: np.ndarray, n: int, q: float, min_periods: Optional[int] = None) -> np.ndarray:
+    """
+    滚动分位数（线性插值）
+
+    Args:
+        x: 一维序列或二维矩阵（沿最后一维滚动）
+        n: 窗口长度
+        q: 分位点，0~1
+        min_periods: 窗口内最少有效值个数，默认为n
+
+    Returns:
+        与 x 同形状的数组
+    """
+    if not 0.0 <= q <= 1.0:
+        raise ValueError("分位点须在0到1之间")
+    return _pandas_rolling(x, n, min_periods, lambda rolling: rolling.quantile(q))
+
+
+def rolling_median(x: np.ndarray, n: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """滚动中位数（偶数个值时取中间两个的平均），参数见 rolling_quantile"""
+    return _pandas_rolling(x, n, min_periods, lambda rolling: rolling.median())
+
+
+def _pandas_rolling(x: np.ndarray, n: int, min_periods: Optional[int], method) -> np.ndarray:
+    if n < 1:
+        raise ValueError("窗口长度至少为1")
+    x = np.asarray(x, dtype=np.float64)
+    frame = pd.DataFrame(x.reshape(-1, x.shape[-1]).T)
+    min_periods = n if min_periods is None else min(max(min_periods, 1), n)
+    result = method(frame.rolling(n, min_periods=min_periods))
+    return np.ascontiguousarray(result.to_numpy().T).reshape(x.shape)
+
+
+def drawdown(x: np.ndarray) -> np.ndarray:
+    """
+    回撤序列：相对此前最高点的跌幅（<= 0），沿最后一维计算；NaN 不更新最高点
+
+    Args:
+        x: 净值/价格序列或矩阵
+
+    Returns:
+        与 x 同形状的数组
+    """
+    x = np.asarray(x, dtype=np.float64)
+    peak = np.fmax.accumulate(x, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return x / peak - 1.0
+
+
+class RollingExtreme:
+    """流式滚动最大值（或最小值），单调队列实现，每步均摊O(1)"""
+
+    __slots__ = ("n", "sign", "min_periods", "count", "valid", "items")
+
+    def __init__(self, n: int, maximum: bool = True, min_periods: int = 1):
+        """
+        Args:
+            n: 窗口长度
+            maximum: True 为最大值，False 为最小值
+            min_periods: 窗口内最少有效值个数，不足时返回NaN
+        """
+        if n < 1:
+            raise ValueError("窗口长度至少为1")
+        self.n = n
+        self.sign = 1.0 if maximum else -1.0
+        self.min_periods = max(min_periods, 1)
+        self.count = 0
+        # 窗口内有效值的序号（用于计数）
+        self.valid = deque()
+        # (序号, 值)，值按 sign 方向单调递减
+        self.items = deque()
+
+    def update(self, x: float) -> float:
+        """推入一个值，返回包含该值在内的最近n个值的极值"""
+        items = self.items
+        if x == x:
+            key = self.sign * x
+            while items and self.sign * items[-1][1] <= key:
+                items.pop()
+            items.append((self.count, x))
+            self.valid.append(self.count)
+        self.count += 1
+        start = self.count - self.n
+        if items and items[0][0] < start:
+            items.popleft()
+        if self.valid and self.valid[0] < start:
+            self.valid.popleft()
+        if len(self.valid) < self.min_periods:
+            return NAN
+        return items[0][1]
+
+    def get_state(self) -> list:
+        return [self.count, list(self.valid), [list(item) for item in self.items]]
+
+    def set_state(self, state: Sequence) -> None:
+        self.count = int(state[0])
+        if len(state) == 2:
+            # 旧格式检查点 [count, items]（不含NaN），窗口内全部为有效值
+            self.valid = deque(range(max(self.count - self.n, 0), self.count))
+            items = state[1]
+        else:
+            self.valid = deque(int(i) for i in state[1])
+            items = state[2]
+        self.items = deque((int(i), float(x)) for i, x in items)
+
+
+class RollingMax(RollingExtreme):
+    """流式滚动最大值"""
+
+    __slots__ = ()
+
+    def __init__(self, n: int, min_periods: int = 1):
+        super().__init__(n, True, min_periods)
+
+
+class RollingMin(RollingExtreme):
+    """流式滚动最小值"""
+
+    __slots__ = ()
+
+    def __init__(self, n: int, min_periods: int = 1):
+        super().__init__(n, False, min_periods)
+
+
+class RollingQuantile:
+    """流式滚动分位数（线性插值），有序表维护窗口内的有效值，每步O(log n)"""
+
+    __slots__ = ("n", "q", "min_periods", "window", "values")
+
+    def __init__(self, n: int, q: float = 0.5, min_periods: int = 1):
+        """
+        Args:
+            n: 窗口长度
+            q: 分位点，0~1
+            min_periods: 窗口内最少有效值个数，不足时返回NaN
+        """
+        if n < 1:
+            raise ValueError("窗口长度至少为1")
+        if not 0.0 <= q <= 1.0:
+            raise ValueError("分位点须在0到1之间")
+        self.n = n
+        self.q = q
+        self.min_periods = max(min_periods, 1)
+        # 窗口内按时间顺序的原始值（含NaN），values 为其中有效值的有序表
+        self.window = deque()
+        self.values = SortedList()
+
+    def update(self, x: float) -> float:
+        """推入一个值，返回包含该值在内的最近n个值的分位数"""
+        self.window.append(x)
+        if x == x:
+            self.values.add(x)
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            if old == old:
+                self.values.remove(old)
+        return self.value()
+
+    def value(self) -> float:
+        """当前窗口的分位数"""
+        values = self.values
+        size = len(values)
+        if size < self.min_periods:
+            return NAN
+        pos = self.q * (size - 1)
+        lower = int(pos)
+        if lower + 1 >= size:
+            return values[lower]
+        frac = pos - lower
+        low, high = values[lower], values[lower + 1]
+        return low + (high - low) * frac
+
+    def get_state(self) -> list:
+        return [list(self.window)]
+
+    def set_state(self, state: Sequence) -> None:
+        self.window = deque(float(x) for x in state[0])
+        self.values = SortedList(x for x in self.window if x == x)
+
+
+class RollingMedian(RollingQuantile):
+    """流式滚动中位数（偶数个值时取中间两个的平均，与 rolling_median 一致）"""
+
+    __slots__ = ()
+
+    def __init__(self, n: int, min_periods: int = 1):
+        super().__init__(n, 0.5, min_periods)
+
+    def value(self) -> float:
+        values = self.values
+        size = len(values)
+        if size < self.min_periods:
+            return NAN
+        mid = size // 2
+        if size % 2:
+            return values[mid]
+        return (values[mid - 1] + values[mid]) / 2.0
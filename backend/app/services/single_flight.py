@@ -0,0 +1,155 @@
+"""
+请求合并（single-flight）
+相同参数的并发读取只执行一次计算，所有等待方共享同一个结果。
+合并后的计算可能比发起它的请求活得更久，因此不能使用请求级的数据库会话，
+需要数据库的读取用 in_session 包装，在线程内自行打开和关闭会话。
+所有调用方拿到的是同一个结果对象（不逐个拷贝，避免在事件循环上深拷贝大结果），调用方只能读取；
+列表结果转为元组，防止被就地修改
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import SessionLocal
+from app.core.metrics import metrics_registry
+
+
+def in_session(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    包装同步读取函数：调用时打开独立的数据库会话作为 db 参数传入，结束后关闭
+
+    Args:
+        func: 接受 db 关键字参数的读取函数（如 MarketService 的方法）
+
+    Returns:
+        不再需要 db 参数的函数
+    """
+    def run(*args, **kwargs):
+        db = SessionLocal()
+        try:
+            return func(*args, db=db, **kwargs)
+        finally:
+            db.close()
+
+    run.__name__ = getattr(func, "__name__", "run")
+    return run
+
+
+def _shared_result(func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    """在线程池中执行读取，列表结果转为元组后供所有调用方共享"""
+    result = func(*args, **kwargs)
+    return tuple(result) if isinstance(result, list) else result
+
+
+class SingleFlight:
+    """并发相同请求合并器"""
+
+    def __init__(self, name: str, reuse_window: float = 0.0):
+        """
+        Args:
+            name: 合并器名称（用于指标）
+            reuse_window: 计算完成后结果的复用窗口（秒），0表示只合并正在进行的请求
+        """
+        self.name = name
+        self.reuse_window = reuse_window
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.reused = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        执行或加入一次同步读取
+        计算在线程池中执行，不阻塞事件循环；发起方被取消不会影响其他等待方。
+        返回的结果与其他调用方共享，调用方不得修改（需要修改时自行拷贝）。
+
+        Args:
+            key: 请求键，相同键的并发调用共享结果
+            func: 同步读取函数，不得依赖请求级资源（数据库读取用 in_session 包装）
+            *args: 函数位置参数
+            **kwargs: 函数关键字参数
+
+        Returns:
+            函数返回值
+        """
+        self.calls += 1
+
+        if self.reuse_window > 0:
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached[0] > time.monotonic():
+                    self.reused += 1
+                    return cached[1]
+                del self._results[key]
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.executions += 1
+            future = asyncio.ensure_future(self._execute(key, func, args, kwargs))
+            self._inflight[key] = future
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(future)
+
+    async def _execute(self, key: Hashable, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """执行实际计算并登记复用结果"""
+        try:
+            result = await run_in_threadpool(_shared_result, func, args, kwargs)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if self.reuse_window > 0:
+            self._results[key] = (time.monotonic() + self.reuse_window, result)
+            if len(self._results) > 10000:
+                self._evict_expired()
+        return result
+
+    def _evict_expired(self) -> None:
+        """清理已过期的复用结果"""
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._results.items() if expires <= now]:
+            del self._results[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "reused": self.reused,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "reuse_window": self.reuse_window
+        }
+
+    def collect(self):
+        """导出Prometheus指标族"""
+        labels = {"name": self.name}
+        return [
+            ("single_flight_calls_total", "counter", "合并器收到的调用总数", [(labels, self.calls)]),
+            ("single_flight_executions_total", "counter", "实际执行的计算次数", [(labels, self.executions)]),
+            ("single_flight_coalesced_total", "counter", "加入进行中计算的调用次数", [(labels, self.coalesced)]),
+            ("single_flight_reused_total", "counter", "复用窗口内直接返回结果的调用次数", [(labels, self.reused)]),
+            ("single_flight_errors_total", "counter", "计算失败次数", [(labels, self.errors)]),
+            ("single_flight_inflight", "gauge", "进行中的计算数", [(labels, len(self._inflight))]),
+        ]
+
+
+# 市场数据读取合并器，复用窗口可通过环境变量配置（默认只合并并发请求）
+market_reads = SingleFlight(
+    "market_reads",
+    reuse_window=float(os.getenv("MARKET_READ_REUSE_WINDOW", "0"))
+)
+metrics_registry.register_collector(market_reads.collect)
@@ -0,0 +1,448 @@
+"""
+写后缓冲（group commit）
+实时写入先进入进程内缓冲，按行数或时间间隔在一个事务中批量提交，
+数据库跟不上时缓冲达到上限后写入方等待（背压），不能等待的同步写入方丢弃该行并计数，
+服务关闭时写入剩余数据。
+整批连续提交失败达到 max_retries 次后按表、再按行拆开重试：数据本身有问题的行（约束、类型错误）
+记入死信列表后丢弃，其余行照常写入，避免一行坏数据阻塞全部实时写入
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, insert
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.logging_config import get_data_logger_instance
+from app.core.metrics import metrics_registry, LATENCY_BUCKETS
+from app.models.market import MarketData, MarketTicker, OrderBook, OrderBookCheckpoint, OrderBookDelta
+from app.services.indicator_cache import indicator_cache
+from app.services.kline_store import kline_hot_store
+
+data_logger = get_data_logger_instance()
+
+# 批量写入函数: (数据库会话, 行列表) -> 写入行数
+Writer = Callable[[Session, List[dict]], int]
+# 提交成功后的回调: (行列表) -> None
+CommitHook = Callable[[List[dict]], None]
+
+BATCH_ROW_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# 这些异常通常是数据库暂时不可用（断线、锁超时），与具体数据无关，拆分重试时不丢弃数据
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, DisconnectionError)
+
+# SQLite同步级别
+SQLITE_SYNCHRONOUS = {"full": "FULL", "normal": "NORMAL", "off": "OFF"}
+
+
+def upsert_market_data(db: Session, rows: List[dict]) -> int:
+    """
+    批量写入K线，同一根K线只保留最新一条，已存在的K线原地更新
+
+    Args:
+        db: 数据库会话
+        rows: K线字典列表（symbol/timestamp/open/high/low/close/volume/period）
+
+    Returns:
+        写入的K线条数
+    """
+    latest = {}
+    for row in rows:
+        latest[(row["symbol"], row["period"], row["timestamp"])] = row
+
+    existing = {
+        (bar.symbol, bar.period, bar.timestamp): bar
+        for bar in db.query(MarketData).filter(
+            MarketData.symbol.in_({key[0] for key in latest}),
+            MarketData.period.in_({key[1] for key in latest}),
+            MarketData.timestamp.in_({key[2] for key in latest})
+        )
+    }
+
+    for key, row in latest.items():
+        bar = existing.get(key)
+        if bar is None:
+            db.add(MarketData(**row))
+        else:
+            bar.open = row["open"]
+            bar.high = row["high"]
+            bar.low = row["low"]
+            bar.close = row["close"]
+            bar.volume = row["volume"]
+    return len(latest)
+
+
+def update_kline_hot_store(rows: List[dict]) -> None:
+    """K线提交后同步到热存储，仍在形成中的K线会原地修订"""
+    for row in rows:
+        kline_hot_store.upsert_bars(row["symbol"], row["period"], [(
+            row["timestamp"], row["open"], row["high"], row["low"], row["close"], row["volume"]
+        )])
+
+
+def on_market_data_commit(rows: List[dict]) -> None:
+    """K线提交后同步热存储，并使被改写历史K线的指标缓存失效"""
+    update_kline_hot_store(rows)
+    indicator_cache.on_bars_written(rows)
+
+
+def insert_rows(model) -> Writer:
+    """生成按行批量插入的写入函数"""
+    def writer(db: Session, rows: List[dict]) -> int:
+        db.execute(insert(model), rows)
+        return len(rows)
+    return writer
+
+
+def configure_durability(engine, mode: Optional[str]) -> None:
+    """
+    设置写入持久化级别（仅SQLite生效）
+
+    Args:
+        engine: SQLAlchemy引擎
+        mode: full（每次提交fsync）/ normal（WAL模式，检查点时fsync）/ off（不主动fsync），为空时保持数据库默认
+    """
+    if not mode:
+        return
+    mode = mode.lower()
+    if mode not in SQLITE_SYNCHRONOUS:
+        raise ValueError(f"无效的持久化级别: {mode}")
+    if engine.dialect.name != "sqlite":
+        data_logger.warning(f"持久化级别仅对SQLite生效，当前数据库: {engine.dialect.name}")
+        return
+
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if mode != "full":
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS[mode]}")
+        cursor.close()
+
+    event.listen(engine, "connect", _set_pragmas)
+    # 已建立的连接（如StaticPool）需要单独设置
+    with engine.connect() as conn:
+        _set_pragmas(conn.connection.dbapi_connection, None)
+
+
+class WriteBuffer:
+    """写后缓冲"""
+
+    def __init__(self, name: str, session_factory: Optional[Callable[[], Session]] = None,
+                 max_rows: int = 1000, max_delay: float = 0.2, max_pending: int = 50000,
+                 max_retries: int = 3, max_dead_letters: int = 1000):
+        """
+        Args:
+            name: 缓冲名称（用于指标）
+            session_factory: 数据库会话工厂，默认使用 WriterSessionLocal（不与请求会话共享连接）
+            max_rows: 缓冲行数达到该值时立即提交
+            max_delay: 最早一行进入缓冲后最长等待时间（秒）
+            max_pending: 缓冲上限（含提交中的行），达到后 put 等待、put_nowait 丢弃
+            max_retries: 整批连续失败多少次后改为按表、按行拆分提交
+            max_dead_letters: 保留的死信行数（最近的）
+        """
+        self.name = name
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        # 被丢弃的坏数据: (表名, 行, 错误信息)
+        self.dead_letters: deque = deque(maxlen=max_dead_letters)
+        self._failures = 0
+        self._writers: Dict[str, Tuple[Writer, Optional[CommitHook]]] = {}
+        self._pending: Dict[str, List[dict]] = {}
+        self._pending_rows = 0
+        self._inflight_rows = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._closing = False
+
+        self.flush_seconds = metrics_registry.histogram(
+            "write_buffer_flush_seconds", "写后缓冲单次提交耗时（秒）", ("buffer",), buckets=LATENCY_BUCKETS
+        )
+        self.batch_rows = metrics_registry.histogram(
+            "write_buffer_batch_rows", "写后缓冲单次提交行数", ("buffer",), buckets=BATCH_ROW_BUCKETS
+        )
+        self.rows_total = metrics_registry.counter(
+            "write_buffer_rows_total", "写后缓冲已提交行数", ("buffer", "table")
+        )
+        self.errors_total = metrics_registry.counter(
+            "write_buffer_errors_total", "写后缓冲提交失败次数", ("buffer",)
+        )
+        self.backpressure_total = metrics_registry.counter(
+            "write_buffer_backpressure_waits_total", "缓冲已满导致写入方等待的次数", ("buffer",)
+        )
+        self.dropped_total = metrics_registry.counter(
+            "write_buffer_dropped_rows_total", "缓冲已满时同步写入被丢弃的行数", ("buffer", "table")
+        )
+        self.dead_letter_total = metrics_registry.counter(
+            "write_buffer_dead_letter_rows_total", "单独提交仍失败而被丢弃的行数", ("buffer", "table")
+        )
+        self.pending_gauge = metrics_registry.gauge(
+            "write_buffer_pending_rows", "写后缓冲中尚未提交的行数", ("buffer",)
+        )
+
+    def register(self, table: str, writer: Writer, on_commit: Optional[CommitHook] = None) -> None:
+        """
+        注册表的批量写入函数
+
+        Args:
+            table: 表名
+            writer: 批量写入函数，在提交事务之前调用
+            on_commit: 事务提交成功后的回调
+        """
+        self._writers[table] = (writer, on_commit)
+
+    def configure(self, max_rows: Optional[int] = None, max_delay: Optional[float] = None,
+                  max_pending: Optional[int] = None) -> None:
+        """调整批量参数"""
+        if max_rows:
+            self.max_rows = max_rows
+        if max_delay:
+            self.max_delay = max_delay
+        if max_pending:
+            self.max_pending = max_pending
+
+    @property
+    def full(self) -> bool:
+        """缓冲（含提交中的行）是否已达上限"""
+        return self._pending_rows + self._inflight_rows >= self.max_pending
+
+    def _ensure_started(self) -> bool:
+        """在当前事件循环中启动后台提交协程，没有运行中的事件循环时返回False"""
+        if self._task is None or self._task.done():
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return False
+            self._wakeup = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._closing = False
+            self._task = loop.create_task(self._run())
+        return True
+
+    async def put(self, table: str, row: dict) -> None:
+        """
+        写入一行，缓冲已满时等待提交腾出空间
+
+        Args:
+            table: 表名（需已注册）
+            row: 列名到值的字典
+        """
+        if table not in self._writers:
+            raise ValueError(f"未注册的写入表: {table}")
+        self._ensure_started()
+
+        if self.full:
+            self.backpressure_total.inc(self.name)
+            async with self._space:
+                await self._space.wait_for(lambda: not self.full)
+
+        self._pending.setdefault(table, []).append(row)
+        self._pending_rows += 1
+        if self._pending_rows >= self.max_rows:
+            self._wakeup.set()
+
+    def put_nowait(self, table: str, row: dict) -> bool:
+        """
+        写入一行，不等待缓冲空间（供同步回调使用，例如盘口变更监听）
+        缓冲已满时丢弃该行，由调用方决定如何补偿（例如之后重新写入完整快照）；
+        没有运行中的事件循环时数据保留在缓冲中，由 flush_sync 写入
+
+        Args:
+            table: 表名（需已注册）
+            row: 列名到值的字典
+
+        Returns:
+            是否已写入缓冲，缓冲已满时为False
+        """
+        if table not in self._writers:
+            raise ValueError(f"未注册的写入表: {table}")
+        if self.full:
+            self.dropped_total.inc(self.name, table)
+            return False
+        self._pending.setdefault(table, []).append(row)
+        self._pending_rows += 1
+        if self._ensure_started() and self._pending_rows >= self.max_rows:
+            self._wakeup.set()
+        return True
+
+    def flush_sync(self) -> bool:
+        """在当前线程同步写入缓冲中的数据（没有事件循环的脚本中使用）"""
+        if not self._pending_rows:
+            return True
+        batch, self._pending = self._pending, {}
+        self._pending_rows = 0
+        ok = self._write(batch)
+        if not ok:
+            for table, table_rows in batch.items():
+                self._pending[table] = table_rows + self._pending.get(table, [])
+                self._pending_rows += len(table_rows)
+        return ok
+
+    async def _run(self) -> None:
+        """后台提交协程"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush_once()
+            if self._closing and not self._pending_rows:
+                return
+
+    async def _flush_once(self) -> None:
+        if not self._pending_rows:
+            return
+
+        batch, self._pending = self._pending, {}
+        rows = self._pending_rows
+        self._pending_rows = 0
+        self._inflight_rows = rows
+        self.pending_gauge.set(rows, self.name)
+
+        if self._failures < self.max_retries:
+            failed = {} if await run_in_threadpool(self._write, batch) else batch
+        else:
+            failed = await run_in_threadpool(self._write_split, batch)
+        if failed:
+            # 提交失败的行放回缓冲，下次重试；失败期间缓冲逐渐写满，写入方随之等待
+            self._failures += 1
+            for table, table_rows in failed.items():
+                self._pending[table] = table_rows + self._pending.get(table, [])
+                self._pending_rows += len(table_rows)
+            if not self._closing:
+                await asyncio.sleep(min(self.max_delay * 5, 5.0))
+        else:
+            self._failures = 0
+
+        self._inflight_rows = 0
+        self.pending_gauge.set(self._pending_rows, self.name)
+        async with self._space:
+            self._space.notify_all()
+
+    def _write(self, batch: Dict[str, List[dict]]) -> bool:
+        """在一个事务中写入一批数据"""
+        error = self._commit(batch)
+        if error is not None:
+            data_logger.error(f"写后缓冲提交失败 - {self.name} - "
+                              f"{sum(len(rows) for rows in batch.values())}行 - {str(error)}")
+        return error is None
+
+    def _write_split(self, batch: Dict[str, List[dict]]) -> Dict[str, List[dict]]:
+        """
+        按表分别提交，数据错误导致失败的表再逐行提交，单独仍失败的行记入死信后丢弃
+
+        Returns:
+            需要稍后重试的行（数据库暂时不可用导致的失败）
+        """
+        retry: Dict[str, List[dict]] = {}
+        for table, rows in batch.items():
+            error = self._commit({table: rows})
+            if error is None:
+                continue
+            if isinstance(error, TRANSIENT_ERRORS):
+                data_logger.error(f"写后缓冲提交失败 - {self.name} - {table} - {len(rows)}行 - {str(error)}")
+                retry[table] = rows
+                continue
+
+            for row in rows:
+                error = self._commit({table: [row]})
+                if error is None:
+                    continue
+                if isinstance(error, TRANSIENT_ERRORS):
+                    retry.setdefault(table, []).append(row)
+                    continue
+                self.dead_letters.append((table, row, str(error)))
+                self.dead_letter_total.inc(self.name, table)
+                data_logger.error(f"写后缓冲丢弃无法写入的行 - {self.name} - {table} - {str(error)} - {row}")
+        return retry
+
+    def _commit(self, batch: Dict[str, List[dict]]) -> Optional[Exception]:
+        """在一个事务中写入一批数据，成功后调用提交回调；失败时返回异常"""
+        if self.session_factory is None:
+            from app.core.database import WriterSessionLocal
+            self.session_factory = WriterSessionLocal
+
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            written = {table: self._writers[table][0](db, rows) for table, rows in batch.items()}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.errors_total.inc(self.name)
+            return e
+        finally:
+            db.close()
+
+        self.flush_seconds.observe(time.perf_counter() - start, self.name)
+        self.batch_rows.observe(sum(len(rows) for rows in batch.values()), self.name)
+        for table, count in written.items():
+            self.rows_total.inc(self.name, table, amount=count)
+            on_commit = self._writers[table][1]
+            if on_commit is None:
+                continue
+            try:
+                on_commit(batch[table])
+            except Exception as e:
+                # 数据已提交，回调失败不能影响后台提交协程
+                data_logger.error(f"写后缓冲提交回调失败 - {self.name} - {table} - {str(e)}")
+        return None
+
+    async def flush(self) -> None:
+        """立即提交缓冲中的数据"""
+        if self._task is not None and not self._task.done():
+            self._wakeup.set()
+        while (self._pending_rows or self._inflight_rows) and self._task is not None and not self._task.done():
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        """提交剩余数据并停止后台协程（服务关闭时调用）"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            data_logger.error(f"写后缓冲关闭超时，{self._pending_rows}行未写入 - {self.name}")
+        self._task = None
+
+    def stats(self) -> dict:
+        """缓冲统计信息"""
+        return {
+            "name": self.name,
+            "pending_rows": self._pending_rows,
+            "inflight_rows": self._inflight_rows,
+            "max_rows": self.max_rows,
+            "max_delay": self.max_delay,
+            "max_pending": self.max_pending,
+            "rows_written": {table: self.rows_total.value(self.name, table) for table in self._writers},
+            "rows_dropped": {table: self.dropped_total.value(self.name, table) for table in self._writers},
+            "consecutive_failures": self._failures,
+            "dead_letters": len(self.dead_letters)
+        }
+
+
+# 全局实时写入缓冲
+market_write_buffer = WriteBuffer(
+    "market",
+    max_rows=int(os.getenv("WRITE_BUFFER_MAX_ROWS", "1000")),
+    max_delay=float(os.getenv("WRITE_BUFFER_MAX_DELAY_MS", "200")) / 1000,
+    max_pending=int(os.getenv("WRITE_BUFFER_MAX_PENDING", "50000"))
+)
+market_write_buffer.register("market_data", upsert_market_data, on_market_data_commit)
+market_write_buffer.register("market_ticker", insert_rows(MarketTicker))
+market_write_buffer.register("order_book", insert_rows(OrderBook))
+market_write_buffer.register("order_book_delta", insert_rows(OrderBookDelta))
+market_write_buffer.register("order_book_checkpoint", insert_rows(OrderBookCheckpoint))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+事件驱动回测基准测试
+测量单核每秒处理的K线事件数：空策略（引擎本身的开销）和一个带挂单撮合的简单突破策略
+
+使用方法:
+    python benchmarks/event_backtest_bench.py --bars 2000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.event_backtest import BarFeed, EventBacktest, PercentCommission, PercentSlippage
+
+
+def generate_feed(count: int, seed: int = 42) -> BarFeed:
+    """生成随机游走K线"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.005, count)) * close
+    return BarFeed({
+        "t": np.datetime64("2000-01-01", "ms") + np.arange(count) * np.timedelta64(1, "m"),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.uniform(1, 1000, count)
+    })
+
+
+def noop(context, bar):
+    pass
+
+
+def breakout(context, bar):
+    """收盘价创新高后挂突破买单并附带止损止盈"""
+    close = bar.close
+    if close > context.high_water:
+        context.high_water = close
+        if context.position == 0 and (context.order is None or not context.order.is_active):
+            context.order = context.buy(10, stop=close * 1.002, stop_loss=close * 0.98, take_profit=close * 1.03)
+    else:
+        context.high_water *= 0.9999
+
+
+def init_breakout(context):
+    context.high_water = 0.0
+    context.order = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="事件驱动回测基准测试")
+    parser.add_argument("--bars", type=int, default=2_000_000, help="K线根数")
+    args = parser.parse_args()
+
+    feed = generate_feed(args.bars)
+    print(f"K线根数: {args.bars:,}")
+    for name, on_bar, initialize in (("空策略", noop, None), ("突破+止损止盈", breakout, init_breakout)):
+        engine = EventBacktest(feed, on_bar, initialize, commission=PercentCommission(0.0003),
+                               slippage=PercentSlippage(0.0005))
+        start = time.perf_counter()
+        output = engine.run()
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<12} {elapsed:6.2f} s  {args.bars / elapsed:,.0f} K线/秒  "
+              f"成交 {output.statistics['fills']}  往返交易 {output.metrics['total_trades']}")
+
+
+if __name__ == "__main__":
+    main()
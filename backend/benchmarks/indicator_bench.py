@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+技术指标计算基准测试
+生成随机游走K线，测量向量化指标引擎计算一组指标的耗时
+
+使用方法:
+    python benchmarks/indicator_bench.py --bars 1000000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.indicators import compute_indicator, parse_indicator_specs, spec_key
+
+# 10个常用指标
+DEFAULT_INDICATORS = "ma:5,ma:20,ema:12,macd,rsi:14,kdj,boll,atr,obv,ma:60"
+
+
+def generate_bars(count: int, seed: int = 42) -> dict:
+    """生成随机游走K线列"""
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.005, count)) * close
+    return {
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.uniform(1, 1000, count)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="技术指标计算基准测试")
+    parser.add_argument("--bars", type=int, default=1_000_000, help="K线根数")
+    parser.add_argument("--indicators", default=DEFAULT_INDICATORS, help="指标列表")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    columns = generate_bars(args.bars)
+    specs = parse_indicator_specs(args.indicators)
+
+    timings = {spec_key(spec): float("inf") for spec in specs}
+    totals = []
+    for _ in range(args.repeat):
+        total_start = time.perf_counter()
+        for spec in specs:
+            start = time.perf_counter()
+            compute_indicator(spec, columns)
+            timings[spec_key(spec)] = min(timings[spec_key(spec)], time.perf_counter() - start)
+        totals.append(time.perf_counter() - total_start)
+
+    print(f"K线根数: {args.bars:,}, 指标数: {len(specs)}, 重复: {args.repeat}")
+    for key, elapsed in timings.items():
+        print(f"  {key:<16} {elapsed * 1000:8.1f} ms")
+    best = min(totals)
+    print(f"合计: {best * 1000:.1f} ms  吞吐量: {args.bars * len(specs) / best:,.0f} 指标值/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+盘口快照存储基准测试
+对比JSON文本列与二进制快照的存储大小和前N档解码耗时
+
+使用方法:
+    python benchmarks/orderbook_storage_bench.py --snapshots 2000 --levels 200 --depth 10
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.orderbook_codec import encode_book, decode_book, top_levels
+
+
+def generate_snapshot(levels: int, mid: float = 30000.0):
+    """生成一个随机盘口快照（与旧版JSON列相同的条目格式）"""
+    bids, asks = [], []
+    for i in range(levels):
+        bid_price = round(mid - 0.5 - i * 0.5, 2)
+        ask_price = round(mid + 0.5 + i * 0.5, 2)
+        bid_amount = round(random.uniform(0.001, 5.0), 6)
+        ask_amount = round(random.uniform(0.001, 5.0), 6)
+        bids.append({"price": bid_price, "amount": bid_amount, "total": round(bid_price * bid_amount, 6)})
+        asks.append({"price": ask_price, "amount": ask_amount, "total": round(ask_price * ask_amount, 6)})
+    return bids, asks
+
+
+def timeit(func, rounds: int) -> float:
+    """返回单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="盘口快照存储基准测试")
+    parser.add_argument("--snapshots", type=int, default=2000, help="快照数量")
+    parser.add_argument("--levels", type=int, default=200, help="每侧档数")
+    parser.add_argument("--depth", type=int, default=10, help="读取档数")
+    args = parser.parse_args()
+
+    random.seed(42)
+    snapshots = [generate_snapshot(args.levels) for _ in range(args.snapshots)]
+
+    json_rows = [(json.dumps(bids), json.dumps(asks)) for bids, asks in snapshots]
+    binary_rows = [encode_book(bids, asks) for bids, asks in snapshots]
+
+    json_size = sum(len(b.encode()) + len(a.encode()) for b, a in json_rows)
+    binary_size = sum(len(blob) for blob in binary_rows)
+
+    depth = args.depth
+    rounds = max(1, 20000 // args.snapshots)
+
+    def decode_json():
+        for bids, asks in json_rows:
+            json.loads(bids)[:depth]
+            json.loads(asks)[:depth]
+
+    def decode_binary_entries():
+        for blob in binary_rows:
+            decode_book(blob, depth)
+
+    def decode_binary_views():
+        for blob in binary_rows:
+            top_levels(blob, "bids", depth)
+            top_levels(blob, "asks", depth)
+
+    json_us = timeit(decode_json, rounds) / args.snapshots
+    entries_us = timeit(decode_binary_entries, rounds) / args.snapshots
+    views_us = timeit(decode_binary_views, rounds) / args.snapshots
+
+    print(f"快照数量: {args.snapshots}, 每侧档数: {args.levels}, 读取档数: {depth}")
+    print(f"存储大小  JSON: {json_size / 1024:.1f} KB  二进制: {binary_size / 1024:.1f} KB  "
+          f"压缩比: {json_size / binary_size:.2f}x")
+    print(f"前{depth}档解码  JSON: {json_us:.2f} us/快照")
+    print(f"前{depth}档解码  二进制(条目): {entries_us:.2f} us/快照  加速: {json_us / entries_us:.1f}x")
+    print(f"前{depth}档解码  二进制(零拷贝视图): {views_us:.2f} us/快照  加速: {json_us / views_us:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+滚动窗口算子基准测试
+对比 rolling_max 与逐窗口求最大值（O(n·w)）在不同窗口长度下的耗时，以及流式中位数每步耗时
+
+使用方法:
+    python benchmarks/rolling_bench.py --size 1000000 --windows 5,20,250
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.rolling import RollingMedian, rolling_max, rolling_median
+
+
+def best_of(func, repeat: int) -> float:
+    """重复执行取最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="滚动窗口算子基准测试")
+    parser.add_argument("--size", type=int, default=1_000_000, help="序列长度")
+    parser.add_argument("--windows", default="5,20,250,1000", help="窗口长度列表")
+    parser.add_argument("--stream", type=int, default=200_000, help="流式中位数推入的值个数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最短耗时")
+    args = parser.parse_args()
+
+    x = np.random.default_rng(42).normal(size=args.size)
+    print(f"序列长度: {args.size:,}, 重复: {args.repeat}")
+    print(f"  {'窗口':>6} {'rolling_max':>12} {'逐窗口max':>12} {'rolling_median':>15}")
+    for n in (int(w) for w in args.windows.split(",")):
+        fast = best_of(lambda: rolling_max(x, n), args.repeat)
+        naive = best_of(lambda: np.lib.stride_tricks.sliding_window_view(x, n).max(axis=1), args.repeat)
+        median = best_of(lambda: rolling_median(x, n), args.repeat)
+        print(f"  {n:>6} {fast * 1000:>9.1f} ms {naive * 1000:>9.1f} ms {median * 1000:>12.1f} ms")
+
+    state = RollingMedian(250)
+    start = time.perf_counter()
+    for value in x[:args.stream].tolist():
+        state.update(value)
+    elapsed = time.perf_counter() - start
+    print(f"流式中位数（窗口250）: {elapsed / args.stream * 1e6:.2f} us/值")
+
+
+if __name__ == "__main__":
+    main()
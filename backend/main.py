@@ -1,6 +1,7 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import os
 import uvicorn
 
 # 导入日志配置
@@ -9,6 +10,14 @@ from app.core.logging_config import get_app_logger, log_manager
 # 获取应用日志记录器
 app_logger = get_app_logger()
 
+# 导入运行指标
+from app.core.metrics import RequestMetricsMiddleware, metrics_registry, instrument_engine, PROMETHEUS_CONTENT_TYPE
+from app.core.database import engine, writer_engine
+from app.services.write_buffer import market_write_buffer, configure_durability
+from app.services.realtime_supervisor import realtime_supervisor
+from app.services.event_bus import market_event_bus
+from app.services.indicator_state import indicator_state_store
+
 # 导入API路由
 from app.api.market import router as market_router
 
@@ -39,9 +48,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求指标中间件（最后添加，位于最外层以覆盖完整的请求耗时）
+app.add_middleware(RequestMetricsMiddleware)
+
+# 统计每个请求执行的数据库语句数
+instrument_engine(engine)
+
+# 写入持久化级别（SQLite: full/normal/off，默认保持数据库设置）
+configure_durability(engine, os.getenv("DB_DURABILITY"))
+if writer_engine is not engine:
+    configure_durability(writer_engine, os.getenv("DB_DURABILITY"))
+
 # 注册API路由
 app.include_router(market_router, prefix="/api/market", tags=["market"])
 
+@app.on_event("startup")
+async def startup():
+    """在服务事件循环中注册事件总线订阅者：增量指标状态随收盘K线递推"""
+    indicator_state_store.attach(market_event_bus)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """服务关闭时停止实时更新任务和事件订阅者，并写入写后缓冲中尚未提交的数据"""
+    await realtime_supervisor.shutdown()
+    await market_event_bus.stop()
+    await market_write_buffer.stop()
+
 @app.get("/")
 async def root():
     """根路径，返回服务状态"""
@@ -67,6 +99,11 @@ async def health_check():
         "services": ["api", "market"]
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """运行指标（Prometheus文本格式）"""
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     # 记录服务器启动信息
     app_logger.info("启动FastAPI服务器...")
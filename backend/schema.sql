@@ -25,13 +25,37 @@ CREATE TABLE IF NOT EXISTS order_book (
     id INT AUTO_INCREMENT PRIMARY KEY,
     symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
     timestamp DATETIME NOT NULL COMMENT '数据时间戳',
-    bids TEXT NOT NULL COMMENT '买单数据（JSON格式）',
-    asks TEXT NOT NULL COMMENT '卖单数据（JSON格式）',
+    bids TEXT COMMENT '买单数据（JSON格式，旧版快照）',
+    asks TEXT COMMENT '卖单数据（JSON格式，旧版快照）',
+    book_data LONGBLOB COMMENT '盘口快照（二进制价格/数量数组）',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     INDEX idx_symbol (symbol),
     INDEX idx_timestamp (timestamp)
 ) COMMENT='盘口数据表';
 
+-- 创建order_book_checkpoint表（盘口历史检查点）
+CREATE TABLE IF NOT EXISTS order_book_checkpoint (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
+    timestamp DATETIME(3) NOT NULL COMMENT '检查点时间',
+    update_id BIGINT NOT NULL COMMENT '检查点对应的最后更新序号',
+    book_data LONGBLOB NOT NULL COMMENT '完整盘口（二进制价格/数量数组）',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    INDEX idx_symbol_timestamp (symbol, timestamp)
+) COMMENT='盘口历史检查点表';
+
+-- 创建order_book_delta表（盘口增量日志）
+CREATE TABLE IF NOT EXISTS order_book_delta (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
+    timestamp DATETIME(3) NOT NULL COMMENT '事件时间',
+    first_update_id BIGINT NOT NULL COMMENT '首个更新序号',
+    final_update_id BIGINT NOT NULL COMMENT '最后更新序号',
+    delta_data BLOB NOT NULL COMMENT '变更档位（二进制价格/数量数组，数量为0表示删除）',
+    INDEX idx_symbol_timestamp (symbol, timestamp),
+    INDEX idx_symbol_update (symbol, final_update_id)
+) COMMENT='盘口增量日志表';
+
 -- 创建symbol_info表（交易对信息）
 CREATE TABLE IF NOT EXISTS symbol_info (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -51,6 +75,111 @@ CREATE TABLE IF NOT EXISTS symbol_info (
     INDEX idx_market_type (market_type)
 ) COMMENT='交易对信息表';
 
+-- 创建symbol_industry表（行业分类，用于因子行业中性化）
+CREATE TABLE IF NOT EXISTS symbol_industry (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    symbol VARCHAR(50) UNIQUE NOT NULL COMMENT '交易对符号',
+    industry VARCHAR(50) NOT NULL COMMENT '所属行业',
+    classification VARCHAR(20) COMMENT '行业分类标准（如 sw1/citic1）',
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    INDEX idx_industry (industry)
+) COMMENT='交易对行业分类表';
+
+-- 创建factor_value表（日频因子值）
+CREATE TABLE IF NOT EXISTS factor_value (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
+    trade_date DATETIME NOT NULL COMMENT '交易日',
+    factor VARCHAR(50) NOT NULL COMMENT '因子规范名（如 momentum:20:0）',
+    value DOUBLE NOT NULL COMMENT '因子值',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    UNIQUE INDEX idx_factor_date_symbol (factor, trade_date, symbol),
+    INDEX idx_factor_symbol_date (factor, symbol, trade_date)
+) COMMENT='日频因子值表';
+
+-- 创建strategies表（策略配置，code 为事件驱动回测执行的策略代码）
+CREATE TABLE IF NOT EXISTS strategies (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL COMMENT '策略名称',
+    description TEXT COMMENT '策略描述',
+    code TEXT NOT NULL COMMENT '策略代码',
+    parameters JSON NOT NULL COMMENT '策略参数',
+    language VARCHAR(20) NOT NULL DEFAULT 'python' COMMENT '策略语言',
+    status VARCHAR(20) NOT NULL DEFAULT 'active' COMMENT '策略状态',
+    category VARCHAR(50) COMMENT '策略分类',
+    tags JSON COMMENT '策略标签',
+    version VARCHAR(20) NOT NULL DEFAULT '1.0.0' COMMENT '策略版本',
+    is_public BOOLEAN DEFAULT FALSE COMMENT '是否公开',
+    created_by VARCHAR(50) NOT NULL COMMENT '创建者',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) COMMENT='策略配置表';
+
+-- 创建backtest_results表（回测结果）
+CREATE TABLE IF NOT EXISTS backtest_results (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    strategy_id INT NOT NULL COMMENT '策略ID',
+    name VARCHAR(100) NOT NULL COMMENT '回测名称',
+    start_date DATETIME NOT NULL COMMENT '回测开始时间',
+    end_date DATETIME NOT NULL COMMENT '回测结束时间',
+    symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
+    initial_capital DECIMAL(15,2) NOT NULL COMMENT '初始资金',
+    final_capital DECIMAL(15,2) NOT NULL COMMENT '最终资金',
+    total_return DECIMAL(10,4) NOT NULL COMMENT '总收益率',
+    annual_return DECIMAL(10,4) COMMENT '年化收益率',
+    sharpe_ratio DECIMAL(10,4) COMMENT '夏普比率',
+    max_drawdown DECIMAL(10,4) COMMENT '最大回撤',
+    win_rate DECIMAL(10,4) COMMENT '胜率',
+    total_trades INT NOT NULL COMMENT '总交易次数',
+    profit_factor DECIMAL(10,4) COMMENT '盈亏比',
+    parameters JSON NOT NULL COMMENT '回测参数',
+    statistics JSON NOT NULL COMMENT '详细统计信息',
+    equity_curve JSON NOT NULL COMMENT '资金曲线数据',
+    trades_data JSON NOT NULL COMMENT '交易记录数据',
+    status VARCHAR(20) NOT NULL DEFAULT 'completed' COMMENT '回测状态',
+    error_message TEXT COMMENT '错误信息',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    completed_at DATETIME COMMENT '完成时间',
+    INDEX idx_strategy_id (strategy_id)
+) COMMENT='回测结果表';
+
+-- 创建trade_records表（回测成交记录）
+CREATE TABLE IF NOT EXISTS trade_records (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    strategy_id INT NOT NULL COMMENT '策略ID',
+    backtest_id INT COMMENT '回测ID',
+    symbol VARCHAR(50) NOT NULL COMMENT '交易对符号',
+    direction VARCHAR(10) NOT NULL COMMENT '交易方向（buy/sell）',
+    order_type VARCHAR(20) NOT NULL DEFAULT 'market' COMMENT '订单类型',
+    quantity DECIMAL(15,4) NOT NULL COMMENT '数量',
+    price DECIMAL(15,4) NOT NULL COMMENT '价格',
+    commission DECIMAL(15,4) NOT NULL DEFAULT 0 COMMENT '手续费',
+    timestamp DATETIME NOT NULL COMMENT '交易时间',
+    profit_loss DECIMAL(15,4) COMMENT '盈亏金额',
+    profit_loss_ratio DECIMAL(10,4) COMMENT '盈亏比例',
+    holding_period DECIMAL(10,2) COMMENT '持仓周期（天）',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    INDEX idx_strategy_id (strategy_id),
+    INDEX idx_backtest_id (backtest_id),
+    INDEX idx_timestamp (timestamp)
+) COMMENT='交易记录表';
+
+-- 创建strategy_executions表（策略执行记录，参数优化进度）
+CREATE TABLE IF NOT EXISTS strategy_executions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    strategy_id INT NOT NULL COMMENT '策略ID',
+    execution_type VARCHAR(20) NOT NULL COMMENT '执行类型（backtest/simulation/optimization）',
+    status VARCHAR(20) NOT NULL DEFAULT 'running' COMMENT '执行状态',
+    start_time DATETIME NOT NULL COMMENT '开始时间',
+    end_time DATETIME COMMENT '结束时间',
+    progress FLOAT DEFAULT 0 COMMENT '执行进度',
+    parameters JSON NOT NULL COMMENT '执行参数',
+    result_data JSON COMMENT '执行结果数据',
+    error_message TEXT COMMENT '错误信息',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    INDEX idx_strategy_id (strategy_id)
+) COMMENT='策略执行记录表';
+
 -- 创建market_ticker表（实时行情数据）
 CREATE TABLE IF NOT EXISTS market_ticker (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -68,6 +197,10 @@ CREATE TABLE IF NOT EXISTS market_ticker (
     INDEX idx_timestamp (timestamp)
 ) COMMENT='实时行情数据表';
 
+-- 已有order_book表升级为二进制快照存储
+-- ALTER TABLE order_book ADD COLUMN book_data LONGBLOB COMMENT '盘口快照（二进制价格/数量数组）';
+-- ALTER TABLE order_book MODIFY bids TEXT NULL, MODIFY asks TEXT NULL;
+
 -- 使用说明
 -- 1. 执行此SQL文件创建所有需要的表：mysql -u username -p quant_trading < schema.sql
 -- 2. 或直接复制market_data表的创建语句执行
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+本地WebSocket行情回放服务器
+模拟Binance行情推送，用于在本地测试 DataCollector.start_realtime_collection
+
+功能：
+1. 回放录制的消息文件（JSON Lines），可按原始节奏、倍速或固定速率推送
+2. 未指定文件时生成模拟的K线、逐笔成交、24小时行情和深度增量消息
+3. 提供 /api/v3/depth 深度快照和 /api/v3/klines K线接口，用于内存盘口同步和轮询采集
+4. 可在推送若干条后主动断开连接，用于测试重连和重新订阅
+5. record 子命令从真实行情地址录制消息
+
+使用方法:
+    # 模拟数据，每秒500条，每推送5000条断开一次
+    python ws_replay_server.py serve --symbols BTCUSDT,ETHUSDT --rate 500 --disconnect-after 5000
+
+    # 回放录制文件（2倍速，循环）
+    python ws_replay_server.py serve --file messages.jsonl --speed 2 --loop
+
+    # 录制60秒真实行情
+    python ws_replay_server.py record --symbols BTCUSDT --duration 60 --output messages.jsonl
+
+    # 采集端指向本地服务器
+    BINANCE_WS_URL=ws://127.0.0.1:8765/ws BINANCE_REST_URL=http://127.0.0.1:8765 python ...
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from http import HTTPStatus
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import websockets
+
+
+# 事件类型 -> 订阅流类型
+EVENT_STREAMS = {"kline": "kline", "depthUpdate": "depth", "aggTrade": "aggTrade", "trade": "trade",
+                 "24hrTicker": "ticker"}
+
+# K线周期 -> 毫秒
+INTERVAL_MS = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000, "1h": 3_600_000,
+               "4h": 14_400_000, "1d": 86_400_000}
+
+
+def message_stream(message: dict) -> Tuple[Optional[str], Optional[str]]:
+    """获取消息所属 (交易对, 数据流类型)"""
+    data = message.get("data", message)
+    symbol = data["k"].get("s") if "k" in data else data.get("s")
+    return symbol, EVENT_STREAMS.get(data.get("e"))
+
+
+def stream_key(stream: str) -> Tuple[str, str]:
+    """订阅流名称 -> (交易对, 数据流类型)，如 btcusdt@kline_1m -> (BTCUSDT, kline)"""
+    symbol, _, kind = stream.partition("@")
+    return symbol.upper(), kind.split("_")[0].split("@")[0]
+
+
+class SyntheticMarket:
+    """模拟行情：每个交易对一条随机游走价格、一根1分钟K线和一份深度盘口"""
+
+    def __init__(self, symbols: List[str], levels: int = 50, changes: int = 5):
+        self.symbols = symbols
+        self.levels = levels
+        self.changes = changes
+        self.update_ids: Dict[str, int] = {}
+        self.books: Dict[str, Tuple[Dict[float, float], Dict[float, float]]] = {}
+        self.prices: Dict[str, float] = {}
+        self.bars: Dict[str, dict] = {}
+
+        for symbol in symbols:
+            price = round(random.uniform(10, 50000), 2)
+            tick = max(round(price * 0.0001, 2), 0.01)
+            self.prices[symbol] = price
+            self.update_ids[symbol] = 1
+            self.books[symbol] = (
+                {round(price - tick * (i + 1), 2): round(random.uniform(0.1, 5), 4) for i in range(levels)},
+                {round(price + tick * (i + 1), 2): round(random.uniform(0.1, 5), 4) for i in range(levels)}
+            )
+        # 模拟K线历史的基准价格
+        self.base_prices = dict(self.prices)
+
+    def snapshot(self, symbol: str, limit: int = 1000) -> Optional[dict]:
+        """深度快照（与 /api/v3/depth 返回格式一致）"""
+        if symbol not in self.books:
+            return None
+        bids, asks = self.books[symbol]
+        return {
+            "lastUpdateId": self.update_ids[symbol],
+            "bids": [[str(p), str(q)] for p, q in sorted(bids.items(), reverse=True)[:limit]],
+            "asks": [[str(p), str(q)] for p, q in sorted(asks.items())[:limit]]
+        }
+
+    def klines(self, symbol: str, interval: str = "1m", limit: int = 500,
+               start_time: Optional[int] = None) -> Optional[list]:
+        """
+        K线历史（与 /api/v3/klines 返回格式一致）
+        已完成的K线由 (交易对, 开始时间) 确定随机值，重复请求结果相同；最新一根随当前价格变化
+        """
+        if symbol not in self.prices or interval not in INTERVAL_MS:
+            return None
+        step = INTERVAL_MS[interval]
+        now_ms = int(time.time() * 1000)
+        current = now_ms - now_ms % step
+        first = current - (limit - 1) * step if start_time is None else start_time - start_time % step
+        self.prices[symbol] *= 1 + random.gauss(0, 0.0005)
+
+        rows = []
+        for start in range(first, min(current, first + (limit - 1) * step) + 1, step):
+            rng = random.Random(f"{symbol}:{interval}:{start}")
+            o = self.base_prices[symbol] * (1 + rng.gauss(0, 0.002))
+            c = self.prices[symbol] if start == current else o * (1 + rng.gauss(0, 0.002))
+            h = max(o, c) * (1 + abs(rng.gauss(0, 0.001)))
+            l = min(o, c) * (1 - abs(rng.gauss(0, 0.001)))
+            v = rng.uniform(1, 100)
+            rows.append([start, f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.4f}",
+                         start + step - 1, f"{v * c:.2f}", rng.randint(10, 1000), "0", "0", "0"])
+        return rows
+
+    def _kline(self, symbol: str, now_ms: int) -> dict:
+        price = self.prices[symbol] * (1 + random.gauss(0, 0.0005))
+        self.prices[symbol] = price
+        start = now_ms - now_ms % 60000
+        bar = self.bars.get(symbol)
+        if bar is None or bar["t"] != start:
+            bar = {"t": start, "o": price, "h": price, "l": price, "c": price, "v": 0.0}
+            self.bars[symbol] = bar
+        bar["h"] = max(bar["h"], price)
+        bar["l"] = min(bar["l"], price)
+        bar["c"] = price
+        bar["v"] += random.uniform(0.01, 2)
+        return {
+            "e": "kline", "E": now_ms, "s": symbol,
+            "k": {
+                "t": start, "T": start + 59999, "s": symbol, "i": "1m",
+                "o": f"{bar['o']:.2f}", "h": f"{bar['h']:.2f}", "l": f"{bar['l']:.2f}",
+                "c": f"{bar['c']:.2f}", "v": f"{bar['v']:.4f}", "x": False
+            }
+        }
+
+    def _trade(self, symbol: str, now_ms: int, trade_id: int) -> dict:
+        price = self.prices[symbol] * (1 + random.gauss(0, 0.0002))
+        return {
+            "e": "aggTrade", "E": now_ms, "s": symbol, "a": trade_id,
+            "p": f"{price:.2f}", "q": f"{random.uniform(0.001, 1):.4f}",
+            "T": now_ms - random.randint(0, 50), "m": random.random() < 0.5
+        }
+
+    def _ticker(self, symbol: str, now_ms: int) -> dict:
+        price = self.prices[symbol]
+        bar = self.bars[symbol]
+        return {
+            "e": "24hrTicker", "E": now_ms, "s": symbol,
+            "p": f"{price - bar['o']:.2f}", "P": f"{(price / bar['o'] - 1) * 100:.2f}",
+            "c": f"{price:.2f}", "h": f"{bar['h']:.2f}", "l": f"{bar['l']:.2f}",
+            "v": f"{bar['v']:.4f}", "q": f"{bar['v'] * price:.2f}"
+        }
+
+    def _depth(self, symbol: str, now_ms: int) -> dict:
+        bids, asks = self.books[symbol]
+        changes = {"b": [], "a": []}
+        for side, book in (("b", bids), ("a", asks)):
+            for _ in range(self.changes):
+                price = random.choice(list(book))
+                amount = 0.0 if len(book) > self.levels // 2 and random.random() < 0.2 \
+                    else round(random.uniform(0.1, 5), 4)
+                if amount == 0.0:
+                    del book[price]
+                else:
+                    book[price] = amount
+                changes[side].append([str(price), str(amount)])
+
+        first_id = self.update_ids[symbol] + 1
+        self.update_ids[symbol] += len(changes["b"]) + len(changes["a"])
+        return {
+            "e": "depthUpdate", "E": now_ms, "s": symbol,
+            "U": first_id, "u": self.update_ids[symbol],
+            "b": changes["b"], "a": changes["a"]
+        }
+
+    def messages(self) -> Iterator[dict]:
+        """无限生成消息，K线、逐笔成交与深度增量交替，每10轮推送一次24小时行情"""
+        trade_id = 0
+        while True:
+            trade_id += 1
+            for symbol in self.symbols:
+                now_ms = int(time.time() * 1000)
+                yield self._kline(symbol, now_ms)
+                yield self._trade(symbol, now_ms, trade_id)
+                yield self._depth(symbol, now_ms)
+                if trade_id % 10 == 0:
+                    yield self._ticker(symbol, now_ms)
+
+
+def load_recording(path: str) -> List[Tuple[float, dict]]:
+    """读取录制文件，每行 {"t": 接收时间(秒), "msg": 消息} 或直接为消息"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "msg" in item:
+                records.append((float(item.get("t", 0)), item["msg"]))
+            else:
+                records.append((0.0, item))
+    return records
+
+
+class ReplayServer:
+    """回放服务器"""
+
+    def __init__(self, args):
+        self.args = args
+        self.market = SyntheticMarket(args.symbols.split(",")) if not args.file else None
+        self.recording = load_recording(args.file) if args.file else None
+        self.connections = 0
+        self.sent = 0
+
+    def process_request(self, path: str, request_headers):
+        """处理普通HTTP请求：提供深度快照和K线接口"""
+        url = urlparse(path)
+        if url.path not in ("/api/v3/depth", "/api/v3/klines"):
+            return None
+
+        params = parse_qs(url.query)
+        symbol = params.get("symbol", [""])[0].upper()
+        if url.path == "/api/v3/klines":
+            start_time = params.get("startTime", [None])[0]
+            payload = self.market.klines(
+                symbol, params.get("interval", ["1m"])[0], min(int(params.get("limit", ["500"])[0]), 1000),
+                int(start_time) if start_time else None
+            ) if self.market else None
+        else:
+            limit = int(params.get("limit", ["1000"])[0])
+            payload = self.market.snapshot(symbol, limit) if self.market else None
+        if payload is None:
+            return HTTPStatus.NOT_FOUND, [("Content-Type", "application/json")], b'{"msg":"unknown symbol"}'
+        return HTTPStatus.OK, [("Content-Type", "application/json")], json.dumps(payload).encode()
+
+    def _source(self) -> Iterator[Tuple[float, dict]]:
+        """消息源：(相对上一条的原始间隔, 消息)"""
+        if self.market is not None:
+            for message in self.market.messages():
+                yield 0.0, message
+            return
+
+        while True:
+            previous = None
+            for t, message in self.recording:
+                yield (t - previous if previous is not None and t > previous else 0.0), message
+                previous = t
+            if not self.args.loop:
+                return
+
+    async def _pace(self, gap: float, started: float, count: int) -> None:
+        """按固定速率或录制节奏等待"""
+        if self.args.rate > 0:
+            delay = started + count / self.args.rate - time.perf_counter()
+        elif self.args.speed > 0:
+            delay = gap / self.args.speed
+        else:
+            delay = 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif count % 1000 == 0:
+            await asyncio.sleep(0)
+
+    async def handler(self, websocket, path: str = "/ws"):
+        """单个客户端连接：等待订阅，然后推送已订阅交易对的消息"""
+        self.connections += 1
+        conn_id = self.connections
+        subscribed: Set[Tuple[str, str]] = set()
+
+        raw = await websocket.recv()
+        request = json.loads(raw)
+        if request.get("method") == "SUBSCRIBE":
+            subscribed = {stream_key(stream) for stream in request.get("params", [])}
+            await websocket.send(json.dumps({"result": None, "id": request.get("id")}))
+        print(f"[连接{conn_id}] 已订阅: {', '.join(sorted(request.get('params', []))) or '全部'}")
+
+        count = 0
+        started = time.perf_counter()
+        try:
+            for gap, message in self._source():
+                if subscribed and message_stream(message) not in subscribed:
+                    continue
+                await self._pace(gap, started, count)
+                await websocket.send(json.dumps(message))
+                count += 1
+                self.sent += 1
+                if self.args.disconnect_after and count >= self.args.disconnect_after:
+                    print(f"[连接{conn_id}] 已推送{count}条，主动断开")
+                    await websocket.close(code=1001, reason="replay disconnect")
+                    return
+        except websockets.ConnectionClosed:
+            pass
+        elapsed = time.perf_counter() - started
+        print(f"[连接{conn_id}] 结束: 推送{count}条, 耗时{elapsed:.1f}秒, {count / max(elapsed, 1e-9):.0f}条/秒")
+
+    async def serve(self) -> None:
+        async with websockets.serve(self.handler, self.args.host, self.args.port,
+                                    process_request=self.process_request, max_size=2 ** 22):
+            print(f"回放服务器已启动: ws://{self.args.host}:{self.args.port}/ws")
+            await asyncio.Future()
+
+
+async def record(args) -> None:
+    """从真实行情地址录制消息"""
+    symbols = [symbol.lower() for symbol in args.symbols.split(",")]
+    streams = [f"{symbol}@{kind}" for symbol in symbols for kind in ("kline_1m", "aggTrade", "ticker", "depth@100ms")]
+    count = 0
+    deadline = time.time() + args.duration
+    async with websockets.connect(args.url) as websocket:
+        await websocket.send(json.dumps({"method": "SUBSCRIBE", "params": streams, "id": 1}))
+        with open(args.output, "w", encoding="utf-8") as f:
+            while time.time() < deadline:
+                try:
+                    raw = await asyncio.wait_for(websocket.recv(), deadline - time.time())
+                except asyncio.TimeoutError:
+                    break
+                message = json.loads(raw)
+                if "result" in message and "id" in message:
+                    continue
+                f.write(json.dumps({"t": time.time(), "msg": message}) + "\n")
+                count += 1
+    print(f"录制完成: {count}条消息 -> {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地WebSocket行情回放服务器")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="启动回放服务器")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    serve_parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    serve_parser.add_argument("--file", help="录制文件（JSON Lines），不指定时生成模拟数据")
+    serve_parser.add_argument("--symbols", default="BTCUSDT,ETHUSDT", help="模拟数据的交易对，逗号分隔")
+    serve_parser.add_argument("--rate", type=float, default=100.0, help="每个连接每秒推送条数，0表示按录制节奏")
+    serve_parser.add_argument("--speed", type=float, default=1.0, help="按录制节奏回放时的倍速，0表示不等待")
+    serve_parser.add_argument("--loop", action="store_true", help="录制文件循环回放")
+    serve_parser.add_argument("--disconnect-after", type=int, default=0, help="每个连接推送多少条后主动断开，0表示不断开")
+
+    record_parser = subparsers.add_parser("record", help="录制真实行情")
+    record_parser.add_argument("--url", default="wss://stream.binance.com:9443/ws", help="行情地址")
+    record_parser.add_argument("--symbols", default="BTCUSDT", help="交易对，逗号分隔")
+    record_parser.add_argument("--duration", type=float, default=60.0, help="录制时长（秒）")
+    record_parser.add_argument("--output", default="messages.jsonl", help="输出文件")
+
+    args = parser.parse_args()
+    try:
+        if args.command == "record":
+            asyncio.run(record(args))
+        elif args.command == "serve":
+            asyncio.run(ReplayServer(args).serve())
+        else:
+            parser.print_help()
+    except KeyboardInterrupt:
+        print("\n回放服务器已停止")
+
+
+if __name__ == "__main__":
+    main()